@@ -0,0 +1,217 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+"""
+Benchmark problems shared by every consumer in the process.
+
+Each benchmark jsonl file is converted once to an uncompressed Feather file
+under `{benchmark_path}/.index_cache` (keyed by the file digest) and then
+memory-mapped, so processes share the pages instead of re-parsing the
+jsonl. Rows are looked up by task_id through a dict index, and columns are
+exposed as Arrow views.
+
+    registry = get_benchmark_registry()
+    registry.lookup("human", "prob001", "canonical_solution")
+    registry.table("machine", source="descriptions").column("detail_description")
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+from LLMInstruct.utils import read_jsonl
+
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_PATH = "./dataset/benchmark"
+BENCHMARKS = ("human", "machine", "rtllm")
+# benchmark files by source: problems with descriptions and solutions, the
+# descriptions used as prompts, and the problems with testbenches for evaluation
+BENCHMARK_SOURCES = {
+    "problems": {
+        "human": "verilogeval-manual.jsonl.gz",
+        "machine": "verilogeval-machine.jsonl.gz",
+        "rtllm": "rtllm.jsonl",
+    },
+    "descriptions": {
+        "human": "VerilogDescription_Human.jsonl",
+        "machine": "VerilogDescription_Machine.jsonl",
+        "rtllm": "rtllm.jsonl",
+    },
+    "evaluation": {
+        "human": "VerilogEval_Human.jsonl",
+        "machine": "VerilogEval_Machine.jsonl",
+        "rtllm": "rtllm.jsonl",
+    },
+}
+# bump when the cached table layout changes
+TABLE_VERSION = 1
+
+
+class BenchmarkTable:
+    """
+    One benchmark file as a memory-mapped Arrow table with a task_id index.
+    """
+
+    def __init__(self, table: pa.Table, path: str = ""):
+        self.table = table
+        self.path = path
+        task_ids = table.column("task_id").to_pylist() if "task_id" in table.column_names else []
+        self.index = {task_id: i for i, task_id in enumerate(task_ids)}
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __contains__(self, task_id: str):
+        return task_id in self.index
+
+    @property
+    def columns(self) -> List[str]:
+        return self.table.column_names
+
+    def column(self, name: str) -> pa.ChunkedArray:
+        # zero-copy view over the mapped file
+        return self.table.column(name)
+
+    def get(self, task_id: str, column: str):
+        return self.table.column(column)[self.index[task_id]].as_py()
+
+    def row(self, task_id: str) -> Dict:
+        return self.table.slice(self.index[task_id], 1).to_pylist()[0]
+
+    def rows(self) -> List[Dict]:
+        return self.table.to_pylist()
+
+    def to_dict(self) -> Dict[str, Dict]:
+        """{task_id: row}, the layout of `read_problems`."""
+        return {row["task_id"]: row for row in self.rows()}
+
+    def texts(self, columns: Sequence[str]) -> List[List[str]]:
+        """
+        Values of `columns` for the rows that have all of them, one list per
+        column. A column missing from the file drops every row.
+        """
+        if any(c not in self.columns for c in columns):
+            return [[] for _ in columns]
+        table = self.table
+        for c in columns:
+            table = table.filter(pc.is_valid(table.column(c)))
+        return [table.column(c).to_pylist() for c in columns]
+
+
+def file_digest(filename: str) -> str:
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _cache_path(filename: str, cache_dir: str) -> str:
+    digest = hashlib.sha256(f"{TABLE_VERSION}:{file_digest(filename)}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(filename)}.{digest}.feather")
+
+
+def _read_table(filename: str, cache_dir: Optional[str]) -> pa.Table:
+    if cache_dir is None:
+        return pa.Table.from_pylist(list(read_jsonl(filename)))
+    path = _cache_path(filename, cache_dir)
+    if not os.path.exists(path):
+        table = pa.Table.from_pylist(list(read_jsonl(filename)))
+        os.makedirs(cache_dir, exist_ok=True)
+        # write then rename so concurrent loaders never map a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        logger.info(f"Cached benchmark table {path} ({table.num_rows} rows)")
+    return feather.read_table(path, memory_map=True)
+
+
+_TABLES: Dict[Tuple, BenchmarkTable] = {}
+_LOCK = threading.Lock()
+
+
+def load_benchmark_file(filename: str, cache_dir: Optional[str] = None) -> BenchmarkTable:
+    """
+    Table of a benchmark jsonl file, loaded once per process and reloaded
+    only when the file changes. `cache_dir` defaults to `.index_cache` next
+    to the file.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filename), ".index_cache")
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    with _LOCK:
+        if key not in _TABLES:
+            try:
+                table = _read_table(filename, cache_dir)
+            except OSError:
+                logger.exception(f"Failed to cache benchmark table of {filename}, reading it directly")
+                table = _read_table(filename, None)
+            _TABLES[key] = BenchmarkTable(table, filename)
+        return _TABLES[key]
+
+
+class BenchmarkRegistry:
+    """
+    All benchmarks under `benchmark_path`, by benchmark name and source
+    (see BENCHMARK_SOURCES). Tables are loaded on first access.
+    """
+
+    def __init__(self, benchmark_path: str = BENCHMARK_PATH, cache_dir: Optional[str] = None):
+        self.benchmark_path = benchmark_path
+        self.cache_dir = cache_dir
+        self._tables: Dict[Tuple[str, str], BenchmarkTable] = {}
+
+    def path(self, benchmark: str, source: str = "problems") -> str:
+        if source not in BENCHMARK_SOURCES or benchmark not in BENCHMARK_SOURCES[source]:
+            raise Exception(f"Not support benchmark {benchmark} ({source})")
+        return os.path.join(self.benchmark_path, BENCHMARK_SOURCES[source][benchmark])
+
+    def table(self, benchmark: str, source: str = "problems") -> BenchmarkTable:
+        # kept per registry, so lookups do not stat the file every time
+        if (benchmark, source) not in self._tables:
+            self._tables[benchmark, source] = load_benchmark_file(self.path(benchmark, source), self.cache_dir)
+        return self._tables[benchmark, source]
+
+    def get(self, benchmark: str, task_id: str, source: str = "problems") -> Dict:
+        return self.table(benchmark, source).row(task_id)
+
+    def lookup(self, benchmark: str, task_id: str, column: str, source: str = "problems"):
+        return self.table(benchmark, source).get(task_id, column)
+
+    def problems(self, benchmark: str, source: str = "evaluation") -> Dict[str, Dict]:
+        return self.table(benchmark, source).to_dict()
+
+    def column(self, column: str, benchmarks: Sequence[str] = BENCHMARKS, source: str = "problems") -> Dict[str, pa.ChunkedArray]:
+        return {benchmark: self.table(benchmark, source).column(column) for benchmark in benchmarks}
+
+    def texts(self, columns: Sequence[str], benchmarks: Sequence[str] = BENCHMARKS, source: str = "problems") -> List[str]:
+        return benchmark_texts([self.path(b, source) for b in benchmarks], columns, self.cache_dir)
+
+
+def benchmark_texts(files: Sequence[str], columns: Sequence[str], cache_dir: Optional[str] = None) -> List[str]:
+    """
+    Column values of all benchmark rows, column by column. Only rows missing
+    one of the requested columns are skipped (a frame-wide dropna over the
+    concatenated benchmarks drops every row, as their columns differ).
+    """
+    per_file = [load_benchmark_file(f, cache_dir).texts(columns) for f in files]
+    return [text for i in range(len(columns)) for values in per_file for text in values[i]]
+
+
+_REGISTRIES: Dict[Tuple, BenchmarkRegistry] = {}
+
+
+def get_benchmark_registry(benchmark_path: str = BENCHMARK_PATH, cache_dir: Optional[str] = None) -> BenchmarkRegistry:
+    key = (os.path.abspath(benchmark_path), cache_dir)
+    with _LOCK:
+        if key not in _REGISTRIES:
+            _REGISTRIES[key] = BenchmarkRegistry(benchmark_path, cache_dir)
+        return _REGISTRIES[key]
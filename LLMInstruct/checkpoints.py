@@ -0,0 +1,231 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+"""
+Benchmark results of training checkpoints, laid out as
+
+    {exp_path}/{exp}/{checkpoint with step=N}/{result file}
+
+Result files are found with one glob and loaded into Arrow tables in a
+process pool, one file per task, with the completions post-processed in
+the same worker. `CheckpointCache` keeps the loaded tables on disk so
+that only new or changed result files are read again.
+"""
+
+import os
+import re
+import json
+import glob
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+import pyarrow.feather as feather
+
+from LLMInstruct.utils import read_jsonl, post_process_completion
+
+
+logger = logging.getLogger(__name__)
+
+RESULT_FILES = {
+    "human": "VerilogEval_Human_0_1.jsonl_results.jsonl",
+    "machine": "VerilogEval_Machine_0_1.jsonl_results.jsonl",
+    "rtllm": "rtllm_0_1.jsonl_results.jsonl",
+}
+_STEP = re.compile(r"step=(\d+)")
+
+
+class ResultFile(NamedTuple):
+    path: str
+    exp: str
+    step: int
+    benchmark: str
+
+
+def scan_checkpoints(exp_path: str) -> List[ResultFile]:
+    """Result files of every experiment/checkpoint, ordered by exp, step and benchmark."""
+    files = []
+    for benchmark, name in RESULT_FILES.items():
+        for path in glob.glob(os.path.join(glob.escape(exp_path), "*", "*", name)):
+            ckpt_dir = os.path.dirname(path)
+            match = _STEP.search(os.path.basename(ckpt_dir))
+            if match is None:
+                continue
+            files.append(ResultFile(path, os.path.basename(os.path.dirname(ckpt_dir)), int(match.group(1)), benchmark))
+    order = list(RESULT_FILES)
+    return sorted(files, key=lambda f: (f.exp, f.step, order.index(f.benchmark)))
+
+
+def _completion_hash(completion: str) -> int:
+    return int.from_bytes(hashlib.blake2b(completion.encode("utf8"), digest_size=8).digest(), "little", signed=True)
+
+
+def load_result_file(result: ResultFile, postprocess: bool = True) -> Optional[pa.Table]:
+    try:
+        table = pa_json.read_json(result.path)
+    except pa.ArrowInvalid:
+        # mixed types or malformed lines, fall back to the tolerant reader
+        rows = list(read_jsonl(result.path))
+        if not rows:
+            return None
+        table = pa.Table.from_pylist(rows)
+    if table.num_rows == 0:
+        return None
+    # hash of the raw completion, so duplicates are dropped on what the model generated;
+    # duplicates within the file are dropped here, before paying for post-processing
+    hashes = [_completion_hash(c or "") for c in table.column("completion").to_pylist()]
+    seen = set()
+    keep = [not (key in seen or seen.add(key)) for key in zip(table.column("task_id").to_pylist(), hashes)]
+    table = table.filter(pa.array(keep)).append_column("raw_hash", pa.array([h for h, k in zip(hashes, keep) if k], pa.int64()))
+    completions = table.column("completion").to_pylist()
+    n = table.num_rows
+    if postprocess:
+        rtllm = result.benchmark == "rtllm"
+        processed = [post_process_completion(c, remove_header=True, rtllm=rtllm) for c in completions]
+        table = table.set_column(table.schema.get_field_index("completion"), "completion", pa.array(processed, pa.string()))
+    table = table.append_column("step", pa.array([result.step] * n, pa.int64()))
+    table = table.append_column("benchmark", pa.array([result.benchmark] * n, pa.string()))
+    table = table.append_column("exp", pa.array([result.exp] * n, pa.string()))
+    return table
+
+
+def _load_tables(files: List[ResultFile], workers: int = 1, postprocess: bool = True) -> List[Optional[pa.Table]]:
+    if workers <= 1 or len(files) <= 1:
+        return [load_result_file(f, postprocess) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(load_result_file, files, [postprocess] * len(files)))
+
+
+def load_result_files(files: List[ResultFile], workers: int = 1, postprocess: bool = True) -> Optional[pa.Table]:
+    tables = [t for t in _load_tables(files, workers, postprocess) if t is not None]
+    if not tables:
+        return None
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def _to_dataframe(table: Optional[pa.Table], exp_path: str) -> pd.DataFrame:
+    if table is None:
+        raise Exception(f"No checkpoint results under {exp_path}.")
+    df = table.to_pandas()
+    df = df.drop_duplicates(subset=["task_id", "raw_hash"]).drop(columns=["raw_hash"])
+    return df.reset_index(drop=True)
+
+
+def read_checkpoints(exp_path: str, workers: int = os.cpu_count() or 1) -> pd.DataFrame:
+    """
+    All checkpoint results as one DataFrame with `step`, `benchmark` and
+    `exp` columns and post-processed completions. Duplicate raw completions
+    of a task are dropped, keeping the first in (exp, step, benchmark) order.
+    """
+    files = scan_checkpoints(exp_path)
+    logger.info(f"Found {len(files)} result files under {exp_path}")
+    return _to_dataframe(load_result_files(files, workers), exp_path)
+
+
+class CheckpointCache:
+    """
+    On-disk cache of loaded result files, one uncompressed Feather file per
+    result file under `{cache_dir}/exp={exp}/step={step}/{benchmark}.feather`.
+
+    `manifest.json` records the mtime and size of every source file. On
+    `read`, only result files that are new or changed since the last run
+    are loaded; partitions of removed files are deleted. Partitions are
+    memory-mapped on load, and duplicates across files are dropped after
+    loading so newly landed checkpoints keep the same keep-first order.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+
+    def partition(self, result: ResultFile) -> str:
+        return os.path.join(self.cache_dir, f"exp={result.exp}", f"step={result.step}", f"{result.benchmark}.feather")
+
+    def load_manifest(self, exp_path: str) -> dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == self.VERSION and manifest.get("exp_path") == os.path.abspath(exp_path):
+                return manifest["files"]
+            logger.info(f"Checkpoint cache {self.cache_dir} was built for another layout, rebuilding")
+            shutil.rmtree(self.cache_dir)
+        return {}
+
+    def save_manifest(self, exp_path: str, files: dict):
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(version=self.VERSION, exp_path=os.path.abspath(exp_path), files=files), f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def write_partition(self, result: ResultFile, table: Optional[pa.Table]):
+        path = self.partition(result)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if table is None:
+            # empty result file, nothing to load from it
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp = f"{path}.tmp"
+        feather.write_feather(table, tmp, compression="uncompressed")
+        os.replace(tmp, path)
+
+    def sync(self, exp_path: str, workers: int = 1) -> List[ResultFile]:
+        """Ingest new or changed result files. Returns all result files in order."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = self.load_manifest(exp_path)
+        files = scan_checkpoints(exp_path)
+
+        current, changed = {}, []
+        for result in files:
+            key = os.path.relpath(result.path, exp_path)
+            stat = os.stat(result.path)
+            current[key] = dict(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            if manifest.get(key) != current[key] or not os.path.exists(self.partition(result)):
+                changed.append(result)
+
+        removed = manifest.keys() - current.keys()
+        for key in removed:
+            stale = ResultFile(os.path.join(exp_path, key), *self._parse_key(key))
+            if os.path.exists(self.partition(stale)):
+                os.remove(self.partition(stale))
+                try:
+                    os.removedirs(os.path.dirname(self.partition(stale)))
+                except OSError:
+                    # the step or exp directory still holds other partitions
+                    pass
+        logger.info(
+            f"Checkpoint cache {self.cache_dir}: {len(files)} result files, "
+            f"{len(changed)} to ingest, {len(removed)} removed"
+        )
+
+        for result, table in zip(changed, _load_tables(changed, workers)):
+            self.write_partition(result, table)
+        self.save_manifest(exp_path, current)
+        return files
+
+    @staticmethod
+    def _parse_key(key: str):
+        exp, ckpt, name = key.split(os.sep)[-3:]
+        benchmark = {v: k for k, v in RESULT_FILES.items()}[name]
+        return exp, int(_STEP.search(ckpt).group(1)), benchmark
+
+    def read(self, exp_path: str, workers: int = 1) -> pd.DataFrame:
+        """Same DataFrame as `read_checkpoints`, loaded through the cache."""
+        files = self.sync(exp_path, workers)
+        tables = [
+            feather.read_table(self.partition(result), memory_map=True)
+            for result in files
+            if os.path.exists(self.partition(result))
+        ]
+        if not tables:
+            return _to_dataframe(None, exp_path)
+        return _to_dataframe(pa.concat_tables(tables, promote_options="permissive"), exp_path)
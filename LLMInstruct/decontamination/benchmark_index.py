@@ -0,0 +1,134 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+import pickle
+import logging
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from datasketch import MinHash, MinHashLSH
+
+from LLMInstruct.utils import compute_fingerprint
+from LLMInstruct.benchmarks import benchmark_texts, file_digest
+from LLMInstruct.decontamination.similarity_filter import minhash_batch
+
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_FILES = (
+    "./dataset/benchmark/verilogeval-manual.jsonl.gz",
+    "./dataset/benchmark/verilogeval-machine.jsonl.gz",
+    "./dataset/benchmark/rtllm.jsonl",
+)
+DEFAULT_COLUMNS = ("detail_description", "canonical_solution")
+CACHE_DIR = "./dataset/benchmark/.index_cache"
+# bump when the signature or index layout changes
+INDEX_VERSION = 1
+
+
+class BenchmarkIndex:
+    """
+    Read-only MinHash LSH over benchmark columns, built once and persisted
+    with a fingerprint of the benchmark files and parameters.
+    """
+
+    def __init__(self, lsh: MinHashLSH, fingerprint: str, size: int, num_perm: int):
+        self.lsh = lsh
+        self.fingerprint = fingerprint
+        self.size = size
+        self.num_perm = num_perm
+
+    def query(self, m: MinHash) -> List[str]:
+        return self.lsh.query(m)
+
+    @classmethod
+    def build(
+        cls,
+        files: Sequence[str] = BENCHMARK_FILES,
+        columns: Sequence[str] = DEFAULT_COLUMNS,
+        num_perm: int = 128,
+        threshold: float = 0.7,
+        workers: int = 1,
+    ) -> "BenchmarkIndex":
+        texts = benchmark_texts(files, columns)
+        lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+        with lsh.insertion_session() as session:
+            for e, m in enumerate(minhash_batch(texts, num_perm=num_perm, workers=workers)):
+                session.insert(str(e), m, check_duplication=False)
+        return cls(lsh, index_fingerprint(files, columns, num_perm, threshold), len(texts), num_perm)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # write then rename so concurrent loaders never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BenchmarkIndex":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def index_fingerprint(files: Sequence[str], columns: Sequence[str], num_perm: int, threshold: float) -> str:
+    return compute_fingerprint(
+        INDEX_VERSION,
+        *[file_digest(f) for f in files],
+        *columns,
+        num_perm,
+        threshold,
+        hash_length=16,
+    )
+
+
+_INDEXES: Dict[Tuple, BenchmarkIndex] = {}
+_LOCK = threading.Lock()
+
+
+def load_benchmark_index(
+    columns: Sequence[str] = DEFAULT_COLUMNS,
+    files: Sequence[str] = BENCHMARK_FILES,
+    num_perm: int = 128,
+    threshold: float = 0.7,
+    cache_dir: str = CACHE_DIR,
+) -> BenchmarkIndex:
+    """
+    Index for the given benchmark columns, shared by every task in the
+    process. Loaded from `cache_dir` when the fingerprint matches, otherwise
+    built and persisted for the next process.
+    """
+    stats = tuple((os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in files)
+    key = (tuple(files), tuple(columns), num_perm, threshold, stats)
+    with _LOCK:
+        if key in _INDEXES:
+            return _INDEXES[key]
+
+        fingerprint = index_fingerprint(files, columns, num_perm, threshold)
+        path = os.path.join(cache_dir, f"benchmark_index.{fingerprint}.pkl")
+        index = None
+        if os.path.exists(path):
+            try:
+                index = BenchmarkIndex.load(path)
+                logger.info(f"Loaded benchmark index {path} ({index.size} entries)")
+            except Exception:
+                logger.exception(f"Failed to load benchmark index {path}, rebuilding")
+        if index is None:
+            index = BenchmarkIndex.build(files, columns, num_perm, threshold)
+            try:
+                index.save(path)
+                logger.info(f"Saved benchmark index {path} ({index.size} entries)")
+            except OSError:
+                logger.exception(f"Failed to save benchmark index {path}")
+        _INDEXES[key] = index
+        return index
+
+
+if __name__ == "__main__":
+    # prebuild the indexes used by the tasks
+    for columns in [("detail_description", "canonical_solution"), ("detail_description",)]:
+        index = load_benchmark_index(columns)
+        print(f"{columns}: {index.size} entries, fingerprint {index.fingerprint}")
@@ -0,0 +1,74 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+"""
+Compare the per-ngram MinHash loop JaccardFilter used before with the
+batched signature engine, on the benchmark descriptions/solutions and the
+Stack sample.
+
+    python LLMInstruct/decontamination/benchmark_minhash.py --workers 8
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+from datasketch import MinHash
+from nltk import ngrams
+
+from LLMInstruct.utils import read_jsonl
+from LLMInstruct.decontamination.similarity_filter import minhash_batch
+
+
+def legacy_minhash(inst: str, num_perm: int = 128, ngram_size: int = 5):
+    m = MinHash(num_perm=num_perm)
+    for word in ngrams(inst, ngram_size):
+        m.update(" ".join(word).encode("utf8"))
+    return m
+
+
+def load_documents(benchmark_path: str, stack_file: str):
+    docs = {}
+    benchmark = []
+    for name in ["verilogeval-manual.jsonl.gz", "verilogeval-machine.jsonl.gz", "rtllm.jsonl"]:
+        for row in read_jsonl(os.path.join(benchmark_path, name)):
+            benchmark += [row.get("detail_description") or "", row.get("canonical_solution") or ""]
+    docs["benchmark"] = benchmark
+    if os.path.exists(stack_file):
+        docs["stack"] = [row["input"] for row in read_jsonl(stack_file)]
+    return docs
+
+
+def bench(name: str, func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {name:<24} {elapsed:8.3f}s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmark_path", type=str, default="./dataset/benchmark")
+    parser.add_argument("--stack_file", type=str, default="./dataset/the_stack_v2_cleaned.sample.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=int, default=1, help="replicate documents to emulate a larger corpus")
+    args = parser.parse_args()
+
+    for name, docs in load_documents(args.benchmark_path, args.stack_file).items():
+        docs = docs * args.scale
+        print(f"{name}: {len(docs)} documents, {sum(len(d) for d in docs)} characters")
+        legacy, t_legacy = bench("legacy loop", lambda: [legacy_minhash(d) for d in docs], args.repeat)
+        batch, t_batch = bench("batched", lambda: minhash_batch(docs), args.repeat)
+        pool, t_pool = bench(f"batched x{args.workers}", lambda: minhash_batch(docs, workers=args.workers), args.repeat)
+        assert all(np.array_equal(a.hashvalues, b.hashvalues) for a, b in zip(legacy, batch))
+        assert all(np.array_equal(a.hashvalues, b.hashvalues) for a, b in zip(legacy, pool))
+        print(f"  speedup batched {t_legacy / t_batch:.1f}x, pooled {t_legacy / t_pool:.1f}x (signatures identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+import atexit
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from datasketch import MinHash
+from datasketch.lsh import _optimal_param
+
+
+def doc_id(text: str) -> int:
+    """
+    Stable signed 64-bit id of a document. Unlike `hash(text)` it does not
+    change between processes, so ids can be shared through a store.
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf8"), digest_size=8).digest(), "little", signed=True)
+
+
+def band_hashes(m: MinHash, b: int, r: int) -> List[int]:
+    # signed 64-bit hash of each LSH band, the banding MinHashLSH uses
+    hashvalues = m.hashvalues
+    return [
+        int.from_bytes(
+            hashlib.blake2b(hashvalues[i * r:(i + 1) * r].tobytes(), digest_size=8).digest(),
+            "little",
+            signed=True,
+        )
+        for i in range(b)
+    ]
+
+
+class _SQLite:
+    # sqlite3 connections must not be shared between threads, keep one per thread
+
+    def __init__(self, path: str, timeout: float = 60):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class DocumentStore(_SQLite):
+    """
+    Document texts by id on disk, for the exact Jaccard re-check of LSH
+    candidates. Only candidate texts are ever loaded.
+    """
+
+    def __init__(self, path: str, timeout: float = 60):
+        super().__init__(path, timeout)
+        self._connect().execute("CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+
+    def put_many(self, items: Iterable[Tuple[int, str]]):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO documents (id, text) VALUES (?, ?)", items)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, key: int, text: str):
+        self.put_many([(key, text)])
+
+    def get_many(self, keys: Sequence[int]) -> Dict[int, str]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        return dict(self._connect().execute(f"SELECT id, text FROM documents WHERE id IN ({placeholders})", keys))
+
+
+class DigestSet:
+    """
+    Exact and normalized text digests of accepted documents, kept next to a
+    store so every filter sharing the store shares them (see TieredFilter).
+    """
+
+    def __init__(self):
+        self.exact = set()
+        self.normalized = set()
+        self.lock = threading.Lock()
+
+    def hit(self, exact: int, normalized: int) -> Optional[str]:
+        with self.lock:
+            if exact in self.exact:
+                return "exact"
+            if normalized in self.normalized:
+                return "normalized"
+            return None
+
+    def claim(self, exact: int, normalized: int) -> bool:
+        # add both digests unless either is taken; False -> taken
+        with self.lock:
+            if exact in self.exact or normalized in self.normalized:
+                return False
+            self.exact.add(exact)
+            self.normalized.add(normalized)
+            return True
+
+    def add(self, exact: int, normalized: int):
+        with self.lock:
+            self.exact.add(exact)
+            self.normalized.add(normalized)
+
+
+class DedupStore(ABC):
+    """
+    Near-duplicate store keyed by MinHash and 64-bit document ids.
+    `check_and_add` is atomic, so concurrent workers never both accept the
+    same near-duplicate. `documents` optionally keeps the texts for an exact
+    re-check of LSH candidates, `digests` the cheap-tier digests of the
+    accepted texts (per process).
+    """
+
+    documents: Optional[DocumentStore] = None
+    digests: Optional[DigestSet] = None
+
+    @abstractmethod
+    def query(self, m: MinHash) -> List[int]:
+        pass
+
+    @abstractmethod
+    def insert(self, key: int, m: MinHash):
+        pass
+
+    @abstractmethod
+    def check_and_add(self, key: int, m: MinHash, is_duplicate: Callable[[List[int]], bool] = bool) -> bool:
+        # True -> new, inserted; False -> `is_duplicate(candidates)` held for the LSH candidates
+        pass
+
+    def insert_many(self, items: Iterable[Tuple[int, MinHash]]):
+        for key, m in items:
+            self.insert(key, m)
+
+
+class BandTable:
+    """
+    Band hash -> document ids of one LSH band, 16 bytes per entry: a sorted
+    int64 run plus a small dict of recent inserts that is merged into the
+    run once it grows. With `spill_prefix` the run is kept in memory-mapped
+    .npy files instead of RAM.
+    """
+
+    def __init__(self, spill_prefix: str = None, min_flush: int = 1 << 16):
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.pending: Dict[int, List[int]] = {}
+        self.num_pending = 0
+        self.spill_prefix = spill_prefix
+        self.min_flush = min_flush
+        self._generation = 0
+
+    def __len__(self):
+        return len(self.hashes) + self.num_pending
+
+    def query(self, h: int) -> List[int]:
+        lo = np.searchsorted(self.hashes, h, "left")
+        hi = np.searchsorted(self.hashes, h, "right")
+        return self.ids[lo:hi].tolist() + self.pending.get(h, [])
+
+    def add(self, h: int, key: int):
+        self.pending.setdefault(h, []).append(key)
+        self.num_pending += 1
+        if self.num_pending >= max(self.min_flush, len(self.hashes) // 16):
+            self.flush()
+
+    def add_many(self, hashes: np.ndarray, ids: np.ndarray):
+        self.flush()
+        self._merge(hashes, ids)
+
+    def flush(self):
+        if not self.pending:
+            return
+        hashes = np.fromiter((h for h, keys in self.pending.items() for _ in keys), np.int64, self.num_pending)
+        ids = np.fromiter((k for keys in self.pending.values() for k in keys), np.int64, self.num_pending)
+        self._merge(hashes, ids)
+        self.pending = {}
+        self.num_pending = 0
+
+    def _merge(self, hashes: np.ndarray, ids: np.ndarray):
+        order = np.argsort(hashes, kind="stable")
+        hashes, ids = hashes[order], ids[order]
+        # linear insert of the sorted batch into the sorted run
+        position = np.searchsorted(self.hashes, hashes, "right")
+        merged_hashes = np.insert(self.hashes, position, hashes)
+        merged_ids = np.insert(self.ids, position, ids)
+        if self.spill_prefix is not None:
+            merged_hashes, merged_ids = self._spill(merged_hashes, merged_ids)
+        self.hashes, self.ids = merged_hashes, merged_ids
+
+    def _spill(self, hashes: np.ndarray, ids: np.ndarray):
+        old = self._files(self._generation)
+        self._generation += 1
+        new = self._files(self._generation)
+        np.save(new[0], hashes)
+        np.save(new[1], ids)
+        # mapped files stay readable after unlink until the old arrays are dropped
+        self.remove(old)
+        return np.load(new[0], mmap_mode="r"), np.load(new[1], mmap_mode="r")
+
+    def _files(self, generation: int) -> Tuple[str, str]:
+        return f"{self.spill_prefix}.{generation}.hashes.npy", f"{self.spill_prefix}.{generation}.ids.npy"
+
+    @staticmethod
+    def remove(files: Sequence[str]):
+        for filename in files:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def close(self):
+        if self.spill_prefix is not None:
+            self.remove(self._files(self._generation))
+
+
+class MemoryDedupStore(DedupStore):
+    """
+    In-process store shared by all threads. Only band hashes and document
+    ids are kept (b * 16 bytes per document); with `spill_dir` the band
+    tables are memory-mapped from disk.
+    """
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 128, spill_dir: str = None):
+        self.b, self.r = _optimal_param(threshold, num_perm, 0.5, 0.5)
+        self.spill_dir = spill_dir
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            prefixes = [os.path.join(spill_dir, f"band{i}.{os.getpid()}.{id(self)}") for i in range(self.b)]
+        else:
+            prefixes = [None] * self.b
+        self.tables = [BandTable(prefix) for prefix in prefixes]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tables[0])
+
+    def _query(self, hashes: List[int]) -> List[int]:
+        candidates = set()
+        for table, h in zip(self.tables, hashes):
+            candidates.update(table.query(h))
+        return list(candidates)
+
+    def query(self, m: MinHash) -> List[int]:
+        hashes = band_hashes(m, self.b, self.r)
+        with self._lock:
+            return self._query(hashes)
+
+    def insert(self, key: int, m: MinHash):
+        hashes = band_hashes(m, self.b, self.r)
+        with self._lock:
+            for table, h in zip(self.tables, hashes):
+                table.add(h, key)
+
+    def insert_many(self, items: Iterable[Tuple[int, MinHash]]):
+        keys, hashes = [], []
+        for key, m in items:
+            keys.append(key)
+            hashes.append(band_hashes(m, self.b, self.r))
+        if not keys:
+            return
+        keys = np.asarray(keys, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.int64)
+        with self._lock:
+            for i, table in enumerate(self.tables):
+                table.add_many(hashes[:, i], keys)
+
+    def check_and_add(self, key: int, m: MinHash, is_duplicate: Callable[[List[int]], bool] = bool) -> bool:
+        hashes = band_hashes(m, self.b, self.r)
+        with self._lock:
+            if is_duplicate(self._query(hashes)):
+                return False
+            for table, h in zip(self.tables, hashes):
+                table.add(h, key)
+            return True
+
+    def close(self):
+        with self._lock:
+            for table in self.tables:
+                table.close()
+
+
+class SQLiteDedupStore(_SQLite, DedupStore):
+    """
+    Persistent store with one row per (band, band hash, document), using the
+    same banding as MinHashLSH. Several processes can share the file and
+    dedupe against each other's outputs as they are written. On a network
+    filesystem SQLite locking must be reliable for multi-node use.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.7, num_perm: int = 128, timeout: float = 60):
+        super().__init__(path, timeout)
+        self.num_perm = num_perm
+        self.b, self.r = _optimal_param(threshold, num_perm, 0.5, 0.5)
+
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, hash INTEGER NOT NULL, doc_id INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, hash)")
+        params = f"{self.b},{self.r},{num_perm}"
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('params', ?)", (params,))
+        stored = conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()[0]
+        if stored != params:
+            raise Exception(f"{path} was built with (b, r, num_perm) = ({stored}), not ({params}).")
+
+    def _query(self, conn: sqlite3.Connection, hashes: List[int]) -> List[int]:
+        clause = " OR ".join(["(band = ? AND hash = ?)"] * len(hashes))
+        params = [v for band, h in enumerate(hashes) for v in (band, h)]
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT doc_id FROM bands WHERE {clause}", params)]
+
+    def _insert(self, conn: sqlite3.Connection, key: int, hashes: List[int]):
+        conn.executemany(
+            "INSERT INTO bands (band, hash, doc_id) VALUES (?, ?, ?)",
+            [(band, h, key) for band, h in enumerate(hashes)],
+        )
+
+    def query(self, m: MinHash) -> List[int]:
+        return self._query(self._connect(), band_hashes(m, self.b, self.r))
+
+    def insert(self, key: int, m: MinHash):
+        self.insert_many([(key, m)])
+
+    def insert_many(self, items: Iterable[Tuple[int, MinHash]]):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, m in items:
+                self._insert(conn, key, band_hashes(m, self.b, self.r))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def check_and_add(self, key: int, m: MinHash, is_duplicate: Callable[[List[int]], bool] = bool) -> bool:
+        hashes = band_hashes(m, self.b, self.r)
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, making query + insert atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if is_duplicate(self._query(conn, hashes)):
+                conn.execute("COMMIT")
+                return False
+            self._insert(conn, key, hashes)
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+_STORES: Dict[Tuple, DedupStore] = {}
+_LOCK = threading.Lock()
+
+
+def get_dedup_store(
+    name: str = "default",
+    backend: str = "memory",
+    path: str = "",
+    threshold: float = 0.7,
+    num_perm: int = 128,
+    exact: bool = False,
+) -> DedupStore:
+    """
+    Store shared by every caller in the process with the same name and
+    parameters. backend: "memory" (per process, band tables spilled under
+    `path` if given) or "sqlite" (shared through `path`, one database file
+    per name). With `exact`, texts are kept on disk for an exact Jaccard
+    re-check of LSH candidates.
+    """
+    key = (name, backend, path, threshold, num_perm, exact)
+    with _LOCK:
+        if key not in _STORES:
+            if backend == "memory":
+                spill_dir = os.path.join(path, name) if path else None
+                store = MemoryDedupStore(threshold, num_perm, spill_dir)
+                if spill_dir is not None:
+                    atexit.register(store.close)
+                if exact:
+                    documents_path = os.path.join(
+                        spill_dir or tempfile.mkdtemp(prefix="dedup_"), f"documents.{os.getpid()}.sqlite"
+                    )
+            elif backend == "sqlite":
+                if not path:
+                    raise Exception("SQLite dedup store requires a path.")
+                store = SQLiteDedupStore(os.path.join(path, f"{name}.sqlite"), threshold, num_perm)
+                documents_path = os.path.join(path, f"{name}.documents.sqlite")
+            else:
+                raise Exception(f"Not support {backend} dedup store.")
+            if exact:
+                store.documents = DocumentStore(documents_path)
+            store.digests = DigestSet()
+            _STORES[key] = store
+        return _STORES[key]
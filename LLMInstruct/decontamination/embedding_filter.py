@@ -0,0 +1,265 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+import queue
+import logging
+import threading
+import importlib
+from concurrent.futures import Future
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from LLMInstruct.utils import compute_fingerprint
+from LLMInstruct.benchmarks import benchmark_texts, file_digest
+from .base import BaseFilter
+from .benchmark_index import BENCHMARK_FILES, DEFAULT_COLUMNS, CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# bump when the embedding or index layout changes
+INDEX_VERSION = 1
+
+
+class EmbeddingModel:
+    """Sentence-embedding model on CPU returning L2-normalized float32 vectors."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = "cpu", batch_size: int = 64):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+        self._lock = threading.Lock()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        with self._lock:
+            embeddings = self.model.encode(
+                list(texts),
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+class VectorIndex:
+    """
+    Inner-product index over normalized vectors (so scores are cosine
+    similarities), backed by faiss, hnswlib or exact numpy search.
+    """
+
+    def __init__(self, embeddings: np.ndarray, backend: str = "auto", ef: int = 64, m: int = 32):
+        if backend == "auto":
+            backend = next((b for b in ("faiss", "hnswlib") if importlib.util.find_spec(b) is not None), "numpy")
+        self.backend = backend
+        self.embeddings = embeddings
+        self.size, self.dim = embeddings.shape
+
+        if backend == "faiss":
+            import faiss
+
+            self.index = faiss.IndexHNSWFlat(self.dim, m, faiss.METRIC_INNER_PRODUCT)
+            self.index.hnsw.efSearch = ef
+            self.index.add(embeddings)
+        elif backend == "hnswlib":
+            import hnswlib
+
+            self.index = hnswlib.Index(space="ip", dim=self.dim)
+            self.index.init_index(max_elements=max(1, self.size), ef_construction=200, M=m)
+            self.index.add_items(embeddings, np.arange(self.size))
+            self.index.set_ef(ef)
+        elif backend == "numpy":
+            self.index = None
+        else:
+            raise Exception(f"Not support {backend} vector index.")
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, ids) of the k nearest benchmark vectors for every query."""
+        k = min(k, self.size)
+        if self.size == 0:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        if self.backend == "faiss":
+            return self.index.search(queries, k)
+        if self.backend == "hnswlib":
+            ids, distances = self.index.knn_query(queries, k=k)
+            # hnswlib "ip" distance is 1 - inner product
+            return 1 - distances, ids.astype(np.int64)
+        scores = queries @ self.embeddings.T
+        ids = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, ids, axis=1), ids
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp_path, self.embeddings)
+        if self.backend == "faiss":
+            import faiss
+
+            faiss.write_index(self.index, f"{tmp_path}.faiss")
+            os.replace(f"{tmp_path}.faiss", f"{path}.faiss")
+        elif self.backend == "hnswlib":
+            self.index.save_index(f"{tmp_path}.hnsw")
+            os.replace(f"{tmp_path}.hnsw", f"{path}.hnsw")
+        # embeddings last: a loader only looks for the ANN files once they exist
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, backend: str = "auto") -> "VectorIndex":
+        embeddings = np.load(path)
+        if backend in ("auto", "faiss") and os.path.exists(f"{path}.faiss") and importlib.util.find_spec("faiss"):
+            import faiss
+
+            index = cls.__new__(cls)
+            index.backend, index.embeddings = "faiss", embeddings
+            index.size, index.dim = embeddings.shape
+            index.index = faiss.read_index(f"{path}.faiss")
+            return index
+        if backend in ("auto", "hnswlib") and os.path.exists(f"{path}.hnsw") and importlib.util.find_spec("hnswlib"):
+            import hnswlib
+
+            index = cls.__new__(cls)
+            index.backend, index.embeddings = "hnswlib", embeddings
+            index.size, index.dim = embeddings.shape
+            index.index = hnswlib.Index(space="ip", dim=index.dim)
+            index.index.load_index(f"{path}.hnsw", max_elements=max(1, index.size))
+            return index
+        return cls(embeddings, backend)
+
+
+class EmbeddingFilter(BaseFilter):
+    """
+    Semantic decontamination: rejects samples whose embedding is within
+    `threshold` cosine similarity of a benchmark description or solution,
+    which catches paraphrases character n-gram MinHash misses.
+
+    Concurrent `validate` calls from worker threads are coalesced into one
+    batched encode (up to `batch_size` texts or `max_wait` seconds).
+    """
+
+    def __init__(
+        self,
+        model: EmbeddingModel,
+        index: VectorIndex,
+        texts: List[str],
+        threshold: float = 0.85,
+        batch_size: int = 64,
+        max_wait: float = 0.01,
+    ):
+        self.model = model
+        self.index = index
+        self.texts = texts
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.checked = 0
+        self.rejected = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def nearest(self, insts: Sequence[str]) -> List[Tuple[float, str]]:
+        """(cosine similarity, benchmark text) of the closest benchmark entry for each input."""
+        if not insts:
+            return []
+        scores, ids = self.index.search(self.model.encode(insts), k=1)
+        return [
+            (float(s[0]), self.texts[int(i[0])]) if len(s) else (0.0, "")
+            for s, i in zip(scores, ids)
+        ]
+
+    def validate_batch(self, insts: Sequence[str]) -> List[bool]:
+        valid = [score < self.threshold for score, _ in self.nearest(insts)]
+        with self._lock:
+            self.checked += len(valid)
+            self.rejected += valid.count(False)
+        return valid
+
+    def validate(self, inst: str) -> bool:
+        future = Future()
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._batch_loop, daemon=True)
+                self._worker.start()
+        self._queue.put((inst, future))
+        return future.result()
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            try:
+                for (_, future), valid in zip(batch, self.validate_batch([inst for inst, _ in batch])):
+                    future.set_result(valid)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def summary(self) -> str:
+        return f"EmbeddingFilter: {self.rejected}/{self.checked} rejected (cosine >= {self.threshold})"
+
+
+def embedding_fingerprint(files: Sequence[str], columns: Sequence[str], model_name: str) -> str:
+    return compute_fingerprint(
+        INDEX_VERSION,
+        *[file_digest(f) for f in files],
+        *columns,
+        model_name,
+        hash_length=16,
+    )
+
+
+_FILTERS: Dict[Tuple, EmbeddingFilter] = {}
+_LOCK = threading.Lock()
+
+
+def load_embedding_filter(
+    model_name: str = DEFAULT_MODEL,
+    threshold: float = 0.85,
+    columns: Sequence[str] = DEFAULT_COLUMNS,
+    files: Sequence[str] = BENCHMARK_FILES,
+    backend: str = "auto",
+    batch_size: int = 64,
+    cache_dir: str = CACHE_DIR,
+) -> EmbeddingFilter:
+    """
+    Filter shared by every task in the process. Benchmark embeddings are
+    loaded from `cache_dir` when the fingerprint (benchmark files, columns,
+    model) matches, otherwise computed and persisted for the next process.
+    """
+    key = (model_name, threshold, tuple(columns), tuple(files), backend, batch_size)
+    with _LOCK:
+        if key in _FILTERS:
+            return _FILTERS[key]
+
+        model = EmbeddingModel(model_name, batch_size=batch_size)
+        texts = benchmark_texts(files, columns)
+        fingerprint = embedding_fingerprint(files, columns, model_name)
+        path = os.path.join(cache_dir, f"benchmark_embedding.{fingerprint}.npy")
+        index = None
+        if os.path.exists(path):
+            try:
+                index = VectorIndex.load(path, backend)
+                logger.info(f"Loaded benchmark embeddings {path} ({index.size} entries, {index.backend})")
+            except Exception:
+                logger.exception(f"Failed to load benchmark embeddings {path}, rebuilding")
+        if index is None:
+            index = VectorIndex(model.encode(texts), backend)
+            try:
+                index.save(path)
+                logger.info(f"Saved benchmark embeddings {path} ({index.size} entries, {index.backend})")
+            except OSError:
+                logger.exception(f"Failed to save benchmark embeddings {path}")
+
+        _FILTERS[key] = EmbeddingFilter(model, index, texts, threshold, batch_size)
+        return _FILTERS[key]
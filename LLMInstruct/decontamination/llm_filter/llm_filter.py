@@ -3,7 +3,14 @@
 # This work is made available
 # under the Nvidia Source Code License (1-way Commercial).
 
-from typing import Optional
+import os
+import re
+import json
+import queue
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from langchain.chains.openai_functions import (
     create_openai_fn_chain,
     create_structured_output_chain,
@@ -27,16 +34,91 @@ Now check the following:
 </SOLUTION>
 """
 
+LLM_FILTER_BATCH_PROMPT = """Check if each of the following Verilog modules is a valid solution to its problem. For every item
+the output should be in “True” or “False” and be enclosed within <VALID id=N> </VALID> tags and a short explanation
+in <REASON id=N></REASON> tags, where N is the id of the item. Judge every item independently.
+Now check the following:
+{items}
+"""
+
+LLM_FILTER_BATCH_ITEM = """<ITEM id={id}>
+<PROBLEM>
+{problem}
+</PROBLEM>
+<SOLUTION>
+{solution}
+</SOLUTION>
+</ITEM>
+"""
+
+# output budget per item of a batch request, verdicts come with a short reason
+BATCH_ITEM_TOKENS = 1024
+
+_TAGGED = {
+    tag: re.compile(rf"<{tag}\s+id\s*=\s*[\"']?(\d+)[\"']?\s*>(.*?)</{tag}\s*>", re.DOTALL | re.IGNORECASE)
+    for tag in ("VALID", "REASON")
+}
+
+
+def parse_tagged(text: str, tag: str) -> Dict[int, str]:
+    """Values of <TAG id=N>...</TAG> by id; the first occurrence of an id wins."""
+    values = {}
+    for match in _TAGGED[tag].finditer(text):
+        values.setdefault(int(match.group(1)), match.group(2).strip())
+    return values
+
+
+def normalize_verdict(value: Optional[str]) -> Optional[str]:
+    # "True", “True”, 'true.' -> "True"
+    if value is None:
+        return None
+    value = value.strip().strip("\"'“”‘’.").strip()
+    return value.capitalize() if value.lower() in ("true", "false") else value
+
+
+def verdict_key(problem: str, solution: str) -> str:
+    return hashlib.sha256(f"{problem}\0{solution}".encode("utf8")).hexdigest()
+
 
 class LLMFilter(BaseFilter):
+    """
+    LLM judge of (problem, solution) pairs. Verdicts are cached by the hash
+    of the pair (and appended to `cache_path` if set). With `batch_size` > 1
+    concurrent `validate` calls are packed into one request of up to
+    `batch_size` items with per-item <VALID id=N> tags; items whose verdict
+    cannot be parsed fall back to a single-item request.
+    """
 
     def __init__(
         self,
         args,
+        batch_size: int = 1,
+        max_wait: float = 0.5,
+        max_concurrency: int = 4,
+        cache_path: str = "",
     ):
         self.prompt_template = LLM_FILTER_PROMPT
+        self.batch_prompt_template = LLM_FILTER_BATCH_PROMPT
         self.args = args
-        
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self.cache_path = cache_path
+        self.cache: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.stats = dict(items=0, cache_hits=0, requests=0, batch_requests=0, fallbacks=0, tokens=0)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._collector = None
+        self._executor = None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.cache[row["key"]] = (row["valid"], row["reason"])
+
     def parse(self, text: str, tag: str):
         head = f"<{tag}>"
         tail = f"</{tag}>"
@@ -45,30 +127,154 @@ class LLMFilter(BaseFilter):
             ed = text.find(tail)
             return text[st+len(head): ed].strip()
 
-    def validate(self, input_dict: dict, tag: str, target: str) -> bool:
-
-        # construct chat message and call
+    def request(self, content: str, max_tokens: int = 4096, partial: bool = False) -> Optional[str]:
+        # construct chat message and call; with `partial` a truncated output is returned as well
         messages = [
             {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": self.prompt_template.format(**input_dict)},
+            {"role": "user", "content": content},
         ]
         response = chat_completions_with_backoff(
             model=self.args.engine,
             messages=messages,
-            max_tokens=4096,
+            max_tokens=max_tokens,
             n=1,
             temperature=self.args.temperature,
             seed=self.args.seed,
         )
         # postprocess
         choice = response["choices"][0]
-        if choice["finish_reason"] != "stop":
-            return False
-        output = choice["message"]["content"]
+        output = choice["message"]["content"] or ""
+        usage = response.get("usage") or {}
+        tokens = usage.get("total_tokens") or (num_tokens_from_string(content) + num_tokens_from_string(output))
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["tokens"] += tokens
+        if choice["finish_reason"] != "stop" and not partial:
+            return None
         if "mixtral" in self.args.engine.lower():
             # weird decoding problem
             output = output.replace("\_", "_")
-            
-        valid = self.parse(output, tag)
-        reason = self.parse(output, "REASON")
+        return output
+
+    def judge(self, input_dict: dict, tag: str = "VALID") -> Tuple[Optional[str], Optional[str]]:
+        """(verdict, reason) of a single pair, one request."""
+        output = self.request(self.prompt_template.format(**input_dict))
+        if output is None:
+            return None, None
+        return normalize_verdict(self.parse(output, tag)), self.parse(output, "REASON")
+
+    def judge_batch(self, input_dicts: List[dict]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """(verdict, reason) per pair from one packed request, single requests for unparsable items."""
+        if len(input_dicts) == 1:
+            return [self.judge(input_dicts[0])]
+        items = "".join(
+            LLM_FILTER_BATCH_ITEM.format(id=i, **input_dict) for i, input_dict in enumerate(input_dicts)
+        )
+        # a truncated output still carries the verdicts completed before the cut
+        output = self.request(
+            self.batch_prompt_template.format(items=items),
+            max_tokens=max(4096, BATCH_ITEM_TOKENS * len(input_dicts)),
+            partial=True,
+        ) or ""
+        valids, reasons = parse_tagged(output, "VALID"), parse_tagged(output, "REASON")
+        with self._lock:
+            self.stats["batch_requests"] += 1
+        results = []
+        for i, input_dict in enumerate(input_dicts):
+            valid = normalize_verdict(valids.get(i))
+            if valid not in ("True", "False"):
+                with self._lock:
+                    self.stats["fallbacks"] += 1
+                results.append(self.judge(input_dict))
+            else:
+                results.append((valid, reasons.get(i)))
+        return results
+
+    def _remember(self, key: str, verdict: Tuple[Optional[str], Optional[str]]):
+        # unanswered requests (truncated outputs) are not cached, they may succeed on retry
+        if verdict[0] is None:
+            return
+        with self._lock:
+            self.cache[key] = verdict
+        if self.cache_path:
+            with _cache_file_lock(self.cache_path):
+                with open(self.cache_path, "a") as f:
+                    f.write(json.dumps(dict(key=key, valid=verdict[0], reason=verdict[1])) + "\n")
+
+    def validate(self, input_dict: dict, tag: str, target: str) -> bool:
+        key = verdict_key(input_dict["problem"], input_dict["solution"])
+        with self._lock:
+            self.stats["items"] += 1
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+        if cached is not None:
+            valid, reason = cached
+        elif self.batch_size <= 1 or tag != "VALID":
+            valid, reason = self.judge(input_dict, tag)
+            self._remember(key, (valid, reason))
+        else:
+            future = Future()
+            with self._lock:
+                if self._collector is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+                    self._collector = threading.Thread(target=self._collect, daemon=True)
+                    self._collector.start()
+            self._queue.put((key, input_dict, future))
+            valid, reason = future.result()
         return (valid == target), reason
+
+    def _collect(self):
+        # packs queued items into batches of up to batch_size, waiting at most max_wait for stragglers
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            verdicts = self.judge_batch([input_dict for _, input_dict, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (key, _, future), verdict in zip(batch, verdicts):
+            self._remember(key, verdict)
+            future.set_result(verdict)
+
+    def summary(self) -> str:
+        with self._lock:
+            stats = dict(self.stats)
+        judged = max(1, stats["items"] - stats["cache_hits"])
+        return (
+            f"LLMFilter: {stats['items']} items, {stats['cache_hits']} cached, {stats['requests']} requests "
+            f"({stats['batch_requests']} batched, {stats['fallbacks']} fallbacks), "
+            f"{stats['tokens'] / judged:.0f} tokens per judged item"
+        )
+
+
+_FILTERS: Dict[Tuple, LLMFilter] = {}
+_FILE_LOCKS: Dict[str, threading.Lock] = {}
+_LOCK = threading.Lock()
+
+
+def _cache_file_lock(cache_path: str) -> threading.Lock:
+    with _LOCK:
+        return _FILE_LOCKS.setdefault(os.path.abspath(cache_path), threading.Lock())
+
+
+def get_llm_filter(args, batch_size: int = 1, cache_path: str = "") -> LLMFilter:
+    """
+    Filter shared by every task in the process, so concurrent `validate`
+    calls of all worker threads are packed into the same batches and share
+    one verdict cache.
+    """
+    key = (args.engine, batch_size, os.path.abspath(cache_path) if cache_path else "")
+    with _LOCK:
+        if key not in _FILTERS:
+            _FILTERS[key] = LLMFilter(args, batch_size=batch_size, cache_path=cache_path)
+        return _FILTERS[key]
@@ -5,43 +5,64 @@
 
 import os
 from typing import Optional
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from ..base import BaseFilter
 
 
+REWARD_MODEL = "nvidia/nemotron-4-340b-reward"
+REWARD_BASE_URL = "https://integrate.api.nvidia.com/v1"
+
 
 class NemotronRewardFilter(BaseFilter):
 
     def __init__(
         self,
-        args,
+        args=None,
         prompt_template: str = "",
+        base_url: str = REWARD_BASE_URL,
+        model: str = REWARD_MODEL,
+        api_key: Optional[str] = None,
     ):
         self.prompt_template = prompt_template
         self.args = args
-        self.client = OpenAI(
-            base_url = "https://integrate.api.nvidia.com/v1",
-            api_key = os.environ['API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC'],
-        )
-        
+        self.model = model
+        api_key = api_key or os.environ.get('API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC', "EMPTY")
+        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.async_client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+
     def parse(self, text: str):
+        # "helpfulness:3.1,correctness:3.2,..."
         scores = {}
         for i in text.strip().split(','):
             key, value = i.split(':')
-            scores[key] = float(value)
+            scores[key.strip()] = float(value)
         return scores
 
-    def validate(self, input_dict: dict) -> dict:
-
-        # construct chat message and call
-        messages = [
+    def messages(self, input_dict: dict):
+        return [
             {"role": "user", "content": input_dict['problem']},
             {"role": "assistant", "content": input_dict['solution']},
         ]
+
+    def parse_completion(self, completion) -> dict:
+        message = completion.choices[0].message
+        if message.content:
+            return self.parse(message.content)
+        # the scores are also returned as per-attribute logprobs
+        logprobs = completion.choices[0].logprobs
+        return {item.token: float(item.logprob) for item in logprobs.content}
+
+    def validate(self, input_dict: dict) -> dict:
         completion = self.client.chat.completions.create(
-            model="nvidia/nemotron-4-340b-reward",
-            messages=messages,
+            model=self.model,
+            messages=self.messages(input_dict),
+        )
+        return self.parse_completion(completion)
+
+    async def ascore(self, input_dict: dict) -> dict:
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self.messages(input_dict),
         )
-        output = completion.choices[0].message[0].content
-        return self.parse(output)
+        return self.parse_completion(completion)
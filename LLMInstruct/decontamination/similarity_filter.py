@@ -3,13 +3,94 @@
 # This work is made available
 # under the Nvidia Source Code License (1-way Commercial).
 
-from abc import abstractmethod
-from multiprocessing import Pool
-from typing import List
-from datasketch import MinHash, MinHashLSH
-from nltk import ngrams
+import re
+import math
+import hashlib
+import functools
+import threading
+import numpy as np
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+from datasketch import MinHash
 
 from .base import BaseFilter
+from .dedup_store import DedupStore, MemoryDedupStore, doc_id
+
+
+def shingles(inst: str, ngram_size: int = 5) -> List[bytes]:
+    """
+    Character n-grams encoded as before with `nltk.ngrams` (characters
+    joined by spaces), so signatures stay identical to earlier runs.
+    """
+    spaced = " ".join(inst)
+    width = 2 * ngram_size - 1
+    return [spaced[i:i + width].encode("utf8") for i in range(0, 2 * (len(inst) - ngram_size) + 1, 2)]
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+@functools.lru_cache(maxsize=None)
+def _permutations(num_perm: int, seed: int = 1):
+    return MinHash(num_perm=num_perm, seed=seed).permutations
+
+
+def signature(grams: Sequence[bytes], num_perm: int = 128) -> np.ndarray:
+    """
+    MinHash values of all shingles in one numpy pass; same result as
+    `MinHash.update` per shingle with datasketch's default sha1_hash32.
+    """
+    hashvalues = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+    if not grams:
+        return hashvalues
+    digests = b"".join(hashlib.sha1(g).digest()[:4] for g in grams)
+    hv = np.frombuffer(digests, dtype="<u4").astype(np.uint64)
+    a, b = _permutations(num_perm)
+    phv = np.bitwise_and((np.outer(hv, a) + b) % _MERSENNE_PRIME, _MAX_HASH)
+    return np.minimum(phv.min(axis=0), hashvalues)
+
+
+def minhash(inst: str, num_perm: int = 128, ngram_size: int = 5) -> MinHash:
+    return MinHash(
+        num_perm=num_perm,
+        hashvalues=signature(shingles(inst, ngram_size), num_perm),
+        permutations=_permutations(num_perm),
+    )
+
+
+def _minhash_chunk(docs: Sequence[str], num_perm: int, ngram_size: int):
+    return [signature(shingles(doc, ngram_size), num_perm) for doc in docs]
+
+
+def minhash_batch(
+    docs: Sequence[str],
+    num_perm: int = 128,
+    ngram_size: int = 5,
+    workers: int = 1,
+    chunk_size: int = 1024,
+) -> List[MinHash]:
+    """
+    Signatures for a list of documents, optionally spread over a process
+    pool. Workers only return the hash values; the permutations are shared.
+    """
+    if workers <= 1 or len(docs) <= chunk_size:
+        return [minhash(doc, num_perm, ngram_size) for doc in docs]
+
+    # small enough chunks that all workers stay busy
+    chunk_size = max(1, min(chunk_size, -(-len(docs) // (workers * 4))))
+    chunks = [docs[i:i + chunk_size] for i in range(0, len(docs), chunk_size)]
+    permutations = _permutations(num_perm)
+    signatures = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for hashvalues in executor.map(
+            _minhash_chunk, chunks, [num_perm] * len(chunks), [ngram_size] * len(chunks)
+        ):
+            signatures += [
+                MinHash(num_perm=num_perm, hashvalues=hv, permutations=permutations) for hv in hashvalues
+            ]
+    return signatures
 
 
 class SimilarityFilter(BaseFilter):
@@ -17,23 +98,146 @@ class SimilarityFilter(BaseFilter):
         pass
 
 
+def rouge_tokenize(text: str) -> List[str]:
+    # rouge_score's default tokenizer without stemming
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+
+
+def lcs_length(a: Sequence, b: Sequence) -> int:
+    """
+    Longest common subsequence length, bit-parallel over `a` (Hyyrö 2004):
+    one big-int add/sub per token of `b` instead of a len(a) x len(b) table.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return 0
+    masks = {}
+    for i, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for token in b:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count("1")
+
+
+def rouge_l(a: Sequence, b: Sequence) -> float:
+    # ROUGE-L F-measure of two token sequences, symmetric
+    if not a or not b:
+        return 0.0
+    lcs = lcs_length(a, b)
+    return 2 * lcs / (len(a) + len(b))
+
+
+def _rouge_l_max(query: Sequence, candidates: Sequence[Sequence]) -> float:
+    return max((rouge_l(query, c) for c in candidates), default=0.0)
+
+
 class RougeFilter(SimilarityFilter):
+    """
+    ROUGE-L near-duplicate filter. Candidates come from a token inverted
+    index with prefix filtering, so no document that can reach `threshold`
+    is missed and only those are scored exactly.
 
-    def __init__(self, instructions: List[str] = None):
-        from rouge_score import rouge_scorer
-        self.scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=False)
-        self.instructions = [] if instructions is None else instructions
+    ROUGE-L F >= t needs an LCS, hence a token multiset overlap, of at least
+    t / (2 - t) of either document. Two such documents must share a token
+    within the first `len - ceil(len * t / (2 - t)) + 1` tokens of each, in
+    a fixed global order (rarest first, by document frequency of the initial
+    instructions), so only those prefixes are indexed and probed.
+    """
 
-    def validate(self, threshold: float = 0.7) -> bool:
-        with Pool(4) as p:
-            rouge_scores = p.map(partial(scorer.score, inst), self.instructions)
-        rouge_scores = [score["rougeL"].fmeasure for score in rouge_scores]
-        if max(rouge_scores) > threshold:
-            return False
-        return True
+    def __init__(self, instructions: List[str] = None, threshold: float = 0.7, workers: int = 1):
+        self.threshold = threshold
+        self.workers = workers
+        self.documents: List[Tuple[int, ...]] = []
+        self.index: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self.vocab: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+        instructions = [] if instructions is None else instructions
+        tokenized = [rouge_tokenize(inst) for inst in instructions]
+        df = Counter(token for tokens in tokenized for token in set(tokens))
+        # frozen order: rarer tokens first, tokens unseen so far count as rarest
+        self.rank = {token: df[token] for token in df}
+        for tokens in tokenized:
+            self._add(tokens)
+
+    def _encode(self, tokens: List[str]) -> Tuple[int, ...]:
+        return tuple(self.vocab.setdefault(token, len(self.vocab)) for token in tokens)
+
+    def _prefix(self, tokens: List[str]) -> List[Tuple[str, int]]:
+        # tokens numbered by occurrence so the multiset becomes a set
+        seen = Counter()
+        items = []
+        for token in tokens:
+            items.append((token, seen[token]))
+            seen[token] += 1
+        items.sort(key=lambda item: (self.rank.get(item[0], 0), item[0], item[1]))
+        overlap = math.ceil(len(tokens) * self.threshold / (2 - self.threshold) - 1e-9)
+        return items[:len(tokens) - overlap + 1]
+
+    def _add(self, tokens: List[str]):
+        key = len(self.documents)
+        self.documents.append(self._encode(tokens))
+        for token, k in self._prefix(tokens):
+            self.index[(self.vocab[token], k)].append(key)
+
+    def candidates(self, tokens: List[str]) -> List[int]:
+        ratio = self.threshold / (2 - self.threshold)
+        lo, hi = len(tokens) * ratio - 1e-9, len(tokens) / ratio + 1e-9 if ratio > 0 else math.inf
+        found = set()
+        for token, k in self._prefix(tokens):
+            if token in self.vocab:
+                found.update(self.index.get((self.vocab[token], k), ()))
+        return [c for c in found if lo <= len(self.documents[c]) <= hi]
+
+    def _score(self, tokens: List[str]) -> float:
+        candidates = self.candidates(tokens)
+        query = tuple(self.vocab.get(token, -1) for token in tokens)
+        docs = [self.documents[c] for c in candidates]
+        if self.workers <= 1 or len(docs) < 256:
+            return _rouge_l_max(query, docs)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        chunk_size = -(-len(docs) // self.workers)
+        chunks = [docs[i:i + chunk_size] for i in range(0, len(docs), chunk_size)]
+        return max(self._executor.map(_rouge_l_max, [query] * len(chunks), chunks))
+
+    def score(self, inst: str) -> float:
+        """Highest ROUGE-L F-measure against the stored instructions that can reach the threshold, else 0."""
+        with self._lock:
+            return self._score(rouge_tokenize(inst))
+
+    def validate(self, inst: str) -> bool:
+        return self.score(inst) < self.threshold
 
     def add(self, inst: str):
-        self.instructions.append(inst)
+        with self._lock:
+            self._add(rouge_tokenize(inst))
+
+    def validate_and_add(self, inst: str) -> bool:
+        tokens = rouge_tokenize(inst)
+        with self._lock:
+            if self._score(tokens) >= self.threshold:
+                return False
+            self._add(tokens)
+            return True
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def jaccard(a: str, b: str, ngram_size: int = 5) -> float:
+    # exact Jaccard similarity of the shingle sets MinHash estimates
+    a, b = set(shingles(a, ngram_size)), set(shingles(b, ngram_size))
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
 
 
 class JaccardFilter(SimilarityFilter):
@@ -43,29 +247,72 @@ class JaccardFilter(SimilarityFilter):
         instructions: List[str] = None,
         num_perm: int = 128,
         threshold: float = 0.7,
+        workers: int = 1,
+        base=None,
+        store: DedupStore = None,
     ):
+        # base: optional read-only index (e.g. BenchmarkIndex) shared between filters
+        # store: near-duplicate store for accepted data, may be shared between filters/workers;
+        #   only 64-bit ids are kept, texts only if `store.documents` is set for the exact re-check
+        self.base = base
         self.num_perm = num_perm
-        self.lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
-        self.instructions = [] if instructions is None else instructions
+        self.threshold = threshold
+        self.store = MemoryDedupStore(threshold, num_perm) if store is None else store
 
-        for e, inst in enumerate(self.instructions):
-            m = self.minhash(inst)
-            self.lsh.insert(str(e), m, check_duplication=False)
+        instructions = [] if instructions is None else instructions
+        keys = [doc_id(inst) for inst in instructions]
+        signatures = minhash_batch(instructions, num_perm=num_perm, workers=workers)
+        self.store.insert_many(zip(keys, signatures))
+        if self.store.documents is not None:
+            self.store.documents.put_many(zip(keys, instructions))
 
     def minhash(self, inst: str, ngram_size=5):
-        m = MinHash(num_perm=self.num_perm)
-        for word in ngrams(inst, ngram_size): 
-            m.update(" ".join(word).encode("utf8"))
-        return m
+        return minhash(inst, self.num_perm, ngram_size)
+
+    def is_duplicate(self, inst: str, candidates: List[int]) -> bool:
+        """
+        Whether any LSH candidate is a near-duplicate of `inst`. Without
+        stored texts every candidate counts; otherwise the candidate texts
+        are loaded and compared exactly (missing texts count as duplicates).
+        """
+        if not candidates or self.store.documents is None:
+            return bool(candidates)
+        texts = self.store.documents.get_many(candidates)
+        if len(texts) < len(set(candidates)):
+            return True
+        return any(jaccard(inst, text) >= self.threshold for text in texts.values())
 
     def validate(self, inst: str):
         m = self.minhash(inst)
-        result = self.lsh.query(m)
-        if not result:
-            return True
-        return False  # need to be remove
+        if self.base is not None and self.base.query(m):
+            return False
+        return not self.is_duplicate(inst, self.store.query(m))
 
     def add(self, inst: str):
+        key = doc_id(inst)
+        self.store.insert(key, self.minhash(inst))
+        if self.store.documents is not None:
+            self.store.documents.put(key, inst)
+
+    def validate_and_add(self, inst: str, claim: Callable[[], bool] = None) -> bool:
+        """
+        Atomic validate + add: of several workers racing on near-duplicates
+        exactly one is accepted. `claim` runs under the store's lock once
+        MinHash finds no duplicate; returning False rejects `inst` as well.
+        """
         m = self.minhash(inst)
-        self.lsh.insert(hash(inst), m, check_duplication=False)
-        self.instructions.append(inst)
+        if self.base is not None and self.base.query(m):
+            return False
+        key = doc_id(inst)
+
+        def is_duplicate(candidates):
+            if self.is_duplicate(inst, candidates):
+                return True
+            if claim is not None and not claim():
+                return True
+            if self.store.documents is not None:
+                # stored before the band rows, so other workers finding this candidate can load it
+                self.store.documents.put(key, inst)
+            return False
+
+        return self.store.check_and_add(key, m, is_duplicate)
@@ -0,0 +1,206 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import re
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict
+
+from .similarity_filter import SimilarityFilter, JaccardFilter
+from .dedup_store import DigestSet
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("exact", "normalized", "minhash")
+_LOCK = threading.Lock()
+
+VERILOG_KEYWORDS = frozenset("""
+    always always_comb always_ff always_latch and assign assert assume automatic begin bit buf bufif0 bufif1 byte
+    case casex casez cell class cmos config const cover deassign default defparam design disable do edge else end
+    endcase endclass endconfig endfunction endgenerate endinterface endmodule endpackage endprimitive endspecify
+    endtable endtask enum event extern final for force forever fork function generate genvar highz0 highz1 if
+    ifnone import incdir include initial inout input instance int integer interface join join_any join_none
+    large liblist library localparam logic longint macromodule medium module nand negedge nmos nor noshowcancelled
+    not notif0 notif1 or output package packed parameter pmos posedge primitive priority pull0 pull1 pulldown
+    pullup pulsestyle_ondetect pulsestyle_onevent rcmos real realtime reg release repeat return rnmos rpmos rtran
+    rtranif0 rtranif1 scalared shortint showcancelled signed small specify specparam strong0 strong1 struct
+    supply0 supply1 table task time tran tranif0 tranif1 tri tri0 tri1 triand trior trireg typedef union unique
+    unsigned use uwire vectored void wait wand weak0 weak1 while wire wor xnor xor
+""".split())
+
+# declarations only: a line starting with `module name(`, `module name #(` or `module name;`
+_MODULE = re.compile(r"^[ \t]*(?:macro)?module\s+[A-Za-z_][\w$]*\s*[#(;].*?\bendmodule\b", re.DOTALL | re.MULTILINE)
+_COMMENT = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+# strings, system tasks/macros, identifiers, sized/unsized numbers, then any other character
+_CODE_TOKEN = re.compile(
+    r"\"(?:\\.|[^\"\\\n])*\"|[$`][A-Za-z0-9_$]+|[A-Za-z_][A-Za-z0-9_$]*|\d*'[sS]?[bodhBODH][0-9a-fA-FxXzZ_?]+|\d[\d_.]*|\S"
+)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_code(code: str) -> str:
+    """
+    Verilog with comments stripped, whitespace collapsed to single spaces
+    between tokens and identifiers renamed in order of first appearance,
+    so renaming signals or reformatting does not change the result.
+    """
+    names: Dict[str, str] = {}
+    tokens = []
+    for token in _CODE_TOKEN.findall(_COMMENT.sub(" ", code)):
+        if (token[0].isalpha() or token[0] == "_") and token not in VERILOG_KEYWORDS:
+            token = names.setdefault(token, f"v{len(names)}")
+        tokens.append(token)
+    return " ".join(tokens)
+
+
+def normalize_verilog(text: str) -> str:
+    """
+    Canonical form of a generated sample: every module declaration up to
+    its endmodule goes through `normalize_code`, the prose around it only
+    has its whitespace collapsed (renaming prose words would merge unrelated
+    instructions).
+    """
+    if _MODULE.search(text) is None:
+        return _SPACE.sub(" ", text).strip()
+    parts = []
+    last = 0
+    for match in _MODULE.finditer(text):
+        parts.append(_SPACE.sub(" ", text[last:match.start()]).strip())
+        parts.append(normalize_code(match.group(0)))
+        last = match.end()
+    parts.append(_SPACE.sub(" ", text[last:]).strip())
+    return "\n".join(part for part in parts if part)
+
+
+def digest(text: str) -> int:
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(text.encode("utf8"))
+    return int.from_bytes(hashlib.blake2b(text.encode("utf8"), digest_size=8).digest(), "little")
+
+
+class TieredFilter(SimilarityFilter):
+    """
+    Cheap tiers in front of a JaccardFilter: a set of exact digests, then a
+    set of digests of the normalized text, and only then MinHash (shingling
+    and the LSH/base index queries). A hit in an earlier tier is a duplicate
+    of an accepted sample, so the later tiers are skipped. The digest sets
+    sit next to the JaccardFilter's store, so filters sharing a store (see
+    `get_dedup_store`) share them; a store shared across processes still
+    catches duplicates of other processes in the MinHash tier.
+    """
+
+    def __init__(
+        self,
+        jaccard: JaccardFilter,
+        normalize: Callable[[str], str] = normalize_verilog,
+        enabled: bool = True,
+        log_every: int = 1000,
+    ):
+        self.jaccard = jaccard
+        self.normalize = normalize
+        self.enabled = enabled
+        self.log_every = log_every
+        with _LOCK:
+            if jaccard.store.digests is None:
+                jaccard.store.digests = DigestSet()
+        self.digests = jaccard.store.digests
+        self.checked = 0
+        self.accepted = 0
+        self.hits = {tier: 0 for tier in TIERS}
+        self.seconds = {tier: 0.0 for tier in TIERS}
+        self._lock = threading.Lock()
+
+    def _digests(self, inst: str):
+        if not self.enabled:
+            return None, None
+        start = time.perf_counter()
+        exact = digest(inst)
+        middle = time.perf_counter()
+        normalized = digest(self.normalize(inst))
+        end = time.perf_counter()
+        with self._lock:
+            self.seconds["exact"] += middle - start
+            self.seconds["normalized"] += end - middle
+        return exact, normalized
+
+    def _tier_hit(self, exact, normalized):
+        if not self.enabled:
+            return None
+        return self.digests.hit(exact, normalized)
+
+    def _record(self, tier, accepted: bool, seconds: float = 0.0):
+        with self._lock:
+            self.checked += 1
+            self.seconds["minhash"] += seconds
+            if tier is not None:
+                self.hits[tier] += 1
+            if accepted:
+                self.accepted += 1
+            log = self.log_every and self.checked % self.log_every == 0
+        if log:
+            logger.info(self.summary())
+
+    def validate(self, inst: str) -> bool:
+        exact, normalized = self._digests(inst)
+        tier = self._tier_hit(exact, normalized)
+        if tier is not None:
+            self._record(tier, False)
+            return False
+        start = time.perf_counter()
+        valid = self.jaccard.validate(inst)
+        self._record(None if valid else "minhash", False, time.perf_counter() - start)
+        return valid
+
+    def add(self, inst: str):
+        exact, normalized = self._digests(inst)
+        self.jaccard.add(inst)
+        if self.enabled:
+            self.digests.add(exact, normalized)
+
+    def validate_and_add(self, inst: str) -> bool:
+        exact, normalized = self._digests(inst)
+        tier = self._tier_hit(exact, normalized)
+        if tier is not None:
+            self._record(tier, False)
+            return False
+        claimed = None
+
+        def claim():
+            # under the store's lock, after MinHash accepted: a copy accepted meanwhile
+            # by a concurrent worker still rejects this one at the cheap tiers
+            nonlocal claimed
+            claimed = self.digests.claim(exact, normalized)
+            return claimed
+
+        start = time.perf_counter()
+        accepted = self.jaccard.validate_and_add(inst, claim if self.enabled else None)
+        if claimed is False:
+            tier = self.digests.hit(exact, normalized)
+        elif not accepted:
+            tier = "minhash"
+        self._record(tier, accepted, time.perf_counter() - start)
+        return accepted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                checked=self.checked,
+                accepted=self.accepted,
+                hits=dict(self.hits),
+                seconds={tier: round(s, 3) for tier, s in self.seconds.items()},
+            )
+
+    def summary(self) -> str:
+        stats = self.stats()
+        tiers = ", ".join(f"{tier} {stats['hits'][tier]} hits/{stats['seconds'][tier]}s" for tier in TIERS)
+        return f"TieredFilter: {stats['accepted']}/{stats['checked']} accepted; {tiers}"
@@ -3,36 +3,331 @@
 # This work is made available
 # under the Nvidia Source Code License (1-way Commercial).
 
-from LLMInstruct.decontamination.similarity_filter import JaccardFilter
-from LLMInstruct.utils import read_data, write_jsonl
+"""
+Near-duplicate removal and benchmark decontamination of generated data.
+
+    python LLMInstruct/deduplication.py --inputs "data/shard-*.jsonl" --keys input output --output_dir dedup
+
+Records are streamed from jsonl(.gz)/parquet shards. MinHash band hashes
+of every key are computed in a process pool and spilled to partition
+files on disk, then each partition is sorted and records sharing a band
+are merged with union-find. A cluster keeps its first record; clusters
+containing a benchmark text (by default the VerilogEval-Human prompts and
+solutions, see --benchmark) are dropped entirely. Memory holds one int64
+per record plus one partition at a time; the union-find parents are
+memory-mapped and the ids of cluster roots are spilled to SQLite.
+
+Outputs in --output_dir: kept_ids.txt, duplicates.jsonl (id, duplicate_of),
+report.json, and deduped.jsonl with --write_records.
+"""
+
+import os
+import glob
+import json
+import shutil
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
 from tqdm import tqdm
+from datasketch.lsh import _optimal_param
+
+from LLMInstruct.utils import read_jsonl, write_jsonl
+from LLMInstruct.decontamination.dedup_store import DocumentStore, band_hashes
+from LLMInstruct.decontamination.similarity_filter import minhash
+from LLMInstruct.decontamination.benchmark_index import benchmark_texts
+
+
+ENTRY = np.dtype([("key", "<i8"), ("node", "<i8")])
+
+
+def iter_shard(filename: str, columns: Sequence[str] = None, batch_size: int = 8192) -> Iterable[Dict]:
+    if filename.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(filename)
+        names = set(parquet_file.schema_arrow.names)
+        columns = None if columns is None else [c for c in columns if c in names]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
+    else:
+        yield from read_jsonl(filename)
+
+
+def iter_records(shards: Sequence[str], columns: Sequence[str] = None) -> Iterable[Tuple[str, int, Dict]]:
+    for shard in shards:
+        for row, record in enumerate(iter_shard(shard, columns)):
+            yield shard, row, record
+
+
+def record_id(shard: str, row: int, record: Dict, id_key: str = ""):
+    return record[id_key] if id_key else f"{shard}:{row}"
+
+
+def _band_keys(texts: List[Tuple[int, str]], num_perm: int, b: int, r: int) -> np.ndarray:
+    # (band key, node) for every band of every text; band keys are salted so bands never match each other
+    entries = np.empty(len(texts) * b, dtype=ENTRY)
+    salts = np.arange(b, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    for i, (node, text) in enumerate(texts):
+        hashes = np.asarray(band_hashes(minhash(text, num_perm), b, r), dtype=np.int64)
+        entries["key"][i * b:(i + 1) * b] = (hashes.view(np.uint64) ^ salts).view(np.int64)
+        entries["node"][i * b:(i + 1) * b] = node
+    return entries
+
+
+class Partitions:
+    """Append-only (band key, node) files, partitioned by the low bits of the key."""
+
+    def __init__(self, work_dir: str, num_partitions: int):
+        self.num_partitions = num_partitions
+        self.paths = [os.path.join(work_dir, f"part{p:04d}.bin") for p in range(num_partitions)]
+        self.files = [open(path, "wb") for path in self.paths]
+
+    def write(self, entries: np.ndarray):
+        partition = entries["key"].view(np.uint64) % np.uint64(self.num_partitions)
+        order = np.argsort(partition, kind="stable")
+        entries, partition = entries[order], partition[order]
+        bounds = np.searchsorted(partition, np.arange(self.num_partitions + 1, dtype=np.uint64))
+        for p in range(self.num_partitions):
+            if bounds[p] < bounds[p + 1]:
+                entries[bounds[p]:bounds[p + 1]].tofile(self.files[p])
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+def find(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """
+    Vectorized root lookup with path halving: every visited node is
+    pointed at its grandparent, so chains shrink with each lookup. Parents
+    always point to smaller nodes.
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    while True:
+        parents = parent[nodes]
+        grandparents = parent[parents]
+        if np.array_equal(parents, grandparents):
+            return parents
+        parent[nodes] = grandparents
+        nodes = grandparents
+
+
+def union(parent: np.ndarray, a: np.ndarray, b: np.ndarray):
+    """
+    Merge the components of each pair (a[i], b[i]), linking the larger root
+    under the smaller one, so a component's root is its first node.
+    """
+    while len(a):
+        ra, rb = find(parent, a), find(parent, b)
+        mask = ra != rb
+        lo, hi = np.minimum(ra[mask], rb[mask]), np.maximum(ra[mask], rb[mask])
+        # several pairs may link the same root; keep the smallest, retry the rest
+        np.minimum.at(parent, hi, lo)
+        a, b = lo, hi
+
+
+class RootIds:
+    """
+    Record ids of the roots of duplicate clusters, spilled to SQLite in
+    chunks so memory does not grow with the number of clusters.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 8192):
+        self.store = DocumentStore(path)
+        self.chunk_size = chunk_size
+        self.pending: Dict[int, str] = {}
+
+    def put(self, node: int, rid):
+        self.pending[node] = json.dumps(rid)
+        if len(self.pending) >= self.chunk_size:
+            self.store.put_many(self.pending.items())
+            self.pending = {}
+
+    def get(self, node: int, default=None):
+        value = self.pending.get(node)
+        if value is None:
+            value = self.store.get_many([node]).get(node)
+        return default if value is None else json.loads(value)
+
+
+def union_partition(parent: np.ndarray, path: str):
+    entries = np.fromfile(path, dtype=ENTRY)
+    if len(entries) < 2:
+        return
+    entries = entries[np.argsort(entries["key"], kind="stable")]
+    same = entries["key"][1:] == entries["key"][:-1]
+    # nodes sharing a band key form a chain of neighbouring pairs
+    union(parent, entries["node"][:-1][same], entries["node"][1:][same])
+
+
+def signature_stage(
+    texts: Iterable[Tuple[int, str]],
+    partitions: Partitions,
+    num_perm: int,
+    b: int,
+    r: int,
+    workers: int,
+    chunk_size: int,
+):
+    def chunks():
+        chunk = []
+        for item in texts:
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    if workers <= 1:
+        for chunk in chunks():
+            partitions.write(_band_keys(chunk, num_perm, b, r))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # bounded number of chunks in flight, executor.map would read the whole input up front
+        pending = deque()
+        for chunk in chunks():
+            pending.append(executor.submit(_band_keys, chunk, num_perm, b, r))
+            if len(pending) >= 2 * workers:
+                partitions.write(pending.popleft().result())
+        while pending:
+            partitions.write(pending.popleft().result())
+
+
+def dedupe(args):
+    shards = sorted({f for pattern in args.inputs for f in glob.glob(pattern) if os.path.isfile(f)})
+    if not shards:
+        raise Exception(f"No input shards match {args.inputs}.")
+    os.makedirs(args.output_dir, exist_ok=True)
+    work_dir = os.path.join(args.output_dir, ".work")
+    os.makedirs(work_dir, exist_ok=True)
+    b, r = _optimal_param(args.threshold, args.num_perm, 0.5, 0.5)
+    columns = list(args.keys) + ([args.id_key] if args.id_key else [])
+
+    # nodes [0, num_benchmark) are benchmark texts, so they are the roots of contaminated clusters
+    benchmark = benchmark_texts(args.benchmark, args.benchmark_columns) if args.benchmark_columns else []
+    num_benchmark = len(benchmark)
+    num_records = 0
+
+    def texts():
+        nonlocal num_records
+        yield from enumerate(benchmark)
+        for node, (_, _, record) in enumerate(
+            tqdm(iter_records(shards, columns), desc="signatures"), start=num_benchmark
+        ):
+            num_records += 1
+            for key in args.keys:
+                if record.get(key):
+                    yield node, str(record[key])
+
+    partitions = Partitions(work_dir, args.num_partitions)
+    try:
+        signature_stage(texts(), partitions, args.num_perm, b, r, args.workers, args.chunk_size)
+    finally:
+        partitions.close()
+
+    num_nodes = num_benchmark + num_records
+    parent = np.lib.format.open_memmap(os.path.join(work_dir, "parent.npy"), mode="w+", dtype=np.int64, shape=(num_nodes,))
+    parent[:] = np.arange(num_nodes, dtype=np.int64)
+    for path in tqdm(partitions.paths, desc="union"):
+        union_partition(parent, path)
+        os.remove(path)
+    roots = find(parent, np.arange(num_nodes, dtype=np.int64))
+
+    cluster_sizes = np.bincount(roots[num_benchmark:], minlength=num_nodes)
+    report = dict(
+        shards=len(shards),
+        records=num_records,
+        kept=0,
+        duplicates=0,
+        contaminated=0,
+        clusters=int((cluster_sizes[num_benchmark:] > 1).sum()),
+        threshold=args.threshold,
+        num_perm=args.num_perm,
+        bands=b,
+        rows=r,
+    )
+
+    # roots come first in input order, so their ids are known when their duplicates are reached
+    root_ids = RootIds(os.path.join(work_dir, "root_ids.sqlite"), args.chunk_size)
+    kept_path = os.path.join(args.output_dir, "kept_ids.txt")
+    duplicates_path = os.path.join(args.output_dir, "duplicates.jsonl")
+    records_path = os.path.join(args.output_dir, "deduped.jsonl")
+    if args.write_records and os.path.exists(records_path):
+        os.remove(records_path)
+    with open(kept_path, "w") as kept_file, open(duplicates_path, "w") as duplicates_file:
+        batch = []
+        for node, (shard, row, record) in enumerate(
+            tqdm(iter_records(shards, None if args.write_records else columns), desc="write", total=num_records),
+            start=num_benchmark,
+        ):
+            rid = record_id(shard, row, record, args.id_key)
+            root = int(roots[node])
+            if root < num_benchmark:
+                report["contaminated"] += 1
+                duplicates_file.write(json.dumps(dict(id=rid, duplicate_of=None, benchmark=benchmark[root][:200])) + "\n")
+            elif root != node:
+                report["duplicates"] += 1
+                duplicates_file.write(json.dumps(dict(id=rid, duplicate_of=root_ids.get(root))) + "\n")
+            else:
+                report["kept"] += 1
+                kept_file.write(f"{rid}\n")
+                if cluster_sizes[node] > 1:
+                    root_ids.put(node, rid)
+                if args.write_records:
+                    batch.append(record)
+                    if len(batch) >= args.chunk_size:
+                        write_jsonl(records_path, batch, append=True)
+                        batch = []
+        if batch:
+            write_jsonl(records_path, batch, append=True)
 
-def validate_data(filter, data, keywords):
-    for key in keywords:
-        if not filter.validate(data[key]):
-            return False
+    largest = np.argsort(cluster_sizes)[::-1][:args.top_clusters]
+    report["largest_clusters"] = [
+        dict(id=root_ids.get(int(node), int(node)), size=int(cluster_sizes[node]))
+        for node in largest
+        if cluster_sizes[node] > 1 and node >= num_benchmark
+    ]
+    sizes = cluster_sizes[num_benchmark:]
+    report["cluster_size_histogram"] = {
+        str(size): count for size, count in sorted(Counter(sizes[sizes > 1].tolist()).items())
+    }
+    with open(os.path.join(args.output_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
 
-    for key in keywords:
-        filter.add(data[key])
-    return True
+    del parent
+    if not args.keep_work:
+        shutil.rmtree(work_dir)
+    return report
 
 
-def dedupe_generated(data_dir, data_name, benchmark_dir="./dataset/benchmark", benchmark_name="verilogeval-manual.jsonl.gz", keywords=['text']):
-    benchmark = read_data(benchmark_dir, benchmark_name)
-    dataset = read_data(data_dir, data_name)
-    jaccard_filter = JaccardFilter(instructions=benchmark["prompt"]+benchmark["canonical_solution"])
-    dedupe_results = []
-    for data in tqdm(dataset):
-        if validate_data(jaccard_filter, data, keywords):
-            dedupe_results.append(data)
-    return dedupe_results
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", type=str, nargs="+", required=True, help="jsonl(.gz)/parquet files or glob patterns")
+    parser.add_argument("--keys", type=str, nargs="+", default=["input", "output"], help="fields compared for duplicates")
+    parser.add_argument("--id_key", type=str, default="", help="record id field, default shard:row")
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--write_records", action="store_true", help="also write the kept records to deduped.jsonl")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--num_perm", type=int, default=128)
+    parser.add_argument("--benchmark", type=str, nargs="*", default=["./dataset/benchmark/verilogeval-manual.jsonl.gz"],
+                        help="benchmark files to decontaminate against")
+    parser.add_argument("--benchmark_columns", type=str, nargs="*", default=["prompt", "canonical_solution"],
+                        help="benchmark fields compared, none to skip decontamination")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk_size", type=int, default=2048)
+    parser.add_argument("--num_partitions", type=int, default=64)
+    parser.add_argument("--top_clusters", type=int, default=20)
+    parser.add_argument("--keep_work", action="store_true")
+    args = parser.parse_args()
 
+    report = dedupe(args)
+    print(json.dumps({k: v for k, v in report.items() if k != "largest_clusters"}, indent=2))
 
-# modify the following
-data_dir = ""
-data_name = ""
-output_file = ""
-keywords = ["input", "output"]
 
-data = dedupe_generated(data_dir, data_name, keywords=keywords)
-write_jsonl(output_file, data)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+"""
+Failure-mode clustering of error reports.
+
+    python LLMInstruct/error_clusters.py --inputs ./code_repair_examples/output/error_report.jsonl \
+        --output_dir ./code_repair_examples/clusters --num_clusters 32
+
+The `reason` of every report is turned into TF-IDF features (or local
+sentence embeddings with `--features embedding`) and grouped with
+spherical mini-batch k-means. Outputs in `--output_dir`:
+
+    model.npz          vocabulary, idf and cluster centers
+    clusters.json      per error class: size, label terms and representative reports
+    assignments.jsonl  every report with `error_class`, `error_class_label`
+                       and `error_class_similarity`
+
+Reruns only assign reports not seen before to the nearest existing class,
+so class ids stay stable; `--update` also moves the centers towards the
+new reports and `--refit` starts over. assignments.jsonl is itself a
+report file: pass it as `--error_report` together with
+`--error_report_by_class` to sample OSSRepairTask ICL examples per class.
+"""
+
+import os
+import re
+import json
+import glob
+import logging
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from LLMInstruct.utils import read_jsonl, write_jsonl
+from LLMInstruct.error_report import report_key
+
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z_][a-z0-9_]+")
+STOP_WORDS = frozenset("""
+    a about above after all also an and any are as at be because been before being below between both but by
+    can could did do does doing down during each few for from further had has have having here how if in into
+    is it its itself just more most no nor not now of off on once only or other our out over own same should
+    so some such than that the their them then there these they this those through to too under until up
+    very was we were what when where which while who why will with would you your
+    error errors implementation erroneous correct correctly code should example following given instead
+    verilog module use used using make makes need needs
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    # words and word bigrams of the lower-cased text, stop words removed
+    words = [w for w in _TOKEN.findall(text.lower()) if w not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TfidfFeatures:
+    """
+    Sublinear TF-IDF rows, L2-normalized. The vocabulary and idf are frozen
+    at `fit`, so later reports map into the same space.
+    """
+
+    def __init__(self, terms: Sequence[str], idf: np.ndarray):
+        self.terms = list(terms)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.vocabulary = {term: i for i, term in enumerate(self.terms)}
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], max_features: int = 20000, min_df: int = 2, max_df: float = 0.5) -> "TfidfFeatures":
+        df = Counter()
+        for text in texts:
+            df.update(set(tokenize(text)))
+        n = len(texts)
+        if max_df * n < min_df:
+            # too few reports for document-frequency cuts, keep every term
+            min_df, max_df = 1, 1.0
+        kept = [(count, term) for term, count in df.items() if count >= min_df and count <= max_df * n]
+        kept = sorted(kept, key=lambda x: (-x[0], x[1]))[:max_features]
+        terms = sorted(term for _, term in kept)
+        if not terms:
+            raise Exception(f"No TF-IDF terms in {n} reports, check --text_keys.")
+        idf = np.array([np.log((1 + n) / (1 + df[term])) + 1 for term in terms], dtype=np.float32)
+        return cls(terms, idf)
+
+    def transform(self, texts: Sequence[str]) -> sp.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            counts = Counter(i for i in map(self.vocabulary.get, tokenize(text)) if i is not None)
+            indices += counts.keys()
+            data += counts.values()
+            indptr.append(len(indices))
+        X = sp.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(texts), len(self.terms)),
+        )
+        X.data = (1 + np.log(X.data)) * self.idf[X.indices]
+        return normalize_rows(X)
+
+    def top_terms(self, weights: np.ndarray, n: int = 5) -> List[str]:
+        order = np.argsort(-weights)[:n]
+        return [self.terms[i] for i in order if weights[i] > 0]
+
+
+def normalize_rows(X):
+    if sp.issparse(X):
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.diags(1 / norms).dot(X).tocsr().astype(np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (X / norms).astype(np.float32)
+
+
+def _dot(X, centers: np.ndarray) -> np.ndarray:
+    return np.asarray(X @ centers.T)
+
+
+class MiniBatchKMeans:
+    """
+    Spherical k-means over L2-normalized rows (cosine similarity), fitted
+    with mini-batch updates so memory stays bounded by the batch size.
+    """
+
+    def __init__(self, centers: np.ndarray, counts: Optional[np.ndarray] = None):
+        self.centers = np.asarray(centers, dtype=np.float32)
+        self.counts = np.zeros(len(self.centers)) if counts is None else np.asarray(counts, dtype=np.float64)
+
+    @classmethod
+    def fit(
+        cls,
+        X,
+        num_clusters: int,
+        batch_size: int = 1024,
+        max_epochs: int = 20,
+        tol: float = 1e-4,
+        n_init: int = 3,
+        seed: int = 0,
+    ) -> "MiniBatchKMeans":
+        # best of `n_init` seedings by total cosine similarity to the centers
+        rng = np.random.default_rng(seed)
+        k = min(num_clusters, num_distinct_rows(X))
+        if k < num_clusters:
+            logger.warning(f"Only {k} distinct reports, fitting {k} instead of {num_clusters} classes")
+        best, best_score = None, -np.inf
+        for _ in range(n_init):
+            model = cls(kmeans_plus_plus(X, k, rng))
+            for epoch in range(max_epochs):
+                previous = model.centers.copy()
+                order = rng.permutation(X.shape[0])
+                for start in range(0, len(order), batch_size):
+                    model.partial_fit(X[np.sort(order[start:start + batch_size])])
+                shift = float(np.abs(model.centers - previous).max())
+                logger.info(f"k-means epoch {epoch}: center shift {shift:.2e}")
+                if shift < tol:
+                    break
+            score = float(model.predict(X)[1].sum())
+            if score > best_score:
+                best, best_score = model, score
+        return best
+
+    def predict(self, X, batch_size: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+        """(nearest cluster, cosine similarity) of every row."""
+        labels, similarity = [], []
+        for start in range(0, X.shape[0], batch_size):
+            sims = _dot(X[start:start + batch_size], self.centers)
+            labels.append(sims.argmax(axis=1))
+            similarity.append(sims.max(axis=1))
+        if not labels:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(labels), np.concatenate(similarity)
+
+    def partial_fit(self, X):
+        # each center moves towards the mean of its batch members with a
+        # per-center learning rate of (members in batch / members seen so far)
+        labels, _ = self.predict(X)
+        k = len(self.centers)
+        members = sp.csr_matrix((np.ones(len(labels), dtype=np.float32), (labels, np.arange(len(labels)))), shape=(k, len(labels)))
+        sums = members @ X
+        sums = sums.toarray() if sp.issparse(sums) else np.asarray(sums)
+        batch_counts = np.bincount(labels, minlength=k)
+        self.counts += batch_counts
+        moved = batch_counts > 0
+        eta = (batch_counts[moved] / self.counts[moved])[:, None]
+        means = sums[moved] / batch_counts[moved][:, None]
+        self.centers[moved] = normalize_rows((1 - eta) * self.centers[moved] + eta * means)
+        return self
+
+
+def num_distinct_rows(X) -> int:
+    if sp.issparse(X):
+        X = X.tocsr()
+        X.sort_indices()
+        return len({
+            (X.indices[X.indptr[i]:X.indptr[i + 1]].tobytes(), X.data[X.indptr[i]:X.indptr[i + 1]].tobytes())
+            for i in range(X.shape[0])
+        })
+    return len(np.unique(np.asarray(X), axis=0))
+
+
+def kmeans_plus_plus(X, k: int, rng: np.random.Generator) -> np.ndarray:
+    # seeds spread out by cosine distance, on a sample of at most 100 rows per cluster
+    sample = X[rng.choice(X.shape[0], size=min(X.shape[0], 100 * k), replace=False)]
+    dense = lambda i: sample[i].toarray().ravel() if sp.issparse(sample) else np.asarray(sample[i]).ravel()
+    centers = [dense(rng.integers(sample.shape[0]))]
+    distance = 1 - _dot(sample, centers[0][None]).ravel()
+    for _ in range(1, k):
+        weights = np.clip(distance, 0, None) ** 2
+        i = rng.choice(sample.shape[0], p=weights / weights.sum()) if weights.sum() > 0 else rng.integers(sample.shape[0])
+        centers.append(dense(i))
+        distance = np.minimum(distance, 1 - _dot(sample, centers[-1][None]).ravel())
+    return normalize_rows(np.stack(centers))
+
+
+class ErrorClusters:
+    """
+    Vectorizer plus cluster centers, with the label terms of each class
+    fixed at fit time so that class ids and labels stay stable.
+    """
+
+    def __init__(
+        self,
+        tfidf: TfidfFeatures,
+        kmeans: MiniBatchKMeans,
+        labels: List[str],
+        features: str = "tfidf",
+        embedding_model: str = "",
+    ):
+        self.tfidf = tfidf
+        self.kmeans = kmeans
+        self.labels = labels
+        self.features = features
+        self.embedding_model = embedding_model
+        self._encoder = None
+
+    def vectorize(self, texts: Sequence[str]):
+        if self.features == "tfidf":
+            return self.tfidf.transform(texts)
+        if self.features == "embedding":
+            if self._encoder is None:
+                from LLMInstruct.decontamination.embedding_filter import EmbeddingModel
+
+                self._encoder = EmbeddingModel(self.embedding_model)
+            return self._encoder.encode(texts)
+        raise Exception(f"Not support {self.features} features.")
+
+    @classmethod
+    def fit(
+        cls,
+        texts: Sequence[str],
+        num_clusters: int,
+        features: str = "tfidf",
+        embedding_model: str = "",
+        batch_size: int = 1024,
+        seed: int = 0,
+    ) -> "ErrorClusters":
+        tfidf = TfidfFeatures.fit(texts)
+        model = cls(tfidf, None, [], features, embedding_model)
+        X = model.vectorize(texts)
+        model.kmeans = MiniBatchKMeans.fit(X, num_clusters, batch_size=batch_size, seed=seed)
+
+        # label terms: strongest TF-IDF terms of the mean member of each class
+        assigned, _ = model.kmeans.predict(X)
+        T = X if features == "tfidf" else tfidf.transform(texts)
+        k = len(model.kmeans.centers)
+        members = sp.csr_matrix((np.ones(len(assigned)), (assigned, np.arange(len(assigned)))), shape=(k, len(assigned)))
+        weights = (members @ T).toarray()
+        model.labels = [", ".join(tfidf.top_terms(w)) for w in weights]
+        return model
+
+    def assign(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        return self.kmeans.predict(self.vectorize(texts))
+
+    def update(self, texts: Sequence[str]):
+        self.kmeans.partial_fit(self.vectorize(texts))
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.array(self.tfidf.terms, dtype=object),
+            idf=self.tfidf.idf,
+            centers=self.kmeans.centers,
+            counts=self.kmeans.counts,
+            labels=np.array(self.labels, dtype=object),
+            features=self.features,
+            embedding_model=self.embedding_model,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ErrorClusters":
+        with np.load(path, allow_pickle=True) as f:
+            return cls(
+                TfidfFeatures(f["terms"].tolist(), f["idf"]),
+                MiniBatchKMeans(f["centers"], f["counts"]),
+                f["labels"].tolist(),
+                str(f["features"]),
+                str(f["embedding_model"]),
+            )
+
+
+def report_text(report: Dict, keys: Sequence[str]) -> str:
+    return "\n".join(str(report.get(key) or "") for key in keys)
+
+
+def _report_key(report: Dict) -> Tuple:
+    return report_key(report.get("task_id"), report.get("exp"), report.get("error") or "")
+
+
+def read_reports(patterns: Sequence[str]) -> List[Dict]:
+    """Reports of all input files, first occurrence of each report only."""
+    files = sorted({f for pattern in patterns for f in glob.glob(pattern) if os.path.isfile(f)})
+    reports, seen = [], set()
+    for filename in files:
+        for report in read_jsonl(filename):
+            key = _report_key(report)
+            if key not in seen:
+                seen.add(key)
+                reports.append(report)
+    return reports
+
+
+def summarize(model: ErrorClusters, assignments: List[Dict], representatives: int = 3) -> List[Dict]:
+    clusters = []
+    for cluster, label in enumerate(model.labels):
+        members = sorted(
+            (r for r in assignments if r["error_class"] == cluster),
+            key=lambda r: -r["error_class_similarity"],
+        )
+        clusters.append(dict(
+            error_class=cluster,
+            label=label,
+            size=len(members),
+            representatives=[
+                {k: r.get(k) for k in ("task_id", "exp", "benchmark", "reason", "error_class_similarity")}
+                for r in members[:representatives]
+            ],
+        ))
+    return clusters
+
+
+def cluster_reports(args) -> Dict:
+    os.makedirs(args.output_dir, exist_ok=True)
+    model_path = os.path.join(args.output_dir, "model.npz")
+    assignment_path = os.path.join(args.output_dir, "assignments.jsonl")
+
+    reports = read_reports(args.inputs)
+    if os.path.exists(model_path) and not args.refit:
+        model = ErrorClusters.load(model_path)
+        assignments = list(read_jsonl(assignment_path)) if os.path.exists(assignment_path) else []
+        assigned = {_report_key(r) for r in assignments}
+        new = [r for r in reports if _report_key(r) not in assigned]
+        print(f"{len(new)} new of {len(reports)} reports, assigning to {len(model.labels)} existing classes")
+        if new and args.update:
+            model.update([report_text(r, args.text_keys) for r in new])
+    else:
+        if not reports:
+            raise Exception(f"No error reports in {args.inputs}.")
+        print(f"Fitting {args.num_clusters} classes on {len(reports)} reports ({args.features} features)")
+        model = ErrorClusters.fit(
+            [report_text(r, args.text_keys) for r in reports],
+            args.num_clusters,
+            features=args.features,
+            embedding_model=args.embedding_model,
+            batch_size=args.batch_size,
+            seed=args.seed,
+        )
+        assignments, new = [], reports
+        if os.path.exists(assignment_path):
+            os.remove(assignment_path)
+
+    labels, similarity = model.assign([report_text(r, args.text_keys) for r in new])
+    new = [
+        dict(r, error_class=int(c), error_class_label=model.labels[c], error_class_similarity=round(float(s), 4))
+        for r, c, s in zip(new, labels, similarity)
+    ]
+    write_jsonl(assignment_path, new, append=True)
+    model.save(model_path)
+
+    clusters = summarize(model, assignments + new, args.representatives)
+    with open(os.path.join(args.output_dir, "clusters.json"), "w") as f:
+        json.dump(clusters, f, indent=2)
+    return dict(reports=len(assignments) + len(new), new=len(new), clusters=clusters)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", type=str, nargs="+", required=True, help="error report jsonl files or glob patterns")
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--text_keys", type=str, nargs="+", default=["reason"], help="report fields that are clustered")
+    parser.add_argument("--num_clusters", type=int, default=32)
+    parser.add_argument("--features", type=str, default="tfidf", choices=["tfidf", "embedding"])
+    parser.add_argument("--embedding_model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--batch_size", type=int, default=1024, help="mini-batch size of k-means")
+    parser.add_argument("--representatives", type=int, default=3, help="reports closest to each center in clusters.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--update", action="store_true", help="move the existing centers towards new reports")
+    parser.add_argument("--refit", action="store_true", help="fit new classes on all reports")
+    args = parser.parse_args()
+
+    result = cluster_reports(args)
+    print(f"{result['reports']} reports ({result['new']} new) in {len(result['clusters'])} classes")
+    for cluster in sorted(result["clusters"], key=lambda c: -c["size"]):
+        print(f"  {cluster['error_class']:>3} {cluster['size']:>6}  {cluster['label']}")
+
+
+if __name__ == "__main__":
+    main()
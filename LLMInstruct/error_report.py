@@ -3,183 +3,133 @@
 # This work is made available
 # under the Nvidia Source Code License (1-way Commercial).
 
+"""
+Error reports of failing checkpoint samples, for code repair data.
+
+    python LLMInstruct/error_report.py --exp_path ./code_repair_examples/exp --num_samples 5
+
+The module can be imported as a library: the command line is only parsed
+by `cli`, and pandas, the OpenAI client and the benchmark registry are
+loaded on first use (see scripts/check_import_time.sh).
+"""
+
 import os
-import re
 import json
-import queue
+import hashlib
+import functools
+import asyncio
 import argparse
-import tempfile
-import threading
 import traceback
 import subprocess
-import pandas as pd
-import numpy as np
-import concurrent.futures
-import matplotlib.pyplot as plt
-
-from pathlib import Path
-from openai import OpenAI
-from tqdm import tqdm
+
 from copy import deepcopy
-from scipy.stats import entropy
-from collections import Counter, defaultdict
+from collections import defaultdict
 from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 
-from LLMInstruct.decontamination.similarity_filter import JaccardFilter
-from LLMInstruct.utils import read_jsonl, write_jsonl
-
-from utils import post_process_completion, read_problems
-from LLMInstruct.executor.execution import check_correctness, clean_up_simulation
-
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--output", required=False, type=str, default="./code_repair_examples/output", help="error report output directory")
-parser.add_argument("--temp", required=False, type=str, default="./code_repair_examples/tmp", help="Temperary directory for intermidiate output")
-parser.add_argument("--num_samples", required=False, type=int, default=50, help="Number of samples per task for error report.")
-parser.add_argument("--workers", required=False, type=int, default=64, help="Number of workers")
-parser.add_argument("--benchmark_path", required=False, type=str, default="./dataset/benchmark", help="benchmark directory")
-parser.add_argument("--exp_path", required=False, type=str, default="./code_repair_examples/exp", help="experiment directory")
-parser.add_argument("--cache_path", required=False, type=str, default="./code_repair_examples/cache", help="cache directory")
-parser.add_argument("--iters", required=False, type=int, default=1, help="Iterations to generate error report")
-parser.add_argument('--self_consist', action='store_true', help='Perform self-consist check.')
-args = parser.parse_args()
 
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", required=False, type=str, default="./code_repair_examples/output", help="error report output directory")
+    parser.add_argument("--temp", required=False, type=str, default="./code_repair_examples/tmp", help="Temperary directory for intermidiate output")
+    parser.add_argument("--num_samples", required=False, type=int, default=50, help="Number of samples per task for error report.")
+    parser.add_argument("--workers", required=False, type=int, default=64, help="Number of workers")
+    parser.add_argument("--concurrency", required=False, type=int, default=64, help="Number of error report requests in flight")
+    parser.add_argument("--benchmark_path", required=False, type=str, default="./dataset/benchmark", help="benchmark directory")
+    parser.add_argument("--exp_path", required=False, type=str, default="./code_repair_examples/exp", help="experiment directory")
+    parser.add_argument("--cache_path", required=False, type=str, default="./code_repair_examples/cache", help="cache directory")
+    parser.add_argument("--iters", required=False, type=int, default=1, help="Iterations to generate error report")
+    parser.add_argument('--self_consist', action='store_true', help='Perform self-consist check.')
+    parser.add_argument("--simulator", required=False, type=str, default="iverilog", choices=["iverilog", "verilator"], help="Simulator for self-consist check, verilator falls back to iverilog when it rejects a source")
+    return parser
 
 
-def read_benchmark(benchmark_path: str = args.benchmark_path):
-    print(f'Load benchmark jsonl from {benchmark_path}')
-    machine_df = pd.DataFrame(read_jsonl(os.path.join(benchmark_path, 'verilogeval-machine.jsonl.gz')))
-    human_df = pd.DataFrame(read_jsonl(os.path.join(benchmark_path, 'verilogeval-manual.jsonl.gz')))
-    rtllm_df = pd.DataFrame(read_jsonl(os.path.join(benchmark_path, 'rtllm.jsonl')))
+# defaults for library use, replaced by the parsed command line in `cli`
+args = build_parser().parse_args([])
 
-    problem_df = pd.concat([machine_df, human_df, rtllm_df])
-    problem_lookup = {}
-    benchmark_lookup = {'rtllm': {}, 'machine': {}, 'human': {}}
+NIM_BASE_URL = "https://integrate.api.nvidia.com/v1"
+REPORT_MODEL = "nvidia/nemotron-4-340b-instruct"
 
-    for idx, row in machine_df.iterrows():
-        problem_lookup[(row.task_id, 'machine')] = row.canonical_solution
-        benchmark_lookup['machine'][row.task_id] = row.to_dict()
-    for idx, row in human_df.iterrows():
-        problem_lookup[(row.task_id, 'human')] = row.canonical_solution
-        benchmark_lookup['human'][row.task_id] = row.to_dict()
-    for idx, row in rtllm_df.iterrows():
-        problem_lookup[(row.task_id, 'rtllm')] = row.canonical_solution
-        benchmark_lookup['rtllm'][row.task_id] = row.to_dict()
 
-    prompt_lookup = {
-        'human': {i['task_id']: i['detail_description'] for i in read_jsonl(os.path.join(benchmark_path, 'VerilogDescription_Human.jsonl'))},
-        'machine': {i['task_id']: i['detail_description'] for i in read_jsonl(os.path.join(benchmark_path, 'VerilogDescription_Machine.jsonl'))},
-        'rtllm': {i['task_id']: i['detail_description'] for i in read_jsonl(os.path.join(benchmark_path, 'rtllm.jsonl'))}
-    }
+def benchmarks():
+    """Benchmarks under --benchmark_path, loaded once per process on first use."""
+    from LLMInstruct.benchmarks import get_benchmark_registry
 
-    return problem_df, problem_lookup, benchmark_lookup, prompt_lookup
+    return get_benchmark_registry(args.benchmark_path)
 
 
 def read_checkpoint(exp_path: str):
-    exp_dict = defaultdict(list)
-    """
-    exp_dict = {
-        "exp_path": [
-            "expname1",
-            "expname2",
-        ]
-    }
-    """
-    for exp_name in os.listdir(exp_path):
-        exp_dict[exp_path].append(exp_name)
-
-    df_list = []
-    for root, exp_list in exp_dict.items():
-        for exp in exp_list:
-            for ckpt in os.listdir(os.path.join(root, exp)):
-                try:
-                    df = pd.DataFrame(read_jsonl(os.path.join(root, exp, ckpt, "VerilogEval_Human_0_1.jsonl_results.jsonl")))
-                    df['step'] = int(ckpt.split('step=')[1].split('-')[0])
-                    df['benchmark'] = "human"
-                    df['exp'] = exp
-                    df_list.append(df)
-                except Exception as ex:
-                    print(ex)
-
-                try:
-                    df = pd.DataFrame(read_jsonl(os.path.join(root, exp, ckpt, "VerilogEval_Machine_0_1.jsonl_results.jsonl")))
-                    df['step'] = int(ckpt.split('step=')[1].split('-')[0])
-                    df['benchmark'] = "machine"
-                    df['exp'] = exp
-                    df_list.append(df)
-                except Exception as ex:
-                    print(ex)
-
-                try:
-                    df = pd.DataFrame(read_jsonl(os.path.join(root, exp, ckpt, "rtllm_0_1.jsonl_results.jsonl")))
-                    df['step'] = int(ckpt.split('step=')[1].split('-')[0])
-                    df['benchmark'] = "rtllm"
-                    df['exp'] = exp
-                    df_list.append(df)
-                except Exception as ex:
-                    print(ex)
-
-    df = pd.concat(df_list)
-    df = df.drop_duplicates(subset=['task_id', 'completion'])
+    from LLMInstruct.checkpoints import read_checkpoints
+
+    # result files are read and their completions post-processed in a process pool
+    df = read_checkpoints(exp_path, workers=args.workers)
     return postprocess_data(df)
 
 
 def postprocess_data(df):
-    completion_list = []
-    prompt_list = []
+    import pandas as pd
 
-    for idx, row in df.iterrows():
-        completion = post_process_completion(row.completion, remove_header=True, rtllm=(row.benchmark=="rtllm"))
-        prompt = benchmark_lookup[row.benchmark][row.task_id]['prompt']
-        completion_list.append(completion)
-        prompt_list.append(prompt)
+    registry = benchmarks()
+    prompts = pd.concat([
+        pd.DataFrame({
+            'benchmark': benchmark,
+            'task_id': registry.table(benchmark).column('task_id').to_pandas(),
+            'prompt': registry.table(benchmark).column('prompt').to_pandas(),
+        })
+        for benchmark in ('machine', 'human', 'rtllm')
+    ]).drop_duplicates(['benchmark', 'task_id'], keep='last')
+    return df.drop(columns=['prompt'], errors='ignore').merge(prompts, on=['benchmark', 'task_id'], how='left')
 
-    df['completion'] = completion_list
-    df['prompt'] = prompt_list
-    return df
 
+def read_df(cache_dir: str = "checkpoints"):
+    from LLMInstruct.checkpoints import CheckpointCache
 
-def read_df(cache_file: str = "cache.csv"):
-    cache_path = os.path.join(args.cache_path, cache_file)
-    if os.path.exists(cache_path):
-        print(f'read dataframe from cache {cache_path}')
-        df = pd.read_csv(cache_path)
-    else:
-        df = read_checkpoint(args.exp_path)
-        print(f'read dataframe from experiment directory {args.exp_path}')
-        df.to_csv(cache_path, index=False)
-        print(f'write dataframe to cache {cache_path}')
-    return df
-
-
-def split_difficulty(dff):
-    easy = set()
-    hard = set()
-    soso = set()
-
-    for task_id, sdf in dff.groupby('task_id'):
-        passrate = sdf.passed.mean()
-        if passrate > 0.9:
-            easy.add(task_id)
-        elif passrate < 0.2:
-            hard.add(task_id)
-        else:
-            soso.add(task_id)
+    # only result files that are new or changed since the last run are read again
+    cache = CheckpointCache(os.path.join(args.cache_path, cache_dir))
+    print(f'read dataframe from {args.exp_path} through cache {cache.cache_dir}')
+    return postprocess_data(cache.read(args.exp_path, workers=args.workers))
+
+
+TRAJECTORY_KEYS = ['exp', 'benchmark', 'task_id']
+
+
+def split_difficulty(df):
+    """
+    Difficulty of each (exp, benchmark, task_id) from its pass rate over all steps.
+    """
+    import numpy as np
+    import pandas as pd
+
+    passrate = df.groupby(TRAJECTORY_KEYS).passed.mean()
+    difficulty = np.select([passrate > 0.9, passrate < 0.2], ['easy', 'hard'], 'soso')
+    return pd.Series(difficulty, index=passrate.index, name='difficulty')
+
+
+def mine_trajectories(df, pass_threshold: float = 0.2):
+    """
+    Failing-sample candidates of every (exp, benchmark, task_id, step) whose
+    pass rate is below `pass_threshold`, grouped by task_id as
+    (prompt, error, correct, exp, benchmark, difficulty, task_id) tuples.
+    """
+    keys = TRAJECTORY_KEYS + ['step']
+    passrate = df.groupby(keys).passed.mean().rename('step_passrate')
 
-    return easy, soso, hard
+    failing = df[df.passed == False].drop_duplicates(keys + ['completion'])
+    failing = failing.join(passrate, on=keys).join(split_difficulty(df), on=TRAJECTORY_KEYS)
+    failing = failing[failing.step_passrate < pass_threshold].sort_values(keys, kind='stable')
 
+    registry = benchmarks()
+    report_dict = defaultdict(list)
+    for prompt, error, exp, benchmark, difficulty, task_id in zip(
+        failing.prompt, failing.completion, failing.exp, failing.benchmark, failing.difficulty, failing.task_id
+    ):
+        correct = registry.lookup(benchmark, task_id, 'canonical_solution')
+        report_dict[task_id].append((prompt, error, correct, exp, benchmark, difficulty, task_id))
+    return report_dict
 
-def run_trajectory(df, queue, exp, benchmark, difficulty, task_id):
-    report_list = []
-    for step in sorted(df.step.unique()):
-        sdf = df[df.step == step]
-        passrate = sdf.passed.mean()
-        if passrate < 0.2:
-            prompt = sdf.prompt.values[0]
-            error = sdf[sdf.passed == False].sample(1).completion.values[0]
-            correct = problem_lookup[(task_id, benchmark)]
-            report_list.append((prompt, error, correct, exp, benchmark, difficulty, task_id))
-    return report_list
 
 def parse(response_text: str):
     if response_text is None:
@@ -191,86 +141,75 @@ def parse(response_text: str):
             return None
         return response_text[st:ed].strip()
     
-def self_consist(report: dict, retry: int = 3):
+async def self_consist(client: "AsyncOpenAI", report: dict, retry: int = 3):
 
     prompt = report['problem']
     error = report['error']
     reason = report['reason']
 
-    for _ in range(retry):
-        try:
-            from openai import OpenAI
-            client = OpenAI(
-                base_url = "https://integrate.api.nvidia.com/v1",
-                api_key = os.environ.get('API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC')
-            )
-
-            problem = f"""
-            Here is an Verilog spec:
-            ```
-            {prompt}
-            ```
+    problem = f"""
+    Here is an Verilog spec:
+    ```
+    {prompt}
+    ```
 
-            Here is an erroneous implementation:
-            ```
-            {error}
-            ```
+    Here is an erroneous implementation:
+    ```
+    {error}
+    ```
 
-            Here is the error explanation:
-            ```
-            {reason}
-            ```
+    Here is the error explanation:
+    ```
+    {reason}
+    ```
 
-            Now give me the correct code. Need to be complete different from the erroneous implementation.
-            """
+    Now give me the correct code. Need to be complete different from the erroneous implementation.
+    """
 
-            completion = client.chat.completions.create(
-                model="nvidia/nemotron-4-340b-instruct",
+    for attempt in range(retry):
+        try:
+            completion = await client.chat.completions.create(
+                model=REPORT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are expert in Verilog. Write the correct code and put it between <CODE> </CODE> tags."},
                     {"role": "user", "content": problem},
                 ],
             )
             return parse(completion.choices[0].message.content)
-        except:
+        except Exception:
             print(traceback.format_exc())
-            raise
+            if attempt == retry - 1:
+                raise
 
 
-def generate_error_report(problem: str, error: str, correct: str, exp: str, benchmark: str, difficulty: str, task_id: str, retry: int = 3):
+async def generate_error_report(client: "AsyncOpenAI", problem: str, error: str, correct: str, exp: str, benchmark: str, difficulty: str, task_id: str, retry: int = 3):
 
-    for _ in range(retry):
-        try:
-            from openai import OpenAI
-            client = OpenAI(
-                base_url = "https://integrate.api.nvidia.com/v1",
-                api_key = os.environ.get('API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC')
-            )
+    prompt = f"""
+    Here is an Verilog spec:
+    ```
+    {problem}
+    ```
+
+    Here is an erroneous implementation:
+    ```
+    {error}
+    ```
+
+    Here is an correct implementation:
+    ```
+    {correct}
+    ```
+
+    What error is made? Generate a detail error report.
+    The error report should be describe the general error type made such that we can study more on this specific knowledge or on how to avoid the error.
+    For example, errors in writing latches or arithmetic shifts.
+    The error report should also be detailed enough to let beginners to repair the erroneous implementation
+    """
 
-            prompt = f"""
-            Here is an Verilog spec:
-            ```
-            {problem}
-            ```
-
-            Here is an erroneous implementation:
-            ```
-            {error}
-            ```
-
-            Here is an correct implementation:
-            ```
-            {correct}
-            ```
-
-            What error is made? Generate a detail error report.
-            The error report should be describe the general error type made such that we can study more on this specific knowledge or on how to avoid the error.
-            For example, errors in writing latches or arithmetic shifts.
-            The error report should also be detailed enough to let beginners to repair the erroneous implementation
-            """
-
-            completion = client.chat.completions.create(
-                model="nvidia/nemotron-4-340b-instruct",
+    for attempt in range(retry):
+        try:
+            completion = await client.chat.completions.create(
+                model=REPORT_MODEL,
                 messages=[
                     {"role": "system", "content": "You are expert in Verilog."},
                     {"role": "user", "content": prompt},
@@ -288,28 +227,75 @@ def generate_error_report(problem: str, error: str, correct: str, exp: str, benc
                 'task_id': task_id,
                 'reason': reason
             }
-        except Exception as ex:
+        except Exception:
             print(traceback.format_exc())
-            raise
+            if attempt == retry - 1:
+                raise
+
+
+def report_key(task_id: str, exp: str, error: str):
+    from LLMInstruct.decontamination.dedup_store import doc_id
+
+    # the same failing sample of a task in an experiment is reported once
+    return (task_id, exp, doc_id(error))
 
 
-def queue_worker(task_queue, result_queue):
-    while True:
+async def generate_reports(sample_list, output_path: str, concurrency: int = 64):
+    """
+    Generate (and self-consist) an error report for every sample with at
+    most `concurrency` requests in flight. Reports are appended to
+    `output_path` as they finish; samples already reported there are
+    reused instead of requested again.
+    """
+    from openai import AsyncOpenAI
+    from tqdm import tqdm
+    from LLMInstruct.utils import read_jsonl
+
+    done = {}
+    if os.path.exists(output_path):
+        for report in read_jsonl(output_path):
+            if not args.self_consist or 'completion' in report:
+                done[report_key(report['task_id'], report['exp'], report['error'])] = report
+
+    client = AsyncOpenAI(base_url=NIM_BASE_URL, api_key=os.environ.get('API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC'))
+    semaphore = asyncio.Semaphore(concurrency)
+    reports = []
+    pbar = tqdm(total=len(sample_list))
+
+    async def generate(sample, f_out):
         try:
-            # Non-blocking get from the queue with timeout
-            args_list = task_queue.get(timeout=1)
-            if args_list is None:
-                break
-            report = generate_error_report(*args_list)
+            report = await generate_error_report(client, *sample)
             if args.self_consist:
-                report['completion'] =self_consist(report)
-            result_queue.put(report)
-            task_queue.task_done()
-        except queue.Empty:
-            continue
+                report['completion'] = await self_consist(client, report)
         except Exception as ex:
-            result_queue.put(ex)
-            task_queue.task_done()
+            print(ex)
+            return
+        finally:
+            semaphore.release()
+            pbar.update(1)
+        f_out.write(json.dumps(report) + "\n")
+        f_out.flush()
+        reports.append(report)
+
+    with open(output_path, "a") as f_out:
+        tasks = set()
+        for sample in sample_list:
+            (prompt, error, correct, exp, benchmark, difficulty, task_id) = sample
+            key = report_key(task_id, exp, error)
+            if key in done:
+                reports.append(done[key])
+                pbar.update(1)
+                continue
+            # bounded: the next request is only created once a slot is free
+            await semaphore.acquire()
+            task = asyncio.create_task(generate(sample, f_out))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    pbar.close()
+    await client.close()
+    return reports
 
 
 def run_shell_cmd(cmd: str):
@@ -323,184 +309,217 @@ def run_shell_cmd(cmd: str):
     return job.stdout.strip()
 
 
+_validation_executor = None
+
+
+@functools.lru_cache(maxsize=None)
+def load_problems(benchmark: str):
+    # problems with testbenches, in the layout check_correctness expects
+    return benchmarks().problems(benchmark, source='evaluation')
+
+
+def validation_executor():
+    # one pool for every validation sweep of the run
+    global _validation_executor
+    if _validation_executor is None:
+        _validation_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _validation_executor
+
+
 def evaluate_functional_correctness(
-    report_list: str,
-    problem_file: str,
-    k: list[int] = [1, 10],
-    n_workers: int = 4,
+    report_list: list,
     timeout: float = 30.0,
     unit_test: bool = False,
     clean_up: bool = True,
     post_process: bool = True,
     remove_header: bool = True,
-    rtllm: bool = False,
+    simulator: str = "iverilog",
 ):
     """
-    Evaluates the functional correctness of generated samples, and writes
-    results to f"{sample_file}_results.jsonl.gz"
+    Evaluates the functional correctness of the completions of reports from
+    any benchmark on the shared process pool. Returns one result per
+    report, in the order of `report_list`.
     """
+    from tqdm import tqdm
+    from LLMInstruct.utils import post_process_completion
+    from LLMInstruct.executor.execution import check_correctness, clean_up_simulation
+
     print(f"post_process: {post_process}")
 
-    problems = read_problems(problem_file)
-
-    # Check the generated samples against test suites.
-    with ProcessPoolExecutor(max_workers=n_workers) as executor:
-
-        futures = []
-        completion_id = Counter()
-        n_samples = 0
-        results = []
-
-        print("Reading samples...")
-        for sample in tqdm(report_list):
-            task_id = sample["task_id"]
-            completion = sample["completion"]
-            if post_process:
-                completion = post_process_completion(completion, remove_header, rtllm)
-
-            future = executor.submit(
-                check_correctness, 
-                problems[task_id],
-                completion,
-                timeout,
-                completion_id[task_id],
-                100 if unit_test else None,
-                rtllm
-            )
-            futures.append(future)
-            completion_id[task_id] += 1
-            n_samples += 1
-
-        print("Running test suites...")
-        for future in tqdm(as_completed(futures), total=len(futures)):
-            result = future.result()
-            results.append(result)
-    
-    if clean_up:
+    executor = validation_executor()
+    futures = {}
+    results = [None] * len(report_list)
+
+    print("Reading samples...")
+    for idx, report in enumerate(tqdm(report_list)):
+        task_id = report["task_id"]
+        rtllm = report["benchmark"] == "rtllm"
+        completion = report["completion"]
+        if completion is None:
+            # no <CODE> block in the self-consist response
+            results[idx] = dict(task_id=task_id, passed=False, result="failed: no completion", completion_id=idx)
+            continue
+        if post_process:
+            completion = post_process_completion(completion, remove_header, rtllm)
+
+        future = executor.submit(
+            check_correctness,
+            load_problems(report["benchmark"])[task_id],
+            completion,
+            timeout,
+            idx,
+            100 if unit_test else None,
+            rtllm,
+            simulator,
+            os.path.join(args.cache_path, "verilator"),
+        )
+        futures[future] = idx
+
+    print("Running test suites...")
+    for future in tqdm(as_completed(futures), total=len(futures)):
+        # as_completed reorders, results are matched back by report index
+        results[futures[future]] = future.result()
+
+    if clean_up and futures:
         clean_up_simulation()
 
     return results
 
 def validate_self_consist(report_list):
+    # all benchmarks in one sweep, so the pool stays busy until the last report
+    return evaluate_functional_correctness(report_list, simulator=args.simulator)
 
-    results = []
-    results += evaluate_functional_correctness(
-        [i for i in report_list if i['benchmark'] == 'human'],
-        "./dataset/benchmark/VerilogEval_Human.jsonl"
-    )
-    results += evaluate_functional_correctness(
-        [i for i in report_list if i['benchmark'] == 'machine'],
-        "./dataset/benchmark/VerilogEval_Machine.jsonl"
-    )
-    results += evaluate_functional_correctness(
-        [i for i in report_list if i['benchmark'] == 'rtllm'],
-        "./dataset/benchmark/rtllm.jsonl",
-        rtllm=True
+
+def parallel_deduplication(report_dict, threshold: float = 0.9, num_perm: int = 128):
+    """
+    Drop near-duplicate (error, correct) pairs within each task. Signatures
+    of all pairs are computed in one batch over a process pool; a pair is
+    then kept unless it shares an LSH band with a pair kept before it.
+    """
+    from datasketch.lsh import _optimal_param
+    from LLMInstruct.decontamination.similarity_filter import minhash_batch
+    from LLMInstruct.decontamination.dedup_store import band_hashes
+
+    rows = [(task_id, row) for task_id, trajectory in report_dict.items() for row in trajectory]
+    signatures = minhash_batch(
+        [f"{error}\n\n{correct}" for _, (prompt, error, correct, *_) in rows],
+        num_perm=num_perm,
+        workers=min(args.workers, os.cpu_count() or 1),
     )
-    return results
+    b, r = _optimal_param(threshold, num_perm, 0.5, 0.5)
 
+    deduped_report_dict = {task_id: [] for task_id in report_dict}
+    seen = defaultdict(set)
+    for (task_id, row), m in zip(rows, signatures):
+        bands = set(enumerate(band_hashes(m, b, r)))
+        if seen[task_id].isdisjoint(bands):
+            seen[task_id].update(bands)
+            deduped_report_dict[task_id].append(row)
 
-def process_dedup(task_id, trajectory):
-    jaccard_filter = JaccardFilter(threshold=0.9)
-    deduped_trajectory = []
-    for row in trajectory:
-        (prompt, error, correct, exp, benchmark, difficulty, task_id) = row
-        data = f"{error}\n\n{correct}"
-        if jaccard_filter.validate(data):
-            jaccard_filter.add(data)
-            deduped_trajectory.append(row)
-    return task_id, deduped_trajectory
-
-
-def parallel_deduplication(report_dict):
-    deduped_report_dict = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=156) as executor:
-        futures = []
-        before, after = 0, 0
-        for task_id, trajectory in report_dict.items():
-            futures.append(executor.submit(process_dedup, task_id, trajectory))
-            before += len(trajectory)
-        
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
-            task_id, deduped_trajectory = future.result()
-            deduped_report_dict[task_id] = deduped_trajectory
-            after += len(deduped_trajectory)
-
-        print(f"Deduplication: before {before} after {after}")
+    print(f"Deduplication: before {len(rows)} after {sum(len(i) for i in deduped_report_dict.values())}")
     return deduped_report_dict
 
 
-def run_exp_benchmark(df, task_queue, result_queue, target_number:int, iters: int = 10):
+CANDIDATE_FIELDS = ('problem', 'error', 'correct', 'exp', 'benchmark', 'difficulty', 'task_id')
+
+
+def load_candidates(df):
+    """
+    Deduplicated failing-sample candidates of every task and the
+    fingerprint of the checkpoint DataFrame they were mined from. They are
+    mined once per distinct DataFrame and kept under --cache_path.
+    """
+    import pandas as pd
+    from LLMInstruct.utils import read_jsonl, write_jsonl
+
+    columns = ['exp', 'benchmark', 'task_id', 'step', 'passed', 'completion']
+    fingerprint = hashlib.blake2b(
+        pd.util.hash_pandas_object(df[columns], index=False).values.tobytes(), digest_size=8
+    ).hexdigest()
+    cache_path = os.path.join(args.cache_path, f'candidates.{fingerprint}.jsonl')
+
+    report_dict = defaultdict(list)
+    if os.path.exists(cache_path):
+        print(f'read candidates from cache {cache_path}')
+        for row in read_jsonl(cache_path):
+            report_dict[row['task_id']].append(tuple(row[k] for k in CANDIDATE_FIELDS))
+        return report_dict, fingerprint
+
+    # every distinct failing sample of a low pass-rate step is a candidate
+    report_dict = parallel_deduplication(mine_trajectories(df))
+    write_jsonl(f'{cache_path}.tmp', [dict(zip(CANDIDATE_FIELDS, row)) for rows in report_dict.values() for row in rows])
+    os.replace(f'{cache_path}.tmp', cache_path)
+    print(f'write candidates to cache {cache_path}')
+    return report_dict, fingerprint
+
 
-    temp_dir = os.path.join(args.temp, str(os.getpid()))
-    os.makedirs(temp_dir)
+def draw_samples(report_dict, error_report, used: set, target_number: int, per_task: int = 10):
+    """
+    Draw at most `per_task` unused candidates of every task that still has
+    fewer than `target_number` reports; drawn candidates are marked used.
+    """
+    import numpy as np
 
+    sample_list = []
+    for task_id, candidates in report_dict.items():
+        number_still_need = min(target_number - len(error_report[task_id]), per_task)
+        if number_still_need <= 0:
+            continue
+        unused = [row for row in candidates if report_key(row[6], row[3], row[1]) not in used]
+        np.random.shuffle(unused)
+        for row in unused[:number_still_need]:
+            used.add(report_key(row[6], row[3], row[1]))
+            sample_list.append(row)
+    return sample_list
+
+
+def run_exp_benchmark(df, target_number:int, iters: int = 10):
+    from LLMInstruct.utils import read_jsonl, write_jsonl
+
+    report_dict, fingerprint = load_candidates(df)
+    print(f'{sum(len(i) for i in report_dict.values())} candidates')
+
+    # append-only logs of this and earlier runs: drawn samples and accepted reports. They are
+    # kept per candidate set and validation setup, so a run over other checkpoints starts fresh
+    run_id = hashlib.blake2b(
+        f'{fingerprint}:{args.self_consist}:{args.simulator}'.encode(), digest_size=8
+    ).hexdigest()
+    run_path = os.path.join(args.temp, f'run.{run_id}')
+    os.makedirs(run_path, exist_ok=True)
+    sample_path = os.path.join(run_path, 'samples.jsonl')
+    validated_path = os.path.join(run_path, 'validated_reports.jsonl')
+    stream_path = os.path.join(args.output, 'generated_reports.jsonl')
+
+    # reports accepted by earlier runs count toward target_number and their samples are used
     error_report = defaultdict(list)
+    used = set()
+    if os.path.exists(validated_path):
+        for report in read_jsonl(validated_path):
+            error_report[report['task_id']].append(report)
+            used.add(report_key(report['task_id'], report['exp'], report['error']))
+        print(f'resume from {validated_path}')
+
+    report_list, valid_list = [], []
     for _ in range(iters):
 
         print(f'{_} iterations: {sum([len(i) for i in error_report.values()])} reports')
-        os.makedirs(os.path.join(temp_dir, str(_)))
-
-        cnt = 0
-        report_dict = defaultdict(list)
-        for exp, expdf in tqdm(df.groupby('exp')):
-            for benchmark, benchdf in expdf.groupby('benchmark'):
-                easy, soso, hard = split_difficulty(benchdf)
-                difficulty_levels = {**{tid: 'easy' for tid in easy}, **{tid: 'soso' for tid in soso}, **{tid: 'hard' for tid in hard}}
-                for task_id in benchdf.task_id.values:
-                    difficulty = difficulty_levels[task_id]
-                    trajectory = run_trajectory(benchdf[benchdf.task_id == task_id], queue, exp, benchmark, difficulty, task_id)
-                    report_dict[task_id] += trajectory
-                    cnt += len(trajectory)
-
-        print(f'{cnt} total trajectories')
-
-        # deduplicate each task
-        report_dict = parallel_deduplication(report_dict)
-        with open(os.path.join(temp_dir, str(_), "report_dict.json"), "w") as f:
-            print(f'output report dict at {os.path.join(temp_dir, str(_), "report_dict.json")}')
-            json.dump(report_dict, f)
 
         # sample each task and control numbers
-        sample_list = []
-        for task_id, report_list in tqdm(report_dict.items()):
-            number_still_need = target_number - len(error_report[task_id])
-            if number_still_need <= 0 or len(report_list) <= 0:
-                continue
-            np.random.shuffle(report_list)
-            number_still_need = min(number_still_need, 10)
-            selected_report_list = report_list[:number_still_need]
-            for i in selected_report_list:
-                # task_queue.put(i)
-                sample_list.append(i)
-        print(f'{len(sample_list)} job ready')
-        with open(os.path.join(temp_dir, str(_), "sample_list.json"), "w") as f:
-            print(f'output sample list at {os.path.join(temp_dir, str(_), "sample_list.json")}')
-            json.dump(sample_list, f)
-
-        # submit jobs
-        for i in tqdm(sample_list):
-            task_queue.put(i)
-        print(f'{len(sample_list)} job summitted')
-        task_queue.join()
-
-        # Collect results
-        report_list = []
-        with tqdm(total=len(sample_list)) as pbar:
-            while not result_queue.empty():
-                report = result_queue.get()
-                pbar.update(1)
-                if isinstance(report, dict):
-                    report_list.append(report)
-                else:
-                    print(report)
+        sample_list = draw_samples(report_dict, error_report, used, target_number)
+        if not sample_list:
+            print('no unused candidates left for tasks under the target number')
+            break
+        write_jsonl(sample_path, [dict(iteration=_, **dict(zip(CANDIDATE_FIELDS, row))) for row in sample_list], append=True)
+        print(f'{len(sample_list)} job ready, logged at {sample_path}')
+
+        # generate reports, streamed to disk as they finish
+        print(f'{len(sample_list)} job summitted, streaming reports to {stream_path}')
+        report_list = asyncio.run(generate_reports(sample_list, stream_path, args.concurrency))
         print(f'{len(report_list)} report recieved')
-        with open(os.path.join(temp_dir, str(_), "report_list.json"), "w") as f:
-            print(f'output report list at {os.path.join(temp_dir, str(_), "report_list.json")}')
-            json.dump(report_list, f)
 
         # validate
         valid_list = []
+        accepted = []
         if args.self_consist:
             cnt = 0
             valid_list = validate_self_consist(report_list)
@@ -512,67 +531,56 @@ def run_exp_benchmark(df, task_queue, result_queue, target_number:int, iters: in
                     report['result'] = valid['result']
                     report['passed'] = valid['passed']
                     error_report[task_id].append(report)
+                    accepted.append(report)
             print(f"{cnt}/{len(valid_list)} passed")
-            with open(os.path.join(temp_dir, str(_), "valid_list.json"), "w") as f:
-                print(f'output valid list at {os.path.join(temp_dir, str(_), "valid_list.json")}')
-                json.dump(valid_list, f)
         else:
             for report in report_list:
                 task_id = report['task_id']
                 report['passed'] = report['result'] = None
                 error_report[task_id].append(report)
+                accepted.append(report)
 
-        print(f'Output error report to {os.path.join(temp_dir, str(_), f"error_report.jsonl")}')
-        write_jsonl(os.path.join(temp_dir, str(_), f"error_report.jsonl"), [report for report in report_list])
+        write_jsonl(validated_path, accepted, append=True)
+        print(f'{len(accepted)} reports appended to {validated_path}')
 
     return error_report, report_list, valid_list
 
 
 
-problem_df, problem_lookup, benchmark_lookup, prompt_lookup = read_benchmark()
-
-
 def main():
-    task_queue = queue.Queue()
-    result_queue = queue.Queue()
-    num_workers = args.workers
+    from LLMInstruct.utils import write_jsonl
+
+    registry = benchmarks()
     target_number = args.num_samples
     df = read_df()
 
-    # Start worker threads
-    workers = []
-    for _ in range(num_workers):
-        worker = threading.Thread(target=queue_worker, args=(task_queue, result_queue))
-        worker.start()
-        workers.append(worker)
-
-    try:
-        error_report, report_list, valid_list = run_exp_benchmark(df, task_queue, result_queue, target_number, iters=args.iters)
-
-        tmp = []
-        for task_id, report_list in error_report.items():
-            for report in report_list:
-                report = deepcopy(report)
-                if not args.self_consist or report['passed']:
-                    benchmark = report['benchmark']
-                    task_id = report['task_id']
-                    prompt = prompt_lookup[benchmark][task_id]
-                    report['prompt'], report['problem'] = report['problem'], prompt
-                    report['error'] = report['prompt'] + report['error']
-                    report['correct'] = report['prompt'] + report['correct']
-                    tmp.append(report)
-        write_jsonl(os.path.join(args.output, 'error_report.jsonl'), tmp)
-    finally:
-        # Stop workers
-        for _ in range(num_workers):
-            task_queue.put(None)
-
-        for worker in workers:
-            worker.join()
-
+    error_report, report_list, valid_list = run_exp_benchmark(df, target_number, iters=args.iters)
 
-if __name__ == "__main__":
+    tmp = []
+    for task_id, report_list in error_report.items():
+        for report in report_list:
+            report = deepcopy(report)
+            if not args.self_consist or report['passed']:
+                benchmark = report['benchmark']
+                task_id = report['task_id']
+                prompt = registry.lookup(benchmark, task_id, 'detail_description', source='descriptions')
+                report['prompt'], report['problem'] = report['problem'], prompt
+                report['error'] = report['prompt'] + report['error']
+                report['correct'] = report['prompt'] + report['correct']
+                tmp.append(report)
+    write_jsonl(os.path.join(args.output, 'error_report.jsonl'), tmp)
+    if _validation_executor is not None:
+        _validation_executor.shutdown()
+
+
+def cli(argv=None):
+    global args
+    args = build_parser().parse_args(argv)
     os.makedirs(args.output, exist_ok=True)
     os.makedirs(args.temp, exist_ok=True)
     os.makedirs(args.cache_path, exist_ok=True)
-    main()
\ No newline at end of file
+    main()
+
+
+if __name__ == "__main__":
+    cli()
\ No newline at end of file
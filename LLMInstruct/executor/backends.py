@@ -0,0 +1,263 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import shutil
+import logging
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from LLMInstruct.executor.diagnostics import parse_compiler_log, parse_quartus, has_errors, error_classes
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_command(cmd: str, timeout: float) -> Tuple[str, str]:
+    """
+    Thread-safe counterpart of `verilog_executor.execute`: relies on the
+    subprocess timeout instead of SIGALRM, which only works in the main thread.
+    """
+    try:
+        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            out, err = p.communicate(timeout=timeout)
+            out, err = out.decode("utf-8", errors="replace"), err.decode("utf-8", errors="replace")
+        except subprocess.TimeoutExpired:
+            try:
+                p.kill()
+            except Exception:
+                # os.kill is disabled by reliability_guard, the parent kills the worker instead
+                pass
+            out = err = "timed out"
+    except BaseException as e:
+        out = err = f"failed: {e}"
+    return out, err
+
+
+class CompilerBackend(ABC):
+
+    name: str = ""
+    executable: str = ""
+    version_cmd: str = ""
+    # diagnostics parser used for the log
+    tool: str = "iverilog"
+    timeout: float = 10
+
+    @abstractmethod
+    def compile(self, filename: str) -> str:
+        """Compile an already written source file and return the compiler log."""
+        pass
+
+    def probe(self) -> Optional[dict]:
+        path = shutil.which(self.executable)
+        if path is None:
+            return None
+        version = ""
+        if self.version_cmd:
+            out, err = run_command(self.version_cmd, 10)
+            version = next((line.strip() for line in (out + err).splitlines() if line.strip()), "")
+        return dict(path=path, version=version)
+
+    def check(self, filename: str) -> dict:
+        log = self.compile(filename)
+        diagnostics = parse_compiler_log(log, self.tool)
+        return dict(
+            passed=not has_errors(diagnostics),
+            compiler_log=log,
+            diagnostics=[d.to_dict() for d in diagnostics],
+            error_classes=error_classes(diagnostics),
+        )
+
+
+class IverilogBackend(CompilerBackend):
+
+    name = "iverilog"
+    executable = "iverilog"
+    version_cmd = "iverilog -V 2>&1 | head -n 1"
+    tool = "iverilog"
+
+    def compile(self, filename: str, top: str = "") -> str:
+        extra_cmd = f"-s {top}" if top else ""
+        out, err = run_command(
+            f"iverilog -Wall -Winfloop -Wno-timescale -g2012 {extra_cmd} -o test.vvp {filename}",
+            self.timeout,
+        )
+        return err
+
+
+class QuartusBackend(CompilerBackend):
+
+    name = "quartus"
+    # users should replace quartus_map to correct path of executable file
+    executable = "quartus_map"
+    version_cmd = "quartus_map --version"
+    tool = "quartus"
+    timeout = 30
+
+    def compile(self, filename: str) -> str:
+        with open("top_module.qsf", "w") as f:
+            f.write(f"set_global_assignment -name SYSTEMVERILOG_FILE {filename}")
+        out, err = run_command(
+            f"quartus_map --effort=fast --parallel=4 --read_settings_files=on --write_settings_files=off top_module -c top_module | grep '^Error'",
+            self.timeout,
+        )
+        diagnostics = parse_quartus(out)
+        if not diagnostics:
+            return out
+        return "\n".join(f"Error ({d.code}): {d.message}" for d in diagnostics if d.severity == "error")
+
+
+class VCSBackend(CompilerBackend):
+
+    name = "vcs"
+    executable = "vcs"
+    version_cmd = "vcs -ID"
+    tool = "vcs"
+    timeout = 20
+
+    def compile(self, filename: str) -> str:
+        out, err = run_command(f"vcs -j8 +v2k -sverilog -q -full64 {filename}", self.timeout)
+        return out
+
+
+class ModelSimBackend(CompilerBackend):
+
+    name = "modelsim"
+    # users should replace vlog to correct path of executable file
+    executable = "vlog"
+    version_cmd = "vlog -version"
+    tool = "modelsim"
+
+    def compile(self, filename: str) -> str:
+        out, err = run_command(f"vlog -sv -quiet {filename}", self.timeout)
+        return out
+
+
+class VerilatorBackend(CompilerBackend):
+
+    name = "verilator"
+    executable = "verilator"
+    version_cmd = "verilator --version"
+    tool = "verilator"
+
+    def compile(self, filename: str) -> str:
+        # lint only: parse and elaborate without generating C++, fast enough to run locally
+        out, err = run_command(f"verilator --lint-only -Wall -Wno-fatal -Wno-DECLFILENAME {filename}", self.timeout)
+        return err
+
+
+class FakeBackend(CompilerBackend):
+    """
+    Stand-in backend that needs no EDA tool, e.g. for testing the pipeline
+    locally. Returns `log` (iverilog format) for every source.
+    """
+
+    name = "fake"
+    tool = "iverilog"
+
+    def __init__(self, log: str = "", name: str = "fake"):
+        self.log = log
+        self.name = name
+
+    def probe(self) -> Optional[dict]:
+        return dict(path="", version="fake")
+
+    def compile(self, filename: str) -> str:
+        return self.log
+
+
+BACKENDS: Dict[str, CompilerBackend] = {}
+_PROBED: Dict[str, Optional[dict]] = {}
+_PROBE_LOCK = threading.Lock()
+
+
+def register_backend(backend: CompilerBackend):
+    BACKENDS[backend.name] = backend
+    with _PROBE_LOCK:
+        _PROBED.pop(backend.name, None)
+    return backend
+
+
+for _backend in (IverilogBackend(), QuartusBackend(), VCSBackend(), ModelSimBackend(), VerilatorBackend(), FakeBackend()):
+    register_backend(_backend)
+
+
+def probe_backends(refresh: bool = False) -> Dict[str, Optional[dict]]:
+    """
+    Probe installed tools once and cache their path/version; None marks a
+    backend that is not available on this machine.
+    """
+    with _PROBE_LOCK:
+        for name, backend in BACKENDS.items():
+            if refresh or name not in _PROBED:
+                _PROBED[name] = backend.probe()
+                if _PROBED[name] is None:
+                    logger.debug(f"Compiler backend {name} not available.")
+        return dict(_PROBED)
+
+
+def available_backends() -> List[str]:
+    return [name for name, info in probe_backends().items() if info is not None]
+
+
+def get_backend(name: str) -> CompilerBackend:
+    if name not in BACKENDS:
+        raise Exception(f"Not support {name} compiler backend.")
+    return BACKENDS[name]
+
+
+def merge_verdicts(results: Dict[str, dict], mode: str = "all") -> bool:
+    """
+    all: every backend must pass; any: at least one; majority: more than half.
+    """
+    verdicts = [result["passed"] for result in results.values()]
+    if not verdicts:
+        return False
+    if mode == "any":
+        return any(verdicts)
+    if mode == "majority":
+        return sum(verdicts) * 2 > len(verdicts)
+    return all(verdicts)
+
+
+def run_backends(filename: str, names: Sequence[str], mode: str = "all") -> dict:
+    """
+    Run several backends concurrently on the same written source file and
+    merge their verdicts.
+    """
+    info = probe_backends()
+    results = {}
+    for name in names:
+        get_backend(name)
+        if info.get(name) is None:
+            results[name] = dict(passed=False, compiler_log=f"{name} is not installed.", diagnostics=[], error_classes=[], skipped=True)
+
+    runnable = [name for name in names if name not in results]
+    if len(runnable) == 1:
+        results[runnable[0]] = get_backend(runnable[0]).check(filename)
+    elif runnable:
+        with ThreadPoolExecutor(max_workers=len(runnable)) as executor:
+            futures = {name: executor.submit(get_backend(name).check, filename) for name in runnable}
+            for name, future in futures.items():
+                results[name] = future.result()
+
+    checked = {name: result for name, result in results.items() if not result.get("skipped")}
+    if len(names) == 1:
+        compiler_log = results[names[0]]["compiler_log"]
+    else:
+        compiler_log = "\n".join(f"[{name}]\n{results[name]['compiler_log']}" for name in names)
+    classes = []
+    for name in names:
+        classes += [c for c in results[name]["error_classes"] if c not in classes]
+    return dict(
+        passed=merge_verdicts(checked, mode),
+        compiler_log=compiler_log,
+        diagnostics=[d for name in names for d in results[name]["diagnostics"]],
+        error_classes=classes,
+        backends=results,
+    )
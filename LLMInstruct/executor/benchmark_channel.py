@@ -0,0 +1,74 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+"""
+Fork and result-channel overhead of the executors, before (one
+multiprocessing.Manager per check) and after (one Pipe per check).
+
+    python LLMInstruct/executor/benchmark_channel.py --n 1000
+"""
+
+import time
+import argparse
+import multiprocessing
+
+from LLMInstruct.executor.execution import execute_in_process
+from LLMInstruct.executor.verilog_executor import check_correctness
+
+
+def manager_check(timeout: float = 10):
+    # the channel check_correctness used before
+    def unsafe_execute():
+        result["passed"] = True
+        result["compiler_log"] = ""
+
+    manager = multiprocessing.Manager()
+    result = manager.dict()
+
+    p = multiprocessing.Process(target=unsafe_execute)
+    p.start()
+    p.join(timeout=timeout + 1)
+    if p.is_alive():
+        p.kill()
+    return dict(result)
+
+
+def pipe_check(timeout: float = 10):
+    def unsafe_execute():
+        result["passed"] = True
+        result["compiler_log"] = ""
+
+    result = {}
+    return execute_in_process(unsafe_execute, result, timeout + 1)
+
+
+def executor_check(timeout: float = 10):
+    # full verilog_executor path with the fake backend, no EDA tool needed
+    return check_correctness("module top_module(); endmodule", timeout, compile_only="fake")
+
+
+def bench(name: str, func, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        result = func()
+        assert result["passed"]
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {n} checks  {elapsed:8.2f}s  {1000 * elapsed / n:8.2f} ms/check")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1000, help="number of checks per channel")
+    args = parser.parse_args()
+
+    before = bench("Manager (before)", manager_check, args.n)
+    after = bench("Pipe (after)", pipe_check, args.n)
+    bench("check_correctness(fake)", executor_check, args.n)
+    print(f"speedup {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
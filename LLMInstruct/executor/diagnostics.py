@@ -0,0 +1,332 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import re
+import json
+from collections import Counter, defaultdict
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    tool: str
+    severity: str  # "error" | "warning" | "info"
+    message: str
+    file: Optional[str] = None
+    line: Optional[int] = None
+    code: Optional[str] = None
+
+    @property
+    def error_class(self) -> str:
+        # tools with numbered messages are grouped by code, the rest by normalized text
+        if self.code:
+            return f"{self.tool}:{self.code}"
+        return f"{self.tool}:{normalize_message(self.message)}"
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["error_class"] = self.error_class
+        return data
+
+    def format(self) -> str:
+        location = ""
+        if self.file is not None:
+            location = f"{self.file}:{self.line}: " if self.line is not None else f"{self.file}: "
+        code = f" ({self.code})" if self.code else ""
+        return f"{location}{self.severity}{code}: {self.message}"
+
+
+_QUOTED_ID = re.compile(r"``[^']*''|'[^'\s]*'|\"[^\"]*\"|`[^`'\s]*'")
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Replace identifiers, literals and numbers so that messages about
+    different signals fall into the same class.
+    """
+    message = _QUOTED_ID.sub("<id>", message)
+    message = _NUMBER.sub("<n>", message)
+    message = _SPACES.sub(" ", message)
+    return message.strip().rstrip(".").lower()
+
+
+def _fallback(tool: str, line: str) -> Optional[Diagnostic]:
+    # unstructured lines (e.g. "I give up.", "2 error(s) during elaboration.")
+    lower = line.lower()
+    if "error" in lower or "give up" in lower:
+        return Diagnostic(tool, "error", line.strip())
+    return None
+
+
+_IVERILOG = re.compile(r"^(?P<file>[^:\s]+):(?P<line>\d+):\s*(?:(?P<severity>error|warning|sorry)\s*:\s*)?(?P<message>.*)$")
+_IVERILOG_SUMMARY = re.compile(r"^\d+ error\(s\)|^I give up\.?$|^Elaboration failed|^\s*\.\.\.")
+
+
+def parse_iverilog(log: str) -> List[Diagnostic]:
+    diagnostics = []
+    for line in log.splitlines():
+        if not line.strip():
+            continue
+        match = _IVERILOG.match(line.strip())
+        if match:
+            severity = match.group("severity") or ""
+            message = match.group("message").strip()
+            if severity == "warning":
+                pass
+            elif severity in ("error", "sorry") or "error" in message.lower():
+                severity = "error"
+            else:
+                # "foo.sv:3: syntax error" style lines carry no severity prefix
+                severity = "info"
+            diagnostics.append(Diagnostic("iverilog", severity, message, match.group("file"), int(match.group("line"))))
+        elif _IVERILOG_SUMMARY.match(line.strip()):
+            # summaries only repeat what the located diagnostics already say,
+            # unless nothing was located at all
+            if not any(d.severity == "error" for d in diagnostics):
+                diagnostics.append(Diagnostic("iverilog", "error", line.strip()))
+        else:
+            diagnostic = _fallback("iverilog", line)
+            if diagnostic is not None:
+                diagnostics.append(diagnostic)
+    return diagnostics
+
+
+_QUARTUS = re.compile(r"^(?P<severity>Error|Critical Warning|Warning|Info)\s*\((?P<code>\d+)\):\s*(?P<message>.*)$")
+_QUARTUS_LOCATION = re.compile(r"\bat (?P<file>[^\s()]+)\((?P<line>\d+)\)")
+
+
+def parse_quartus(log: str) -> List[Diagnostic]:
+    diagnostics = []
+    for line in log.splitlines():
+        match = _QUARTUS.match(line.strip())
+        if not match:
+            continue
+        message = match.group("message")
+        trunc = message.find("Check for and fix")
+        if trunc > 0:
+            message = message[:trunc]
+        file = lineno = None
+        location = _QUARTUS_LOCATION.search(message)
+        if location:
+            file, lineno = location.group("file"), int(location.group("line"))
+        severity = match.group("severity").lower()
+        severity = "warning" if "warning" in severity else severity
+        diagnostics.append(Diagnostic("quartus", severity, message.strip(), file, lineno, match.group("code")))
+    return diagnostics
+
+
+_VCS_HEADER = re.compile(r"^(?P<severity>Error|Warning|Lint|Note)-\[(?P<code>[^\]]+)\]\s*(?P<message>.*)$")
+_VCS_LOCATION = re.compile(r"^\s*\"?(?P<file>[^\s\",]+)\"?,\s*(?P<line>\d+)")
+
+
+def parse_vcs(log: str) -> List[Diagnostic]:
+    diagnostics = []
+    lines = log.splitlines()
+    for i, line in enumerate(lines):
+        match = _VCS_HEADER.match(line.strip())
+        if not match:
+            continue
+        file = lineno = None
+        # the location follows the header within the next couple of lines
+        for follow in lines[i + 1:i + 4]:
+            location = _VCS_LOCATION.search(follow)
+            if location:
+                file, lineno = location.group("file"), int(location.group("line"))
+                break
+        severity = match.group("severity").lower()
+        severity = {"lint": "warning", "note": "info"}.get(severity, severity)
+        diagnostics.append(Diagnostic("vcs", severity, match.group("message").strip(), file, lineno, match.group("code")))
+    return diagnostics
+
+
+_MODELSIM = re.compile(r"^\*\* (?P<severity>Error|Warning|Note)(?: \(suppressible\))?:\s*(?P<message>.*)$")
+_MODELSIM_CODE = re.compile(r"\((?P<code>vlog-\d+)\)\s*")
+_MODELSIM_LOCATION = re.compile(r"(?P<file>[^\s()]+)\((?P<line>\d+)\):\s*")
+
+
+def parse_modelsim(log: str) -> List[Diagnostic]:
+    diagnostics = []
+    for line in log.splitlines():
+        match = _MODELSIM.match(line.strip())
+        if not match:
+            continue
+        message = match.group("message")
+        code = file = lineno = None
+        code_match = _MODELSIM_CODE.search(message)
+        if code_match:
+            code = code_match.group("code")
+            message = message[:code_match.start()] + message[code_match.end():]
+        location = _MODELSIM_LOCATION.search(message)
+        if location:
+            file, lineno = location.group("file"), int(location.group("line"))
+            message = message[:location.start()] + message[location.end():]
+        severity = match.group("severity").lower()
+        severity = "info" if severity == "note" else severity
+        diagnostics.append(Diagnostic("modelsim", severity, message.strip(), file, lineno, code))
+    return diagnostics
+
+
+_VERILATOR = re.compile(r"^%(?P<severity>Error|Warning)(?:-(?P<code>[A-Z0-9_]+))?:\s*(?:(?P<file>[^:\s]+):(?P<line>\d+):(?:\d+:)?\s*)?(?P<message>.*)$")
+
+
+def parse_verilator(log: str) -> List[Diagnostic]:
+    diagnostics = []
+    for line in log.splitlines():
+        match = _VERILATOR.match(line.strip())
+        if not match:
+            continue
+        message = match.group("message").strip()
+        if message.startswith("Exiting due to") and has_errors(diagnostics):
+            continue
+        lineno = int(match.group("line")) if match.group("line") else None
+        diagnostics.append(Diagnostic("verilator", match.group("severity").lower(), message, match.group("file"), lineno, match.group("code")))
+    return diagnostics
+
+
+PARSERS = {
+    "iverilog": parse_iverilog,
+    "quartus": parse_quartus,
+    "vcs": parse_vcs,
+    "modelsim": parse_modelsim,
+    "verilator": parse_verilator,
+}
+
+
+def parse_compiler_log(log: str, tool: str = "iverilog") -> List[Diagnostic]:
+    if not log:
+        return []
+    if tool not in PARSERS:
+        raise Exception(f"Not support {tool} compiler log.")
+    diagnostics = PARSERS[tool](log)
+    if tool != "iverilog" and not diagnostics:
+        # e.g. "timed out" or "failed: ..." from the executor
+        diagnostic = _fallback(tool, log)
+        if diagnostic is not None:
+            diagnostics.append(diagnostic)
+    return diagnostics
+
+
+def has_errors(diagnostics: Iterable[Diagnostic]) -> bool:
+    return any(d.severity == "error" for d in diagnostics)
+
+
+def error_classes(diagnostics: Iterable[Diagnostic]) -> List[str]:
+    """Distinct error classes in order of first appearance."""
+    classes = []
+    for d in diagnostics:
+        if d.severity == "error" and d.error_class not in classes:
+            classes.append(d.error_class)
+    return classes
+
+
+class ErrorClassIndex:
+    """
+    Aggregate index of error classes across a run, mapping each class to
+    the number of occurrences and the ids of the records that hit it.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.records = defaultdict(list)
+        self.examples = {}
+
+    def add(self, record_id, diagnostics: Iterable[Diagnostic]):
+        for d in diagnostics:
+            if d.severity != "error":
+                continue
+            self.counts[d.error_class] += 1
+            if not self.records[d.error_class] or self.records[d.error_class][-1] != record_id:
+                self.records[d.error_class].append(record_id)
+            self.examples.setdefault(d.error_class, d.message)
+
+    def add_classes(self, record_id, classes: Iterable[str]):
+        for error_class in classes:
+            self.counts[error_class] += 1
+            if not self.records[error_class] or self.records[error_class][-1] != record_id:
+                self.records[error_class].append(record_id)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[dict],
+        id_key: str = "index",
+        classes_key: str = "iverilog_error_classes",
+        log_key: str = "iverilog_compiler_log",
+        tool: str = "iverilog",
+    ) -> "ErrorClassIndex":
+        """
+        Build the index from generated records. Records that already carry
+        structured classes are indexed directly, older records fall back to
+        parsing the stored compiler log.
+        """
+        index = cls()
+        for e, record in enumerate(records):
+            record_id = record.get(id_key, e)
+            if classes_key in record and record[classes_key] is not None:
+                index.add_classes(record_id, record[classes_key])
+            elif record.get(log_key):
+                index.add(record_id, parse_compiler_log(record[log_key], tool))
+        return index
+
+    def most_common(self, n: Optional[int] = None):
+        return self.counts.most_common(n)
+
+    def filter(self, error_class: str) -> List:
+        """Record ids that hit the given class, or any class with the given prefix."""
+        if error_class in self.records:
+            return list(self.records[error_class])
+        ids = []
+        for key, record_ids in self.records.items():
+            if key.startswith(error_class):
+                ids += [i for i in record_ids if i not in ids]
+        return ids
+
+    def to_dict(self) -> Dict:
+        return {
+            error_class: {
+                "count": count,
+                "example": self.examples.get(error_class),
+                "records": self.records[error_class],
+            }
+            for error_class, count in self.counts.most_common()
+        }
+
+    def dump(self, filename: str):
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def main():
+    import argparse
+    from LLMInstruct.utils import read_jsonl, write_jsonl
+
+    parser = argparse.ArgumentParser(description="Index compiler error classes of a generation run.")
+    parser.add_argument("--input", required=True, type=str, help="generated jsonl with compiler results")
+    parser.add_argument("--output", required=False, type=str, default="", help="write the error class index as json")
+    parser.add_argument("--tool", required=False, type=str, default="iverilog", help="compiler that produced the logs")
+    parser.add_argument("--error_class", required=False, type=str, default="", help="only keep records hitting this class (prefix)")
+    parser.add_argument("--filtered_output", required=False, type=str, default="", help="write the filtered records to jsonl")
+    parser.add_argument("--top", required=False, type=int, default=20, help="number of classes to print")
+    args = parser.parse_args()
+
+    records = list(read_jsonl(args.input))
+    index = ErrorClassIndex.from_records(records, tool=args.tool)
+    for error_class, count in index.most_common(args.top):
+        print(f"{count:8d}  {error_class}")
+    if args.output:
+        index.dump(args.output)
+    if args.error_class:
+        ids = set(index.filter(args.error_class))
+        selected = [r for e, r in enumerate(records) if r.get("index", e) in ids]
+        print(f"{len(selected)}/{len(records)} records hit {args.error_class}")
+        if args.filtered_output:
+            write_jsonl(args.filtered_output, selected)
+
+
+if __name__ == "__main__":
+    main()
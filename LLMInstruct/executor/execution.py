@@ -14,6 +14,10 @@ import platform
 import signal
 import tempfile
 import glob
+import shutil
+import shlex
+import fcntl
+import hashlib
 
 import subprocess
 import re
@@ -26,15 +30,28 @@ def clean_up_simulation() -> None:
     print("Killing all hanging simulation process.")
     subprocess.run("pkill iverilog", shell=True)
     subprocess.run("pkill vvp", shell=True)
+    subprocess.run("pkill verilator", shell=True)
 
 def check_correctness(problem: Dict, completion: str, timeout: float,
-                      completion_id: Optional[int] = None, unit_test_length: Optional[int] = None, rtllm: bool = False) -> Dict:
+                      completion_id: Optional[int] = None, unit_test_length: Optional[int] = None, rtllm: bool = False,
+                      simulator: str = "iverilog", cache_dir: Optional[str] = None,
+                      build_timeout: float = 120) -> Dict:
     """
     Evaluates the functional correctness of a completion by running the test
     suite provided in the problem. 
     :param completion_id: an optional completion ID so we can match
         the results later even if execution finishes asynchronously.
+    :param simulator: "iverilog", or "verilator" to simulate a compiled C++
+        model, falling back to iverilog for sources Verilator rejects.
+    :param cache_dir: where Verilator keeps built models per task.
+    :param build_timeout: time for a Verilator build on top of `timeout`;
+        a build running longer falls back to iverilog.
     """
+    limit = timeout
+    if simulator == "verilator":
+        # resolved here, os.getcwd is disabled inside the sandboxed worker
+        cache_dir = os.path.abspath(cache_dir or os.path.join(tempfile.gettempdir(), "verilator_cache"))
+        limit = timeout + build_timeout
 
     def unsafe_execute():
 
@@ -69,22 +86,32 @@ def check_correctness(problem: Dict, completion: str, timeout: float,
             try:
 
                 with swallow_io():
-                    with time_limit(timeout):
-                        cmd = "iverilog -Wall -Winfloop -Wno-timescale -g2012 \
-                                    -s tb -o test.vvp {}.sv; vvp -n test.vvp".format(problem["task_id"])
-                       
-                        """
-                        https://stackoverflow.com/questions/1191374/using-module-subprocess-with-timeout
-                        """
-                        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                        timer = Timer(timeout, p.kill)
-                        try:
-                            timer.start()
-                            out, err = p.communicate()
-                        finally:
-                            timer.cancel()
-                            
-                        out, err = out.decode("utf-8"), err.decode("utf-8") 
+                    with time_limit(limit):
+                        simulated = None
+                        if simulator == "verilator":
+                            simulated = verilator_simulate(
+                                "{}.sv".format(problem["task_id"]), verilog_test, problem["test"],
+                                problem["task_id"], cache_dir, rtllm, timeout, build_timeout,
+                            )
+
+                        if simulated is not None:
+                            out, err = simulated
+                        else:
+                            cmd = "iverilog -Wall -Winfloop -Wno-timescale -g2012 \
+                                        -s tb -o test.vvp {}.sv; vvp -n test.vvp".format(problem["task_id"])
+
+                            """
+                            https://stackoverflow.com/questions/1191374/using-module-subprocess-with-timeout
+                            """
+                            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                            timer = Timer(timeout, p.kill)
+                            try:
+                                timer.start()
+                                out, err = p.communicate()
+                            finally:
+                                timer.cancel()
+
+                            out, err = out.decode("utf-8"), err.decode("utf-8")
                         match = re.search(r'Mismatches: ([0-9]*) in ([0-9]*) samples', out)
                         if "syntax error" in err:
                             result.append(f"failed: syntax error. {err}")
@@ -111,14 +138,8 @@ def check_correctness(problem: Dict, completion: str, timeout: float,
             os.rmdir = rmdir
             os.chdir = chdir
             
-    manager = multiprocessing.Manager()
-    result = manager.list()
-
-    p = multiprocessing.Process(target=unsafe_execute)
-    p.start()
-    p.join(timeout=timeout + 1)
-    if p.is_alive():
-        p.kill()
+    result = []
+    result = execute_in_process(unsafe_execute, result, limit + 1)
 
     if not result:
         result.append("timed out")
@@ -131,6 +152,143 @@ def check_correctness(problem: Dict, completion: str, timeout: float,
     )
 
 
+def execute_in_process(target: Callable, state, timeout: float):
+    """
+    Run `target` in a forked process and return the `state` object it filled
+    in (e.g. a result list or dict) through a one-way pipe. Cheaper than a
+    multiprocessing.Manager, which starts a server process per call.
+    Returns an empty object of the same type if the process does not finish
+    within `timeout`.
+    """
+    recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+
+    def run():
+        recv_conn.close()
+        try:
+            target()
+        finally:
+            send_conn.send(state)
+            send_conn.close()
+
+    p = multiprocessing.Process(target=run)
+    p.start()
+    send_conn.close()
+
+    result = type(state)()
+    try:
+        # read before joining, a large payload would block the child on a full pipe
+        if recv_conn.poll(timeout):
+            result = recv_conn.recv()
+    except (EOFError, OSError):
+        pass
+    finally:
+        recv_conn.close()
+
+    p.join(timeout=1)
+    if p.is_alive():
+        p.kill()
+        p.join()
+    return result
+
+
+VERILATOR_FLAGS = "--binary --timing -Wno-fatal -Wno-lint -Wno-style -Wno-TIMESCALEMOD -Wno-STMTDLY --top-module tb"
+
+
+def run_command(cmd: str, timeout: float, env: Optional[Dict] = None):
+    """
+    Run a shell command and return (returncode, stdout, stderr). Under
+    coreutils `timeout` the whole process group (make, g++, the model) is
+    killed when the time is up; os.kill is disabled inside the sandbox.
+    """
+    if shutil.which("timeout") is not None:
+        cmd = f"timeout -k 1 {timeout} sh -c {shlex.quote(cmd)}"
+    p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    return p.returncode, p.stdout.decode("utf-8", errors="replace"), p.stderr.decode("utf-8", errors="replace")
+
+
+@contextlib.contextmanager
+def build_slot(prefix: str):
+    """
+    First unused build directory `{prefix}.{n}`, locked while in use.
+    Concurrent builds of a task each get their own directory, and later
+    builds reuse the objects left in it.
+    """
+    slot = 0
+    while True:
+        path = f"{prefix}.{slot}"
+        os.makedirs(path, exist_ok=True)
+        f = open(f"{path}.lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            slot += 1
+            continue
+        try:
+            yield path
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+        return
+
+
+def verilator_simulate(filename: str, verilog_test: str, test: str, task_id: str,
+                       cache_dir: str, rtllm: bool = False, timeout: float = 30, build_timeout: float = 120):
+    """
+    Build the testbench and candidate into a Verilator C++ model and run it.
+    Each task keeps a pool of build directories under `cache_dir`, so the
+    Verilator runtime and unchanged testbench objects are compiled once per
+    directory and only the candidate's code is rebuilt (through ccache when
+    installed). Built models are also kept by source hash.
+    Returns (out, err) of the model run, or None when Verilator rejects the
+    source or the build exceeds `build_timeout`, and the caller should fall
+    back to iverilog.
+    """
+    if shutil.which("verilator") is None:
+        return None
+
+    test_hash = hashlib.sha256(test.encode()).hexdigest()[:16]
+    source_hash = hashlib.sha256(verilog_test.encode()).hexdigest()[:16]
+    task_dir = os.path.join(cache_dir, str(task_id).replace("/", "_"))
+    binary = os.path.join(task_dir, f"{source_hash}.bin")
+    # the testbench itself uses constructs Verilator cannot build
+    rejected = os.path.join(task_dir, f"{test_hash}.rejected")
+
+    if os.path.exists(rejected):
+        return None
+
+    warnings = ""
+    if not os.path.exists(binary):
+        env = dict(os.environ)
+        if shutil.which("ccache") is not None:
+            env["OBJCACHE"] = "ccache"
+        with build_slot(os.path.join(task_dir, f"obj_{test_hash}")) as build_dir:
+            returncode, _, err = run_command(
+                f"verilator {VERILATOR_FLAGS} -Mdir {shlex.quote(build_dir)} -o Vtb {shlex.quote(filename)}",
+                build_timeout, env,
+            )
+            model = os.path.join(build_dir, "Vtb")
+            if returncode != 0 or not os.path.exists(model):
+                # errors located inside the testbench mean no candidate of this task will build
+                test_lines = test.count("\n") + 1
+                tb_errors = re.findall(r"^%Error[^:]*: {}:([0-9]+):".format(re.escape(filename)), err, re.MULTILINE)
+                if tb_errors and all(int(line) <= test_lines for line in tb_errors):
+                    run_command(f"touch {shlex.quote(rejected)}", timeout)
+                return None
+            # compiler diagnostics fail a candidate like iverilog's stderr, C++ compiler noise does not
+            warnings = "".join(line + "\n" for line in err.splitlines() if line.startswith("%Warning"))
+            # copy then move so concurrent workers never see a partial binary
+            tmp = shlex.quote(f"{binary}.{os.getpid()}")
+            run_command(f"cp {shlex.quote(model)} {tmp} && mv -f {tmp} {shlex.quote(binary)}", timeout)
+            if not os.path.exists(binary):
+                binary = model
+
+    _, out, err = run_command(shlex.quote(binary), timeout)
+    if re.search(r"Mismatches: ([0-9]*) in ([0-9]*) samples", out) or (rtllm and "Passed" in out):
+        return out, warnings + err
+    return None
+
+
 @contextlib.contextmanager
 def time_limit(seconds: float):
     def signal_handler(signum, frame):
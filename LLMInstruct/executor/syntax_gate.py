@@ -0,0 +1,143 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import re
+import logging
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_OR_STRING = re.compile(r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\\n])*\"", re.DOTALL)
+_DEFINE = re.compile(r"^\s*`define\b.*?(?<!\\)$", re.MULTILINE | re.DOTALL)
+_TOKEN = re.compile(r"`?[A-Za-z_][A-Za-z0-9_$]*")
+
+# opening keyword -> closing keywords
+_BLOCKS = {
+    "module": ("endmodule",),
+    "macromodule": ("endmodule",),
+    "begin": ("end",),
+    "case": ("endcase",),
+    "casex": ("endcase",),
+    "casez": ("endcase",),
+    "randcase": ("endcase",),
+    "fork": ("join", "join_any", "join_none"),
+    "generate": ("endgenerate",),
+    "function": ("endfunction",),
+    "task": ("endtask",),
+}
+_CLOSERS = {closer for closers in _BLOCKS.values() for closer in closers}
+# openers that have no body after these, e.g. `extern function`,
+# `import "DPI-C" function` or `wait fork`
+_NO_BODY_PREFIX = {
+    "function": {"extern", "pure", "import", "export"},
+    "task": {"extern", "pure", "import", "export"},
+    "fork": {"wait", "disable"},
+}
+_BRACKETS = {")": "(", "]": "[", "}": "{"}
+# compiled on their own, a source declaring any of these needs no module
+_DESIGN_UNITS = {"module", "macromodule", "interface", "package", "program", "primitive", "class", "checker", "config"}
+# branches of a conditional may each open what a shared tail closes
+_CONDITIONAL = re.compile(r"`(?:ifdef|ifndef|elsif|else|endif)\b")
+
+
+def strip_comments_and_strings(code: str) -> str:
+    code = _COMMENT_OR_STRING.sub(" ", code)
+    return _DEFINE.sub("", code)
+
+
+def precheck(code: str) -> Tuple[bool, str]:
+    """
+    Cheap lexical/structural check of a Verilog candidate. Returns
+    (ok, reason); a rejected candidate is certain to fail compilation,
+    so only unambiguous defects are reported. Block and bracket balance
+    is not checked in sources with preprocessor conditionals.
+    """
+    if code is None or not code.strip():
+        return False, "empty"
+    if "```" in code:
+        return False, "markdown fence"
+
+    text = strip_comments_and_strings(code)
+    if "/*" in text:
+        return False, "unterminated comment"
+
+    tokens = [match.group(0) for match in _TOKEN.finditer(text)]
+    if not _DESIGN_UNITS.intersection(tokens):
+        return False, "no module"
+    if _CONDITIONAL.search(text):
+        return True, ""
+
+    stack = []
+    prev = None
+    for token in tokens:
+        if token in _BLOCKS:
+            if prev not in _NO_BODY_PREFIX.get(token, ()):
+                stack.append(token)
+        elif token in _CLOSERS:
+            if not stack or token not in _BLOCKS[stack[-1]]:
+                expected = _BLOCKS[stack[-1]][0] if stack else None
+                return False, f"unbalanced {token}" + (f", expected {expected}" if expected else "")
+            stack.pop()
+        prev = token
+    if stack:
+        return False, f"missing {_BLOCKS[stack[-1]][0]}"
+
+    brackets = []
+    for char in text:
+        if char in "([{":
+            brackets.append(char)
+        elif char in _BRACKETS:
+            if not brackets or brackets[-1] != _BRACKETS[char]:
+                return False, f"unbalanced {char}"
+            brackets.pop()
+    if brackets:
+        return False, f"unbalanced {brackets[-1]}"
+
+    return True, ""
+
+
+class SyntaxGate:
+    """
+    Prefilter in front of the compiler executor. Candidates rejected here
+    never reach the subprocess pool; `saved` counts the launches avoided.
+    """
+
+    def __init__(self, use_pyverilog: bool = False, log_every: int = 100):
+        import importlib
+        if use_pyverilog and importlib.util.find_spec("pyverilog") is None:
+            logger.warning("pyverilog is not installed, SyntaxGate falls back to the lexical check only.")
+            use_pyverilog = False
+        self.use_pyverilog = use_pyverilog
+        self.log_every = log_every
+        self.checked = 0
+        self.saved = 0
+        self.reasons = Counter()
+        self._lock = threading.Lock()
+
+    def check(self, code: str) -> Tuple[bool, str]:
+        ok, reason = precheck(code)
+        if ok and self.use_pyverilog:
+            from LLMInstruct.utils import valid_module
+            if not valid_module(code):
+                ok, reason = False, "pyverilog parse error"
+
+        with self._lock:
+            self.checked += 1
+            if not ok:
+                self.saved += 1
+                self.reasons[reason.split(",")[0]] += 1
+            if self.log_every and self.checked % self.log_every == 0:
+                logger.info(self.summary())
+        return ok, reason
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(checked=self.checked, saved=self.saved, reasons=dict(self.reasons))
+
+    def summary(self) -> str:
+        return f"SyntaxGate: {self.saved}/{self.checked} compiler launches saved {dict(self.reasons.most_common(5))}"
@@ -24,7 +24,10 @@ from LLMInstruct.executor.execution import (
     TimeoutException,
     WriteOnlyStringIO,
     reliability_guard,
+    execute_in_process,
 )
+from LLMInstruct.executor.diagnostics import parse_compiler_log, has_errors
+from LLMInstruct.executor.backends import get_backend, probe_backends, run_backends
 
 
 def check_correctness(
@@ -34,12 +37,17 @@ def check_correctness(
     completion_id: Optional[int] = None,
     unit_test_length: Optional[int] = None,
     compile_only: bool = False,
+    merge_mode: str = "all",
 ) -> Dict:
     """
     Evaluates the functional correctness of a completion by running the test
     suite provided in the problem.
     :param completion_id: an optional completion ID so we can match
         the results later even if execution finishes asynchronously.
+    :param compile_only: compiler backend name(s), e.g. "iverilog",
+        "iverilog,verilator" or a list; several backends run concurrently.
+    :param merge_mode: how verdicts of several backends are merged
+        ("all", "any" or "majority").
     """
 
     problem = {
@@ -69,18 +77,17 @@ def check_correctness(
             if "wave.vcd" in result:
                 result.pop("wave.vcd")
 
-            compile_func = iverlog_compile
-            if compile_only == "quartus":
-                compile_func = quartus_compile
-            elif compile_only == "vcs":
-                compile_func = vcs_compile
-            elif compile_only == "modelsim":
-                compile_func = modelsim_compile
-
-            out = compile_func(completion, problem["task_id"])
-            result["compiler_log"] = out
-
-            if not verilog_compile_is_correct(out):
+            # write the source once, all backends compile the same file
+            filename = f"{problem['task_id']}.sv"
+            with open(filename, "w") as f:
+                f.write(completion)
+            compiled = run_backends(filename, backend_names(compile_only), merge_mode)
+            result["compiler_log"] = compiled["compiler_log"]
+            result["diagnostics"] = compiled["diagnostics"]
+            result["error_classes"] = compiled["error_classes"]
+            result["backends"] = compiled["backends"]
+
+            if not compiled["passed"]:
                 result["passed"] = False
 
             result["haha"] = compile_only
@@ -107,14 +114,13 @@ def check_correctness(
             os.rmdir = rmdir
             os.chdir = chdir
 
-    manager = multiprocessing.Manager()
-    result = manager.dict()
+    # probe once in the parent so workers inherit the cached tool info
+    probe_backends()
+    for name in backend_names(compile_only):
+        get_backend(name)
 
-    p = multiprocessing.Process(target=unsafe_execute)
-    p.start()
-    p.join(timeout=timeout + 1)
-    if p.is_alive():
-        p.kill()
+    result = {}
+    result = execute_in_process(unsafe_execute, result, timeout + 1)
 
     if not result:
         result = {
@@ -131,20 +137,24 @@ def check_correctness(
     )
 
 
+def backend_names(compile_only) -> list:
+    if not compile_only or compile_only is True:
+        return ["iverilog"]
+    if isinstance(compile_only, str):
+        return [name.strip() for name in compile_only.split(",") if name.strip()]
+    return list(compile_only)
+
+
 def iverlog_compile(verilog_test: str, task_id: str, test: str = ""):
 
-    extra_cmd = ""
+    top = ""
     if test:
         verilog_test = f"{test}\n{verilog_test}"
-        extra_cmd = "-s tb"
+        top = "tb"
 
     with open(f"{task_id}.sv", "w") as f:
         f.write(verilog_test)
-    out, err = execute(
-        f"iverilog -Wall -Winfloop -Wno-timescale -g2012 {extra_cmd} -o test.vvp {task_id}.sv",
-        10,
-    )
-    return err
+    return get_backend("iverilog").compile(f"{task_id}.sv", top=top)
 
 
 def execute(cmd: str, timeout: int):
@@ -170,50 +180,29 @@ def execute(cmd: str, timeout: int):
         return out, err
 
 
-def verilog_compile_is_correct(log: str):
-    log = log.lower()
-
-    if "error" in log or "give up" in log:
-        return False
-
-    return True
+def verilog_compile_is_correct(log: str, tool: str = "iverilog"):
+    return not has_errors(parse_compiler_log(log, tool))
 
 
 def quartus_compile(verilog_test: str, task_id: str):
     with open(f"{task_id}.sv", "w") as f:
         f.write(verilog_test)
-
-    # grep '^Error|^Warning'
-    with open("top_module.qsf", "w") as f:
-        f.write(f"set_global_assignment -name SYSTEMVERILOG_FILE {task_id}.sv")
-    out, err = execute(
-        f"quartus_map --effort=fast --parallel=4 --read_settings_files=on --write_settings_files=off top_module -c top_module | grep '^Error'",
-        30,
-    ) # users should replace quartus_map to correct path of executable file
-
-    tmp = []
-    for i in out.strip().split("\n"):
-        if "Error (" in i:
-            trunc = i.find("Check for and fix")
-            if trunc > 0:
-                i = i[:trunc]
-            tmp.append(i)
-    out = "\n".join(tmp)
-
-    return out
+    return get_backend("quartus").compile(f"{task_id}.sv")
 
 
 def vcs_compile(verilog_test: str, task_id: str):
     with open(f"{task_id}.sv", "w") as f:
         f.write(verilog_test)
-    out, err = execute(f"vcs -j8 +v2k -sverilog -q -full64 {task_id}.sv", 20)
-    return out
+    return get_backend("vcs").compile(f"{task_id}.sv")
 
 
 def modelsim_compile(verilog_test: str, task_id: str):
     with open(f"{task_id}.sv", "w") as f:
         f.write(verilog_test)
-    out, err = execute(
-        f"vlog -sv -quiet {task_id}.sv", 10
-    ) # users should replace model_sim to correct path of executable file
-    return out
+    return get_backend("modelsim").compile(f"{task_id}.sv")
+
+
+def verilator_compile(verilog_test: str, task_id: str):
+    with open(f"{task_id}.sv", "w") as f:
+        f.write(verilog_test)
+    return get_backend("verilator").compile(f"{task_id}.sv")
@@ -54,6 +54,7 @@ class Args:
     suffix: str = ""
     fewshot: str = ""
     error_report: str=""
+    error_report_by_class: bool = False  # sample ICL error reports round-robin over error classes, see error_clusters.py
 
     prompt_template: str = field(default="./prompt/solution.txt")
     task: str = field(default="code_generate")
@@ -65,7 +66,21 @@ class Args:
     input_key: str = "input"
     output_key: str = ""
     llm_filter: bool = True
-    llm_reward: bool = False
+    llm_filter_batch: int = 1  # judge up to this many concurrent samples per request
+    llm_filter_cache: str = ""  # jsonl file of cached judge verdicts
+    llm_reward: bool = False  # score the output with the reward model after generation, see reward_stage.py
+    reward_base_url: str = "https://integrate.api.nvidia.com/v1"
+    reward_concurrency: int = 16
+    syntax_gate: bool = True
+    pyverilog_gate: bool = False
+    compile_backends: str = "iverilog"  # comma separated, e.g. "iverilog,verilator"
+    dedup_store: str = "memory"  # "memory" shares dedup across threads, "sqlite" across processes/nodes
+    dedup_path: str = ""  # directory of the sqlite dedup store, or where the memory store spills its band tables
+    dedup_exact: bool = False  # keep accepted texts on disk and re-check LSH candidates with exact Jaccard
+    dedup_tiers: bool = True  # exact and Verilog-normalized hash tiers in front of MinHash
+    embedding_filter: bool = False  # reject paraphrases of benchmark problems by embedding similarity
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_threshold: float = 0.85  # cosine similarity
 
     def fingerprint(self, prompt_template: str) -> str:
         # The combination of arguments can uniquely determine the generation process
@@ -170,6 +185,21 @@ def run(args, dataset, path: str, iterations=None):
                             continue
                 break
 
+        if getattr(task, "syntax_gate", None) is not None:
+            print(task.syntax_gate.summary())
+        for name in ("filter", "similarity_filter", "llm_filter"):
+            if hasattr(getattr(task, name, None), "summary"):
+                print(getattr(task, name).summary())
+        if args.embedding_filter:
+            from LLMInstruct.decontamination.embedding_filter import load_embedding_filter
+            print(load_embedding_filter(args.embedding_model, args.embedding_threshold).summary())
+
+    if args.llm_reward:
+        # scored after generation, so generation throughput is not gated on the reward model
+        from LLMInstruct.reward_stage import run_rewards
+        for scored_path, scored in run_rewards([str(path)], args.reward_base_url, concurrency=args.reward_concurrency).items():
+            print(f"Scored {scored} records of {scored_path}")
+
 
 def run_parallel(args, dataset):
 
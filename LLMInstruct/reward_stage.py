@@ -0,0 +1,226 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+"""
+Post-generation reward scoring with nemotron-4-340b-reward.
+
+    python LLMInstruct/reward_stage.py --inputs "./output/sdg_data/self/*.jsonl" --concurrency 32
+
+Finished records are streamed from each generated jsonl file and scored
+with bounded concurrency against an OpenAI-compatible endpoint. Scores go
+to a separate `<file>.reward.jsonl` column file (one row per `index`)
+that can be joined back with `join_rewards`. Reruns skip indices already
+scored. `--mock` serves deterministic scores from a local endpoint for
+testing the pipeline without API access.
+"""
+
+import os
+import json
+import glob
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+from LLMInstruct.utils import read_jsonl
+from LLMInstruct.decontamination.llm_filter.nemotron_340b_reward import (
+    NemotronRewardFilter,
+    REWARD_BASE_URL,
+    REWARD_MODEL,
+)
+
+
+logger = logging.getLogger(__name__)
+
+REWARD_ATTRIBUTES = ("helpfulness", "correctness", "coherence", "complexity", "verbosity")
+
+
+def reward_path(path: str) -> str:
+    return f"{path[:-len('.jsonl')] if path.endswith('.jsonl') else path}.reward.jsonl"
+
+
+def scored_indices(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    return {row["index"] for row in read_jsonl(path)}
+
+
+async def score_file(
+    reward: NemotronRewardFilter,
+    path: str,
+    output: Optional[str] = None,
+    concurrency: int = 16,
+    problem_key: str = "input",
+    solution_key: str = "output",
+    only_passed: bool = True,
+) -> int:
+    """
+    Score every record of `path` not yet in `output`. At most `concurrency`
+    requests are in flight; results are appended as they complete.
+    Returns the number of records scored.
+    """
+    output = output or reward_path(path)
+    done = scored_indices(output)
+    semaphore = asyncio.Semaphore(concurrency)
+    scored = 0
+
+    def records() -> Iterable[Dict]:
+        unkeyed = 0
+        for line, row in enumerate(read_jsonl(path), 1):
+            if row.get("index") is None:
+                # scores are joined back by index, a record without one cannot be scored
+                unkeyed += 1
+                logger.error(f"Record on line {line} of {path} has no index, not scored")
+                continue
+            if row["index"] in done:
+                continue
+            # only samples that compile were scored inline before
+            if only_passed and row.get("iverilog_compiler_passed") is False:
+                continue
+            yield row
+        if unkeyed:
+            logger.error(f"{unkeyed} records of {path} have no index and were not scored")
+
+    async def score(row: Dict, f_out):
+        nonlocal scored
+        try:
+            scores = await reward.ascore({"problem": row[problem_key], "solution": row[solution_key]})
+        except Exception:
+            logger.exception(f"Failed to score index {row['index']} of {path}")
+            return
+        finally:
+            semaphore.release()
+        f_out.write(json.dumps(dict(index=row["index"], **scores)) + "\n")
+        f_out.flush()
+        scored += 1
+
+    with open(output, "a") as f_out:
+        tasks = set()
+        for row in records():
+            # bounded: the next record is only read once a request slot is free
+            await semaphore.acquire()
+            task = asyncio.create_task(score(row, f_out))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    return scored
+
+
+def run_rewards(
+    paths: Iterable[str],
+    base_url: str = REWARD_BASE_URL,
+    model: str = REWARD_MODEL,
+    concurrency: int = 16,
+    problem_key: str = "input",
+    solution_key: str = "output",
+    only_passed: bool = True,
+    api_key: Optional[str] = None,
+) -> Dict[str, int]:
+    reward = NemotronRewardFilter(base_url=base_url, model=model, api_key=api_key)
+
+    async def score_all():
+        return {
+            path: await score_file(reward, path, None, concurrency, problem_key, solution_key, only_passed)
+            for path in paths
+        }
+
+    return asyncio.run(score_all())
+
+
+def join_rewards(path: str, rewards: Optional[str] = None) -> pd.DataFrame:
+    """Generated records of `path` with their reward columns, joined by index."""
+    df = pd.DataFrame(read_jsonl(path))
+    rewards = rewards or reward_path(path)
+    if not os.path.exists(rewards):
+        return df
+    scores = pd.DataFrame(read_jsonl(rewards)).drop_duplicates("index", keep="last")
+    return df.merge(scores, on="index", how="left")
+
+
+class MockRewardServer:
+    """
+    OpenAI-compatible /v1/chat/completions returning deterministic reward
+    strings derived from the messages.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                digest = hashlib.sha256(json.dumps(body["messages"]).encode()).digest()
+                content = ",".join(f"{name}:{digest[i] / 64:.4f}" for i, name in enumerate(REWARD_ATTRIBUTES))
+                response = json.dumps({
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body.get("model", REWARD_MODEL),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "length",
+                        "message": {"role": "assistant", "content": content},
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.base_url = f"http://{host}:{self.server.server_address[1]}/v1"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", type=str, nargs="+", required=True, help="generated jsonl files or glob patterns")
+    parser.add_argument("--base_url", type=str, default=REWARD_BASE_URL)
+    parser.add_argument("--model", type=str, default=REWARD_MODEL)
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--problem_key", type=str, default="input")
+    parser.add_argument("--solution_key", type=str, default="output")
+    parser.add_argument("--all", action="store_true", help="also score samples that failed to compile")
+    parser.add_argument("--mock", action="store_true", help="score against a local mock endpoint")
+    args = parser.parse_args()
+
+    paths = sorted({
+        f for pattern in args.inputs for f in glob.glob(pattern) if not f.endswith(".reward.jsonl")
+    })
+    kwargs = dict(
+        model=args.model,
+        concurrency=args.concurrency,
+        problem_key=args.problem_key,
+        solution_key=args.solution_key,
+        only_passed=not args.all,
+    )
+    if args.mock:
+        with MockRewardServer() as server:
+            results = run_rewards(paths, base_url=server.base_url, api_key="mock", **kwargs)
+    else:
+        results = run_rewards(paths, base_url=args.base_url, **kwargs)
+    for path, scored in results.items():
+        print(f"{path}: scored {scored} records -> {reward_path(path)}")
+
+
+if __name__ == "__main__":
+    main()
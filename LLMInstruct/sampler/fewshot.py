@@ -3,7 +3,9 @@
 # This work is made available
 # under the Nvidia Source Code License (1-way Commercial).
 
+import random
 from typing import Dict
+from collections import defaultdict
 from datasets import concatenate_datasets, Dataset
 
 from LLMInstruct.sampler import BaseSampler
@@ -61,3 +63,21 @@ class LimitedFewShotSampler(FewShotSampler):
         after_filter_dataset = self.dataset.filter(filter_by_max_length)
         print(f"FewShotSampler filtering {len(after_filter_dataset)}/{len(dataset)} after before.")
         return after_filter_dataset
+
+
+class ErrorClassFewShotSampler(FewShotSampler):
+    """
+    Error reports round-robin over their error classes (the `error_class`
+    written by error_clusters.py), cycling through the reports of each class.
+    """
+
+    def _create_generator(self):
+        classes = defaultdict(list)
+        for i, error_class in enumerate(self.dataset["error_class"]):
+            classes[error_class].append(i)
+        order = sorted(classes)
+        random.Random(self.seed).shuffle(order)
+        while True:
+            self.cnt += 1
+            members = classes[order[self.cnt % len(order)]]
+            yield self.dataset[members[(self.cnt // len(order)) % len(members)]]
@@ -88,6 +88,13 @@ class BaseTask(Task):
     def decontaminate(self, result: str) -> Optional[str]:
         if result is None or len(result) == 0:
             return
+        if getattr(self.args, "embedding_filter", False):
+            from LLMInstruct.decontamination.embedding_filter import load_embedding_filter
+
+            # shared by all tasks in the process, loaded on first use
+            embedding_filter = load_embedding_filter(self.args.embedding_model, self.args.embedding_threshold)
+            if not embedding_filter.validate(result):
+                return
         return result
 
     def evaluate(self, response_text: str) -> dict:
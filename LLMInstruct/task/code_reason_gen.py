@@ -4,16 +4,18 @@
 # under the Nvidia Source Code License (1-way Commercial).
 
 import logging
-import pandas as pd
 from abc import ABC
 from pathlib import Path
 from typing import Optional
 from LLMInstruct.executor.verilog_executor import check_correctness
+from LLMInstruct.executor.syntax_gate import SyntaxGate
 from LLMInstruct.utils import parse_markdown_code_block, read_jsonl
 from LLMInstruct.task.base import BaseTask
-from LLMInstruct.decontamination.llm_filter.llm_filter import LLMFilter
-from LLMInstruct.decontamination.llm_filter.nemotron_340b_reward import NemotronRewardFilter
+from LLMInstruct.decontamination.llm_filter.llm_filter import get_llm_filter
 from LLMInstruct.decontamination.similarity_filter import JaccardFilter
+from LLMInstruct.decontamination.tiered_filter import TieredFilter
+from LLMInstruct.decontamination.benchmark_index import load_benchmark_index
+from LLMInstruct.decontamination.dedup_store import get_dedup_store
 
 
 logger = logging.getLogger(__name__)
@@ -26,24 +28,25 @@ class CodeReasonGenTask(BaseTask):
         self.args = config
         self.prompt_template = Path(self.args.prompt_template).read_text()
         
-        benchmark_dataset = pd.concat([
-             pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-manual.jsonl.gz')),
-             pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-machine.jsonl.gz')),
-             pd.DataFrame(read_jsonl('./dataset/benchmark/rtllm.jsonl')),
-        ]).dropna()
-
-        self.similarity_filter = JaccardFilter(
-            instructions=benchmark_dataset.detail_description.values.tolist()+ benchmark_dataset.canonical_solution.values.tolist()
+        self.similarity_filter = TieredFilter(
+            JaccardFilter(
+                base=load_benchmark_index(columns=("detail_description", "canonical_solution")),
+                store=get_dedup_store(
+                    type(self).__name__, self.args.dedup_store, self.args.dedup_path, exact=self.args.dedup_exact
+                ),
+            ),
+            enabled=self.args.dedup_tiers,
         )
         self.llm_filter = None
-        self.nemotron_reward = None
+        self.syntax_gate = None
+
+        if self.args.syntax_gate:
+            self.syntax_gate = SyntaxGate(use_pyverilog=self.args.pyverilog_gate)
 
         if self.args.llm_filter:
-            self.llm_filter = LLMFilter(config)
-        if self.args.llm_reward:
-            self.nemotron_reward = NemotronRewardFilter(config)
-        else:
-            self.nemotron_reward = None
+            self.llm_filter = get_llm_filter(
+                config, batch_size=self.args.llm_filter_batch, cache_path=self.args.llm_filter_cache
+            )
 
     def construct_prompt(self, example: dict):
         prompt = self.prompt_template.format(problem=example["problem"])
@@ -74,9 +77,18 @@ class CodeReasonGenTask(BaseTask):
         return solution, reasoning
 
     def evaluate(self, solution: str, problem: str) -> dict:
-        iverilog_result = check_correctness(solution, 30, compile_only="iverilog")
+        # Reject truncated or malformed outputs before paying for a compiler subprocess
+        if self.syntax_gate:
+            ok, reason = self.syntax_gate.check(solution)
+            if not ok:
+                return dict(iverilog_compiler_passed=False,
+                            iverilog_compiler_log=f"syntax gate: {reason}",
+                            iverilog_error_classes=[f"syntax_gate:{reason.split(',')[0]}"])
+
+        iverilog_result = check_correctness(solution, 30, compile_only=self.args.compile_backends)
         scores = dict(iverilog_compiler_passed=iverilog_result["passed"], 
-                        iverilog_compiler_log=iverilog_result["feedback"]["compiler_log"])
+                        iverilog_compiler_log=iverilog_result["feedback"]["compiler_log"],
+                        iverilog_error_classes=iverilog_result["feedback"].get("error_classes", []))
         
         # Results did not pass syntax check, no need to use llm to filter
         if not iverilog_result["passed"]:
@@ -93,15 +105,12 @@ class CodeReasonGenTask(BaseTask):
                 llm_reason=llm_reason
             ))
 
-        if self.nemotron_reward:
-            nemotron_reward = self.nemotron_reward.validate({'problem': problem, 'solution': solution})
-            scores.update(nemotron_reward)
-
         return scores
     
     def decontaminate(self, result: str):
-        if self.similarity_filter.validate(result):
-            self.similarity_filter.add(result)
+        # benchmark contamination first, so rejected samples never enter the dedup store
+        result = super().decontaminate(result)
+        if result is not None and self.similarity_filter.validate_and_add(result):
             return result
         
     def llm_verify(self, problem: str, solution: str):
@@ -13,7 +13,9 @@ from LLMInstruct.utils import parse_markdown_code_block, read_jsonl
 from LLMInstruct.task.base import BaseTask
 from LLMInstruct.sampler.fewshot import FewShotSampler
 from LLMInstruct.decontamination.similarity_filter import JaccardFilter
-import pandas as pd
+from LLMInstruct.decontamination.tiered_filter import TieredFilter
+from LLMInstruct.decontamination.benchmark_index import load_benchmark_index
+from LLMInstruct.decontamination.dedup_store import get_dedup_store
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +27,14 @@ class OSSGenLargeTask(BaseTask):
         self.args = config
         self.prompt_template = Path(self.args.prompt_template).read_text()
 
-        benchmark_dataset = pd.concat([
-             pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-manual.jsonl.gz')),
-             pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-machine.jsonl.gz')),
-             pd.DataFrame(read_jsonl('./dataset/benchmark/rtllm.jsonl')),
-        ]).dropna()
-
-        self.filter = JaccardFilter(
-            instructions=benchmark_dataset.detail_description.values.tolist()+ benchmark_dataset.canonical_solution.values.tolist()
+        self.filter = TieredFilter(
+            JaccardFilter(
+                base=load_benchmark_index(columns=("detail_description", "canonical_solution")),
+                store=get_dedup_store(
+                    type(self).__name__, self.args.dedup_store, self.args.dedup_path, exact=self.args.dedup_exact
+                ),
+            ),
+            enabled=self.args.dedup_tiers,
         )
 
     def construct_prompt(self, example: dict):
@@ -56,8 +58,9 @@ class OSSGenLargeTask(BaseTask):
             return parse_markdown_code_block(response_text)
         
     def decontaminate(self, result: str):
-        if self.filter.validate(result):
-            self.filter.add(result)
+        # benchmark contamination first, so rejected samples never enter the dedup store
+        result = super().decontaminate(result)
+        if result is not None and self.filter.validate_and_add(result):
             return result
 
     def __call__(self, example: dict):
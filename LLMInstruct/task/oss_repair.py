@@ -11,9 +11,11 @@ from datasets import Dataset
 from LLMInstruct.executor.verilog_executor import check_correctness
 from LLMInstruct.utils import parse_markdown_code_block, read_jsonl
 from LLMInstruct.task.base import BaseTask
-from LLMInstruct.sampler.fewshot import FewShotSampler
+from LLMInstruct.sampler.fewshot import FewShotSampler, ErrorClassFewShotSampler
 from LLMInstruct.decontamination.similarity_filter import JaccardFilter
-import pandas as pd
+from LLMInstruct.decontamination.tiered_filter import TieredFilter
+from LLMInstruct.decontamination.benchmark_index import load_benchmark_index
+from LLMInstruct.decontamination.dedup_store import get_dedup_store
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +27,19 @@ class OSSRepairTask(BaseTask):
         self.args = config
         self.prompt_template = Path(self.args.prompt_template).read_text()
 
-        benchmark_dataset = pd.concat([
-             pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-manual.jsonl.gz')),
-             pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-machine.jsonl.gz')),
-             pd.DataFrame(read_jsonl('./dataset/benchmark/rtllm.jsonl')),
-        ]).dropna()
-
-        self.filter = JaccardFilter(
-            instructions=benchmark_dataset.detail_description.values.tolist()+ benchmark_dataset.canonical_solution.values.tolist()
+        self.filter = TieredFilter(
+            JaccardFilter(
+                base=load_benchmark_index(columns=("detail_description", "canonical_solution")),
+                store=get_dedup_store(
+                    type(self).__name__, self.args.dedup_store, self.args.dedup_path, exact=self.args.dedup_exact
+                ),
+            ),
+            enabled=self.args.dedup_tiers,
         )
-        self.fewshot_sampler = FewShotSampler(self.args.error_report)
+        if self.args.error_report_by_class:
+            self.fewshot_sampler = ErrorClassFewShotSampler(self.args.error_report)
+        else:
+            self.fewshot_sampler = FewShotSampler(self.args.error_report)
 
     def construct_prompt(self, example: dict, icl_sample: dict):
         try:
@@ -66,8 +71,9 @@ class OSSRepairTask(BaseTask):
             return parse_markdown_code_block(response_text)
         
     def decontaminate(self, result: str):
-        if self.filter.validate(result):
-            self.filter.add(result)
+        # benchmark contamination first, so rejected samples never enter the dedup store
+        result = super().decontaminate(result)
+        if result is not None and self.filter.validate_and_add(result):
             return result
 
     def __call__(self, example: dict):
@@ -97,4 +103,6 @@ class OSSRepairTask(BaseTask):
             task_id=icl_sample['task_id'],
 
         )
+        if 'error_class' in icl_sample:
+            data['error_class'] = icl_sample['error_class']
         return data
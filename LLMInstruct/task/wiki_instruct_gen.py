@@ -5,7 +5,6 @@
 
 import random
 import logging
-import pandas as pd
 from abc import ABC
 from pathlib import Path
 from typing import Optional
@@ -15,6 +14,9 @@ from LLMInstruct.utils import parse_markdown_code_block, read_jsonl
 from LLMInstruct.task.base import BaseTask
 from LLMInstruct.sampler.fewshot import FewShotSampler
 from LLMInstruct.decontamination.similarity_filter import JaccardFilter
+from LLMInstruct.decontamination.tiered_filter import TieredFilter
+from LLMInstruct.decontamination.benchmark_index import load_benchmark_index
+from LLMInstruct.decontamination.dedup_store import get_dedup_store
 
 
 logger = logging.getLogger(__name__)
@@ -35,12 +37,15 @@ class WikiInstructGenTask(BaseTask):
         self.args = config
         self.prompt_template = Path(self.args.prompt_template).read_text()
         
-        benchmark_dataset = pd.concat([
-            pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-manual.jsonl.gz')),
-            pd.DataFrame(read_jsonl('./dataset/benchmark/verilogeval-machine.jsonl.gz')),
-            pd.DataFrame(read_jsonl('./dataset/benchmark/rtllm.jsonl')),
-        ])
-        self.filter = JaccardFilter(instructions=benchmark_dataset.detail_description.values.tolist())
+        self.filter = TieredFilter(
+            JaccardFilter(
+                base=load_benchmark_index(columns=("detail_description",)),
+                store=get_dedup_store(
+                    type(self).__name__, self.args.dedup_store, self.args.dedup_path, exact=self.args.dedup_exact
+                ),
+            ),
+            enabled=self.args.dedup_tiers,
+        )
 
     def construct_prompt(self, example: dict):
         try:
@@ -64,8 +69,9 @@ class WikiInstructGenTask(BaseTask):
             return parse_markdown_code_block(response_text)
         
     def decontaminate(self, result: str):
-        if self.filter.validate(result):
-            self.filter.add(result)
+        # benchmark contamination first, so rejected samples never enter the dedup store
+        result = super().decontaminate(result)
+        if result is not None and self.filter.validate_and_add(result):
             return result
 
     def __call__(self, example: dict):
@@ -11,6 +11,8 @@ import re
 import random
 import logging
 import time
+import tempfile
+import threading
 from pathlib import Path
 from typing import Any, Iterable, Mapping, Sequence, TypeVar, Dict
 
@@ -225,6 +227,9 @@ def compute_fingerprint(*args: Any, hash_length: int = None) -> str:
 """
 Adapted util functions from running verilog evaluations
 """
+_PYVERILOG_LOCK = threading.Lock()
+
+
 def valid_module(code: str):
     import importlib
     spec = importlib.util.find_spec('pyverilog')
@@ -232,11 +237,16 @@ def valid_module(code: str):
         return False
 
     from pyverilog.vparser.parser import parse
-    try:
-        ast, directives = parse()
-        return True
-    except Exception:
-        return False
+    # pyverilog only parses files and its ply tables are not thread-safe
+    with _PYVERILOG_LOCK, tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "module.v")
+        with open(filename, "w") as f:
+            f.write(code)
+        try:
+            ast, directives = parse([filename], outputdir=dirname, debug=False)
+            return True
+        except Exception:
+            return False
     
 
 def remove_module_header(code: str):
@@ -266,7 +276,8 @@ def post_process_completion(completion: str, remove_header: bool = False, rtllm:
     if (not rtllm) or completion.count("endmodule") == 1:
         pattern = r"\bmodule\b[\s\S]*?\bendmodule\b"
         matches = re.findall(pattern, completion)
-        if matches and (valid_module(matches[0]) or remove_header):
+        # remove_header first: skips the pyverilog parse when the header goes anyway
+        if matches and (remove_header or valid_module(matches[0])):
             completion = remove_module_header(matches[0])
 
     return completion
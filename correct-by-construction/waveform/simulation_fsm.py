@@ -148,12 +148,29 @@ def obtain_waveform(testbench: str, timeout=90) -> Dict:
             os.rmdir = rmdir
             os.chdir = chdir
             
-    manager = multiprocessing.Manager()
-    result = manager.list()
-
-    p = multiprocessing.Process(target=unsafe_execute)
+    # return the result through a pipe instead of a multiprocessing.Manager server process
+    result = []
+    recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+
+    def run():
+        recv_conn.close()
+        try:
+            unsafe_execute()
+        finally:
+            send_conn.send(result)
+            send_conn.close()
+
+    p = multiprocessing.Process(target=run)
     p.start()
-    p.join(timeout=timeout + 1)
+    send_conn.close()
+    try:
+        if recv_conn.poll(timeout + 1):
+            result = recv_conn.recv()
+    except (EOFError, OSError):
+        pass
+    finally:
+        recv_conn.close()
+    p.join(timeout=1)
     if p.is_alive():
         p.kill()
 
@@ -0,0 +1,17 @@
+# fail if importing a module (LLMInstruct.error_report by default) takes longer
+# than the budget in microseconds, as measured by `python -X importtime`
+MODULE=${1:-LLMInstruct.error_report}
+BUDGET_US=${2:-150000}
+
+if ! REPORT=$(python -X importtime -c "import ${MODULE}" 2>&1 >/dev/null); then
+    echo "${REPORT}" | tail -n 5
+    echo "import of ${MODULE} failed"
+    exit 2
+fi
+
+echo "${REPORT}" | awk -F'|' -v module="${MODULE}" -v budget="${BUDGET_US}" '
+    $3 ~ "^ *"module" *$" { total = $2 + 0 }
+    END {
+        printf "%s: %.1f ms (budget %.1f ms)\n", module, total / 1000, budget / 1000
+        exit (total > budget)
+    }'
@@ -10,6 +10,11 @@ setup(
     packages=find_packages("."),
     python_requires=">=3.8",
     platforms=["any"],
+    entry_points={
+        "console_scripts": [
+            "error-report=LLMInstruct.error_report:cli",
+        ],
+    },
     install_requires=[
         "openai==1.11.1",
         "langchain==0.1.5",
@@ -18,6 +23,7 @@ setup(
         "pandas==2.1.3",
         "astunparse==1.6.3",
         "datasets==2.16.1",
+        "pyarrow>=14.0.0",
         "tqdm==4.66.1",
         "gradio==4.8.0",
         "datasketch==1.6.4",
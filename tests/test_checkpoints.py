@@ -0,0 +1,92 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from LLMInstruct import checkpoints
+from LLMInstruct.checkpoints import RESULT_FILES, CheckpointCache, read_checkpoints
+from LLMInstruct.utils import write_jsonl
+
+
+def completion(body: str) -> str:
+    return f"module top_module(input a, input b, output y);\n  assign y = {body};\nendmodule"
+
+
+def write_results(exp_path, exp, step, benchmark, bodies):
+    ckpt = os.path.join(exp_path, exp, f"checkpoint_step={step}")
+    os.makedirs(ckpt, exist_ok=True)
+    rows = [
+        dict(task_id=f"prob{i % 2:03d}", completion=completion(body), passed=i % 3 == 0, result="passed")
+        for i, body in enumerate(bodies)
+    ]
+    write_jsonl(os.path.join(ckpt, RESULT_FILES[benchmark]), rows)
+
+
+@pytest.fixture
+def ingested(monkeypatch):
+    # result files each sync had to load
+    loaded = []
+    load_tables = checkpoints._load_tables
+
+    def _load_tables(files, *args, **kwargs):
+        loaded.append(sorted((f.exp, f.step, f.benchmark) for f in files))
+        return load_tables(files, *args, **kwargs)
+
+    monkeypatch.setattr(checkpoints, "_load_tables", _load_tables)
+    return loaded
+
+
+def assert_same(cache, exp_path):
+    # read through the cache last, so it made the latest load
+    expected = read_checkpoints(exp_path, workers=1)
+    pd.testing.assert_frame_equal(cache.read(exp_path), expected)
+
+
+def test_checkpoint_cache(tmp_path, ingested):
+    exp_path = str(tmp_path / "exps")
+    write_results(exp_path, "sft", 100, "human", ["a & b", "a | b", "a & b"])
+    write_results(exp_path, "sft", 200, "human", ["a ^ b", "a | b"])
+    write_results(exp_path, "sft", 200, "machine", ["~a"])
+    cache = CheckpointCache(str(tmp_path / "cache"))
+
+    assert_same(cache, exp_path)
+    assert ingested[-1] == [("sft", 100, "human"), ("sft", 200, "human"), ("sft", 200, "machine")]
+    assert os.path.exists(os.path.join(cache.cache_dir, "exp=sft", "step=200", "machine.feather"))
+
+    # nothing changed, nothing loaded again
+    assert_same(cache, exp_path)
+    assert ingested[-1] == []
+
+    # a new checkpoint repeating an earlier completion keeps the earlier row
+    write_results(exp_path, "sft", 300, "human", ["a & b", "~b"])
+    assert_same(cache, exp_path)
+    assert ingested[-1] == [("sft", 300, "human")]
+    df = cache.read(exp_path)
+    assert df[df["step"] == 300]["completion"].str.contains("~b").all()
+
+    # an overwritten result file is loaded again
+    write_results(exp_path, "sft", 200, "machine", ["~a", "a"])
+    assert_same(cache, exp_path)
+    assert ingested[-1] == [("sft", 200, "machine")]
+
+    # a removed checkpoint drops its partitions
+    shutil.rmtree(os.path.join(exp_path, "sft", "checkpoint_step=100"))
+    assert_same(cache, exp_path)
+    assert not os.path.exists(os.path.join(cache.cache_dir, "exp=sft", "step=100"))
+
+
+def test_checkpoint_cache_other_layout(tmp_path):
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+    write_results(first, "sft", 100, "human", ["a & b"])
+    write_results(second, "dpo", 50, "rtllm", ["a | b"])
+    cache = CheckpointCache(str(tmp_path / "cache"))
+    assert cache.read(first)["exp"].tolist() == ["sft"]
+    # a cache built for another experiment path is rebuilt, not mixed in
+    assert cache.read(second)["exp"].tolist() == ["dpo"]
+    assert not os.path.exists(os.path.join(cache.cache_dir, "exp=sft"))
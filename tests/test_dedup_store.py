@@ -0,0 +1,99 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from LLMInstruct.decontamination.dedup_store import (
+    BandTable,
+    DocumentStore,
+    MemoryDedupStore,
+    SQLiteDedupStore,
+    doc_id,
+)
+from LLMInstruct.decontamination.similarity_filter import JaccardFilter, minhash
+
+
+TEXT = "module top_module(input a, input b, output y); assign y = a & b; endmodule"
+OTHER = "module counter(input clk, input reset, output reg [3:0] q); always @(posedge clk) q <= reset ? 0 : q + 1; endmodule"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryDedupStore()
+    return SQLiteDedupStore(str(tmp_path / "dedup.sqlite"))
+
+
+def test_check_and_add_race(store):
+    m = minhash(TEXT, 128, 5)
+    barrier = threading.Barrier(2)
+    accepted = []
+
+    def is_duplicate(candidates):
+        # widen the window between the query and the insert
+        time.sleep(0.05)
+        return bool(candidates)
+
+    def worker(key):
+        barrier.wait()
+        accepted.append(store.check_and_add(key, m, is_duplicate))
+
+    threads = [threading.Thread(target=worker, args=(key,)) for key in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(accepted) == [False, True]
+
+
+def test_sqlite_reopen(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    store = SQLiteDedupStore(path)
+    store.insert(doc_id(TEXT), minhash(TEXT, 128, 5))
+
+    reopened = SQLiteDedupStore(path)
+    assert reopened.query(minhash(TEXT, 128, 5)) == [doc_id(TEXT)]
+    assert reopened.query(minhash(OTHER, 128, 5)) == []
+    assert not reopened.check_and_add(doc_id(TEXT), minhash(TEXT, 128, 5))
+    with pytest.raises(Exception):
+        SQLiteDedupStore(path, num_perm=64)
+
+
+def test_is_duplicate_missing_texts(tmp_path):
+    store = MemoryDedupStore()
+    store.documents = DocumentStore(str(tmp_path / "documents.sqlite"))
+    jaccard = JaccardFilter(store=store)
+
+    # a candidate whose text was never stored counts as a duplicate
+    assert jaccard.is_duplicate(TEXT, [doc_id(TEXT)])
+    store.documents.put(doc_id(OTHER), OTHER)
+    assert not jaccard.is_duplicate(TEXT, [doc_id(OTHER)])
+    assert jaccard.is_duplicate(TEXT, [doc_id(OTHER), doc_id(TEXT)])
+    assert not jaccard.is_duplicate(TEXT, [])
+
+    assert jaccard.validate_and_add(TEXT)
+    assert store.documents.get_many([doc_id(TEXT)]) == {doc_id(TEXT): TEXT}
+    assert not jaccard.validate_and_add(TEXT)
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_band_table(tmp_path, spill):
+    table = BandTable(str(tmp_path / "band") if spill else None, min_flush=4)
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 8, 50)
+    for key, h in enumerate(hashes):
+        table.add(int(h), key)
+    table.add_many(np.array([3, 3], dtype=np.int64), np.array([100, 101], dtype=np.int64))
+    assert len(table) == 52
+    for h in range(8):
+        expected = [key for key, value in enumerate(hashes) if value == h] + ([100, 101] if h == 3 else [])
+        assert sorted(table.query(h)) == expected
+    table.close()
+    assert not spill or not any(name.endswith(".npy") for name in os.listdir(tmp_path))
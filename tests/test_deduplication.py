@@ -0,0 +1,76 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import json
+from argparse import Namespace
+
+import numpy as np
+
+from LLMInstruct.deduplication import dedupe, find, union
+from LLMInstruct.utils import read_jsonl, write_jsonl
+
+
+def solution(i: int) -> str:
+    return (
+        f"module unit{i}(input clk, input [{i % 7 + 1}:0] d{i}, output reg [{i % 7 + 1}:0] q{i});\n"
+        f"  always @(posedge clk) q{i} <= d{i} ^ {i * 37 % 251};\n"
+        f"  // variant {i * 7919 % 1009}, stage {i * 104729 % 997}\n"
+        "endmodule"
+    )
+
+
+def test_find_halves_long_chains():
+    n = 1000
+    parent = np.arange(n, dtype=np.int64) - 1
+    parent[0] = 0
+    assert (find(parent, np.array([n - 1])) == 0).all()
+    # the lookup pointed every other node of the chain at its grandparent
+    assert parent[n - 1] == n - 3
+    assert (find(parent, np.arange(n)) == 0).all()
+    assert max(depth(parent, node) for node in range(n)) <= np.log2(n) + 1
+
+
+def depth(parent: np.ndarray, node: int) -> int:
+    steps = 0
+    while parent[node] != node:
+        node = parent[node]
+        steps += 1
+    return steps
+
+
+def test_union_keeps_first_node_as_root():
+    parent = np.arange(6, dtype=np.int64)
+    union(parent, np.array([5, 3, 4]), np.array([4, 1, 3]))
+    assert find(parent, np.arange(6)).tolist() == [0, 1, 2, 1, 1, 1]
+
+
+def test_dedupe(tmp_path):
+    benchmark = tmp_path / "benchmark.jsonl"
+    write_jsonl(str(benchmark), [dict(task_id="b0", prompt="p", canonical_solution=solution(100))])
+    shard = tmp_path / "shard.jsonl"
+    records = [dict(uid=f"r{i}", output=solution(i)) for i in range(6)]
+    records += [
+        dict(uid="dup0", output=solution(0)),
+        dict(uid="dup3", output=solution(3)),
+        dict(uid="dup0b", output=solution(0) + "\n"),
+        dict(uid="bench", output=solution(100)),
+    ]
+    write_jsonl(str(shard), records)
+
+    args = Namespace(
+        inputs=[str(shard)], keys=["output"], id_key="uid", output_dir=str(tmp_path / "out"), write_records=True,
+        threshold=0.7, num_perm=128, benchmark=[str(benchmark)], benchmark_columns=["canonical_solution"],
+        workers=1, chunk_size=2, num_partitions=4, top_clusters=5, keep_work=False,
+    )
+    report = dedupe(args)
+
+    assert (report["records"], report["kept"], report["duplicates"], report["contaminated"]) == (10, 6, 3, 1)
+    kept = open(tmp_path / "out" / "kept_ids.txt").read().split()
+    assert kept == [f"r{i}" for i in range(6)]
+    assert [r["uid"] for r in read_jsonl(str(tmp_path / "out" / "deduped.jsonl"))] == kept
+    duplicates = {row["id"]: row["duplicate_of"] for row in read_jsonl(str(tmp_path / "out" / "duplicates.jsonl"))}
+    assert duplicates == dict(dup0="r0", dup3="r3", dup0b="r0", bench=None)
+    assert report["largest_clusters"][0] == dict(id="r0", size=3)
+    assert json.load(open(tmp_path / "out" / "report.json"))["clusters"] == 2
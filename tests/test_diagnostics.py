@@ -0,0 +1,79 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+
+from LLMInstruct.executor.diagnostics import error_classes, has_errors, parse_compiler_log
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_log(tool: str) -> str:
+    with open(os.path.join(FIXTURES, f"{tool}.log")) as f:
+        return f.read()
+
+
+def locations(diagnostics, severity="error"):
+    return [(d.file, d.line) for d in diagnostics if d.severity == severity]
+
+
+def test_iverilog():
+    diagnostics = parse_compiler_log(read_log("iverilog"), "iverilog")
+    assert locations(diagnostics) == [("prob001.sv", 12), ("prob001.sv", 15), ("prob001.sv", 15)]
+    assert locations(diagnostics, "warning") == [("prob001.sv", 20)]
+    # the elaboration summary repeats the located errors
+    assert not any(d.file is None for d in diagnostics)
+    assert error_classes(diagnostics) == [
+        "iverilog:unable to bind wire/reg/memory <id> in <id>",
+        "iverilog:syntax error",
+        "iverilog:invalid module item",
+    ]
+
+
+def test_iverilog_summary_only():
+    diagnostics = parse_compiler_log("I give up.\n", "iverilog")
+    assert has_errors(diagnostics)
+    assert diagnostics[0].file is None
+
+
+def test_verilator():
+    diagnostics = parse_compiler_log(read_log("verilator"), "verilator")
+    assert locations(diagnostics) == [("prob001.sv", 14), ("prob001.sv", 30)]
+    assert [d.code for d in diagnostics if d.severity == "warning"] == ["WIDTHTRUNC"]
+    # "Exiting due to" only repeats the count
+    assert error_classes(diagnostics) == ["verilator:syntax error, unexpected endmodule", "verilator:NEEDTIMINGOPT"]
+
+
+def test_quartus():
+    diagnostics = parse_compiler_log(read_log("quartus"), "quartus")
+    assert locations(diagnostics) == [("top_module.v", 14), ("top_module.v", 1)]
+    assert error_classes(diagnostics) == ["quartus:10170", "quartus:10112"]
+    syntax = next(d for d in diagnostics if d.code == "10170")
+    assert "Check for and fix" not in syntax.message
+
+
+def test_quartus_fallback():
+    diagnostics = parse_compiler_log("timed out", "quartus")
+    assert diagnostics == []
+    diagnostics = parse_compiler_log("failed: compile error", "quartus")
+    assert has_errors(diagnostics)
+
+
+def test_vcs():
+    diagnostics = parse_compiler_log(read_log("vcs"), "vcs")
+    # the location is on a line after the header, quoted or not
+    assert locations(diagnostics) == [("prob001.sv", 14), ("prob001.sv", 22)]
+    assert locations(diagnostics, "warning") == [("prob001.sv", 30)]
+    # the trailing "2 errors" count is not a diagnostic of its own
+    assert error_classes(diagnostics) == ["vcs:SE", "vcs:IND"]
+
+
+def test_modelsim():
+    diagnostics = parse_compiler_log(read_log("modelsim"), "modelsim")
+    assert locations(diagnostics) == [("prob001.sv", 14), ("prob001.sv", 22)]
+    assert error_classes(diagnostics) == ["modelsim:vlog-13069", "modelsim:vlog-2388"]
+    warning = next(d for d in diagnostics if d.severity == "warning")
+    assert (warning.code, warning.message) == ("vlog-2623", "Undefined variable: sum.")
@@ -0,0 +1,87 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import os
+import json
+import random
+from argparse import Namespace
+
+from LLMInstruct.error_clusters import ErrorClusters, cluster_reports
+from LLMInstruct.utils import read_jsonl, write_jsonl
+
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "code_repair_examples", "error_report.sample.jsonl")
+
+THEMES = {
+    "latch": ["latch", "inferred", "combinational", "always", "incomplete", "branch", "default", "assignment"],
+    "shift": ["arithmetic", "shift", "sign", "extension", "logical", "operator", "signed", "msb"],
+    "reset": ["reset", "asynchronous", "synchronous", "sensitivity", "list", "posedge", "clock", "edge"],
+}
+FILLER = ["the", "design", "signal", "output", "value", "wrong", "because", "result"]
+
+
+def reports(n: int, seed: int = 0, exp: str = "sft"):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        theme = list(THEMES)[i % len(THEMES)]
+        words = rng.sample(THEMES[theme], 5) + rng.sample(FILLER, 3)
+        rng.shuffle(words)
+        rows.append(dict(task_id=f"t{i}", exp=exp, error=f"e{i}", theme=theme, reason=" ".join(words)))
+    return rows
+
+
+def test_themes_fall_into_their_own_class():
+    rows = reports(60)
+    model = ErrorClusters.fit([r["reason"] for r in rows], num_clusters=3)
+    labels, _ = model.assign([r["reason"] for r in rows])
+    classes = {theme: {int(c) for r, c in zip(rows, labels) if r["theme"] == theme} for theme in THEMES}
+    assert all(len(c) == 1 for c in classes.values())
+    assert len(set.union(*classes.values())) == 3
+    for theme, (cluster,) in classes.items():
+        assert any(term in THEMES[theme] for term in model.labels[cluster].split(", "))
+
+
+def cluster_args(tmp_path, inputs, num_clusters=3, **kwargs):
+    defaults = dict(
+        inputs=inputs, output_dir=str(tmp_path / "clusters"), text_keys=["reason"], num_clusters=num_clusters,
+        features="tfidf", embedding_model="", batch_size=16, representatives=2, seed=0, update=False, refit=False,
+    )
+    return Namespace(**dict(defaults, **kwargs))
+
+
+def test_rerun_assigns_only_new_reports(tmp_path):
+    first = str(tmp_path / "first.jsonl")
+    write_jsonl(first, reports(30))
+    result = cluster_reports(cluster_args(tmp_path, [first]))
+    assert (result["reports"], result["new"]) == (30, 30)
+    assignment_path = tmp_path / "clusters" / "assignments.jsonl"
+    before = list(read_jsonl(str(assignment_path)))
+
+    # a second file repeating the first one adds only its new reports
+    second = str(tmp_path / "second.jsonl")
+    write_jsonl(second, reports(30) + reports(9, seed=1, exp="dpo"))
+    result = cluster_reports(cluster_args(tmp_path, [str(tmp_path / "*.jsonl")], update=True))
+    assert (result["reports"], result["new"]) == (39, 9)
+    after = list(read_jsonl(str(assignment_path)))
+    assert after[:30] == before
+    by_theme = {}
+    for r in after:
+        by_theme.setdefault(r["theme"], set()).add(r["error_class"])
+    assert all(len(c) == 1 for c in by_theme.values())
+    clusters = json.load(open(tmp_path / "clusters" / "clusters.json"))
+    assert sum(c["size"] for c in clusters) == 39
+
+    result = cluster_reports(cluster_args(tmp_path, [first], refit=True))
+    assert (result["reports"], result["new"]) == (30, 30)
+
+
+def test_small_corpus(tmp_path):
+    # fewer reports than classes: every report gets a class of its own at most
+    result = cluster_reports(cluster_args(tmp_path, [SAMPLE], num_clusters=32))
+    rows = list(read_jsonl(SAMPLE))
+    assert result["reports"] == len(rows)
+    assert 1 <= len(result["clusters"]) <= len(rows)
+    assert all(c["label"] for c in result["clusters"])
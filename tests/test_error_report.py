@@ -0,0 +1,127 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import asyncio
+import os
+
+import pandas as pd
+import pytest
+
+from LLMInstruct import error_report as er
+from LLMInstruct.utils import read_jsonl
+
+
+def code(task: str, body: str) -> str:
+    return f"module {task}(input [7:0] a, input [7:0] b, output [7:0] y);\n  assign y = {body};\nendmodule"
+
+
+def row(task: str, error: str, exp: str = "sft"):
+    return ("spec", error, code(task, "a + b"), exp, "human", "hard", task)
+
+
+@pytest.fixture
+def args(tmp_path, monkeypatch):
+    args = er.build_parser().parse_args([
+        "--output", str(tmp_path / "output"), "--temp", str(tmp_path / "tmp"),
+        "--cache_path", str(tmp_path / "cache"), "--workers", "1",
+    ])
+    for path in (args.output, args.temp, args.cache_path):
+        os.makedirs(path)
+    monkeypatch.setattr(er, "args", args)
+    return args
+
+
+def test_parallel_deduplication(args):
+    report_dict = {
+        "t0": [row("t0", code("t0", "a - b")), row("t0", code("t0", "a - b")), row("t0", code("t0", "a & b"))],
+        # the same pair in another task is kept there
+        "t1": [row("t0", code("t0", "a - b"))],
+    }
+    deduped = er.parallel_deduplication(report_dict)
+    assert deduped["t0"] == [report_dict["t0"][0], report_dict["t0"][2]]
+    assert deduped["t1"] == report_dict["t1"]
+
+
+def checkpoint_df(exp: str, tasks: int = 3, samples: int = 4):
+    return pd.DataFrame([
+        dict(exp=exp, benchmark="human", task_id=f"t{t}", step=100, passed=False, completion=code(f"t{t}", f"a ^ {i}"))
+        for t in range(tasks) for i in range(samples)
+    ])
+
+
+@pytest.fixture
+def mined(monkeypatch):
+    # candidates straight from the checkpoint rows, counting how often they are mined
+    calls = []
+
+    def mine_trajectories(df):
+        calls.append(len(df))
+        report_dict = {}
+        for r in df.itertuples():
+            report_dict.setdefault(r.task_id, []).append(row(r.task_id, r.completion, r.exp))
+        return report_dict
+
+    monkeypatch.setattr(er, "mine_trajectories", mine_trajectories)
+    monkeypatch.setattr(er, "parallel_deduplication", lambda report_dict: report_dict)
+    return calls
+
+
+def test_load_candidates_cache(args, mined):
+    first, fingerprint = er.load_candidates(checkpoint_df("sft"))
+    again, same = er.load_candidates(checkpoint_df("sft"))
+    assert mined == [12]
+    assert same == fingerprint and again == first
+    assert os.path.exists(os.path.join(args.cache_path, f"candidates.{fingerprint}.jsonl"))
+
+    _, other = er.load_candidates(checkpoint_df("dpo"))
+    assert other != fingerprint and mined == [12, 12]
+
+
+@pytest.fixture
+def requested(monkeypatch):
+    samples = []
+
+    async def generate_reports(sample_list, output_path, concurrency=64):
+        samples.extend(sample_list)
+        return [dict(zip(er.CANDIDATE_FIELDS, sample), reason="why") for sample in sample_list]
+
+    monkeypatch.setattr(er, "generate_reports", generate_reports)
+    return samples
+
+
+def test_run_exp_benchmark_resume(args, mined, requested):
+    reports, _, _ = er.run_exp_benchmark(checkpoint_df("sft"), 2, iters=1)
+    assert {task: len(r) for task, r in reports.items()} == dict(t0=2, t1=2, t2=2)
+    assert len(requested) == 6
+
+    # a rerun counts the accepted reports and only draws unused candidates
+    reports, _, _ = er.run_exp_benchmark(checkpoint_df("sft"), 3, iters=1)
+    assert {task: len(r) for task, r in reports.items()} == dict(t0=3, t1=3, t2=3)
+    assert len(requested) == 9
+    assert len({(s[6], s[1]) for s in requested}) == 9
+
+    # other checkpoints start a run of their own
+    reports, _, _ = er.run_exp_benchmark(checkpoint_df("dpo"), 2, iters=1)
+    assert {r["exp"] for task in reports.values() for r in task} == {"dpo"}
+    assert len(os.listdir(args.temp)) == 2
+
+
+def test_generate_reports_reuses_streamed(args, monkeypatch):
+    monkeypatch.setenv("API_KEY_REQUIRED_IF_EXECUTING_OUTSIDE_NGC", "test")
+    calls = []
+
+    async def generate_error_report(client, *sample):
+        calls.append(sample)
+        return dict(zip(er.CANDIDATE_FIELDS, sample), reason="why")
+
+    monkeypatch.setattr(er, "generate_error_report", generate_error_report)
+    path = os.path.join(args.output, "generated_reports.jsonl")
+    samples = [row("t0", code("t0", "a - b")), row("t1", code("t1", "a - b"))]
+
+    assert len(asyncio.run(er.generate_reports(samples[:1], path, concurrency=2))) == 1
+    reports = asyncio.run(er.generate_reports(samples, path, concurrency=2))
+    assert [r["task_id"] for r in reports] == ["t0", "t1"]
+    assert calls == samples
+    assert len(list(read_jsonl(path))) == 2
@@ -0,0 +1,29 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import logging
+
+from LLMInstruct.reward_stage import MockRewardServer, join_rewards, reward_path, run_rewards
+from LLMInstruct.utils import read_jsonl, write_jsonl
+
+
+def test_score_and_resume(tmp_path, caplog):
+    path = str(tmp_path / "generated.jsonl")
+    write_jsonl(path, [
+        dict(index=0, input="p0", output="s0"),
+        dict(input="p1", output="s1"),
+        dict(index=2, input="p2", output="s2", iverilog_compiler_passed=False),
+        dict(index=3, input="p3", output="s3", iverilog_compiler_passed=True),
+    ])
+    with MockRewardServer() as server:
+        with caplog.at_level(logging.ERROR):
+            assert run_rewards([path], base_url=server.base_url, api_key="mock") == {path: 2}
+        # the record without an index is reported, not dropped silently
+        assert "line 2" in caplog.text
+        assert run_rewards([path], base_url=server.base_url, api_key="mock") == {path: 0}
+
+    assert sorted(row["index"] for row in read_jsonl(reward_path(path))) == [0, 3]
+    df = join_rewards(path)
+    assert df["correctness"].notna().tolist() == [True, False, False, True]
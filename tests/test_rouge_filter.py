@@ -0,0 +1,61 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import random
+
+import pytest
+
+from LLMInstruct.decontamination.similarity_filter import RougeFilter, rouge_l, rouge_tokenize
+
+
+WORDS = (
+    "design a module that implements counter adder shift register with synchronous asynchronous reset "
+    "enable clock input output wire reg bit wide signal state machine detect sequence when high low"
+).split()
+
+
+def instructions(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    base = [" ".join(rng.choices(WORDS, k=rng.randint(6, 16))) for _ in range(n)]
+    # near copies with a word or two swapped, dropped or appended
+    edits = []
+    for text in rng.sample(base, n // 2):
+        tokens = text.split()
+        tokens[rng.randrange(len(tokens))] = rng.choice(WORDS)
+        if rng.random() < 0.5:
+            del tokens[rng.randrange(len(tokens))]
+        else:
+            tokens.append(rng.choice(WORDS))
+        edits.append(" ".join(tokens))
+    return base, edits
+
+
+def brute_force(stored, inst):
+    query = rouge_tokenize(inst)
+    return max((rouge_l(query, rouge_tokenize(s)) for s in stored), default=0.0)
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.7, 0.9])
+def test_prefix_filter_misses_nothing(threshold):
+    stored, queries = instructions(200)
+    f = RougeFilter(stored, threshold=threshold)
+    pruned = 0
+    for inst in queries + instructions(50, seed=1)[0]:
+        exact = brute_force(stored, inst)
+        score = f.score(inst)
+        # reaching the threshold is decided exactly, below it only a bound is kept
+        assert (score >= threshold) == (exact >= threshold)
+        if exact >= threshold:
+            assert score == pytest.approx(exact)
+        pruned += len(stored) - len(f.candidates(rouge_tokenize(inst)))
+    assert pruned > 0
+
+
+def test_validate_and_add():
+    f = RougeFilter(threshold=0.7)
+    assert f.validate_and_add("design a 4 bit counter with synchronous reset")
+    assert not f.validate_and_add("design a 4 bit counter with asynchronous reset")
+    assert f.validate_and_add("implement a finite state machine that detects the sequence 1011")
+    assert len(f.documents) == 2
@@ -0,0 +1,73 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+import pytest
+
+from LLMInstruct.executor.syntax_gate import SyntaxGate, precheck
+
+
+COUNTER = """module counter(input clk, input reset, output reg [3:0] q);
+  always @(posedge clk) begin
+    if (reset) q <= 4'd0; // "end" in a comment
+    else q <= q + 4'd1;
+  end
+endmodule
+"""
+
+CONDITIONAL = """module top_module(input clk, input d, output reg q);
+`ifdef ASYNC_RESET
+  always @(posedge clk or posedge rst) begin
+`else
+  always @(posedge clk) begin
+`endif
+    q <= d;
+  end
+endmodule
+"""
+
+INTERFACE = """interface bus_if(input logic clk);
+  logic [7:0] data;
+  logic valid;
+  modport source(output data, output valid);
+endinterface
+"""
+
+PACKAGE = """package alu_pkg;
+  typedef enum logic [1:0] {ADD, SUB, AND, OR} op_t;
+  function automatic logic [7:0] apply(op_t op, logic [7:0] a, logic [7:0] b);
+    case (op)
+      ADD: return a + b;
+      SUB: return a - b;
+      AND: return a & b;
+      default: return a | b;
+    endcase
+  endfunction
+endpackage
+"""
+
+
+@pytest.mark.parametrize("code", [COUNTER, CONDITIONAL, INTERFACE, PACKAGE])
+def test_accepts_valid_sources(code):
+    assert precheck(code) == (True, "")
+
+
+@pytest.mark.parametrize("code, reason", [
+    ("", "empty"),
+    ("```verilog\n" + COUNTER + "```", "markdown fence"),
+    ("The counter increments on every clock edge.", "no module"),
+    (COUNTER.replace("endmodule", ""), "missing endmodule"),
+    (COUNTER.replace("  end\n", ""), "unbalanced endmodule, expected end"),
+    (COUNTER.replace("(reset)", "(reset"), "unbalanced ("),
+    (COUNTER + "/* trailing", "unterminated comment"),
+])
+def test_rejects_defects(code, reason):
+    assert precheck(code) == (False, reason)
+
+
+def test_gate_counts_saved_launches():
+    gate = SyntaxGate(log_every=0)
+    assert gate.check(COUNTER)[0]
+    assert not gate.check(COUNTER.replace("endmodule", ""))[0]
+    assert gate.stats() == dict(checked=2, saved=1, reasons={"missing endmodule": 1})
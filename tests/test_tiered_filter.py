@@ -0,0 +1,77 @@
+# Copyright (c) 2024, NVIDIA Corporation. All rights reserved.
+#
+# This work is made available
+# under the Nvidia Source Code License (1-way Commercial).
+
+from LLMInstruct.decontamination.dedup_store import MemoryDedupStore
+from LLMInstruct.decontamination.similarity_filter import JaccardFilter
+from LLMInstruct.decontamination.tiered_filter import TieredFilter, normalize_verilog
+
+
+ADDER = """Implement a module that performs addition of two 8-bit inputs a and b.
+```verilog
+module adder(input [7:0] a, input [7:0] b, output [8:0] sum);
+  // registered sum
+  assign sum = a + b;
+endmodule
+```"""
+
+RENAMED = """Implement a module that performs addition of two 8-bit inputs a and b.
+```verilog
+module add8 (input [7:0] x,
+             input [7:0] y,
+             output [8:0] s);
+  assign s = x + y;
+endmodule
+```"""
+
+COUNTER = """Write a 4-bit counter with synchronous active-high reset that wraps around after 15.
+```verilog
+module counter(input clk, input reset, output reg [3:0] q);
+  always @(posedge clk) q <= reset ? 4'd0 : q + 4'd1;
+endmodule
+```"""
+
+
+def test_prose_is_not_normalized():
+    addition = "Implement a module that performs addition of two 8-bit inputs a and b."
+    subtraction = "Implement a module that performs subtraction of two 8-bit inputs a and b."
+    assert normalize_verilog(addition) != normalize_verilog(subtraction)
+    # prose around code stays distinct too
+    assert normalize_verilog(ADDER) != normalize_verilog(ADDER.replace("addition", "subtraction"))
+
+
+def test_renamed_code_is_normalized():
+    assert normalize_verilog(ADDER) == normalize_verilog(RENAMED)
+    assert normalize_verilog(ADDER) != normalize_verilog(ADDER.replace("a + b", "a - b"))
+
+
+def tiered_filter():
+    return TieredFilter(JaccardFilter(store=MemoryDedupStore()), log_every=0)
+
+
+def test_tiers():
+    f = tiered_filter()
+    assert f.validate_and_add(ADDER)
+    assert not f.validate_and_add(ADDER)
+    assert not f.validate_and_add(RENAMED)
+    assert f.validate_and_add(COUNTER)
+    hits = f.stats()["hits"]
+    assert (hits["exact"], hits["normalized"]) == (1, 1)
+
+
+def test_shared_store_shares_digests():
+    store = MemoryDedupStore()
+    first = TieredFilter(JaccardFilter(store=store), log_every=0)
+    second = TieredFilter(JaccardFilter(store=store), log_every=0)
+    assert first.validate_and_add(ADDER)
+    assert not second.validate_and_add(RENAMED)
+    assert second.stats()["hits"]["normalized"] == 1
+
+
+def test_minhash_reject_reserves_nothing():
+    f = tiered_filter()
+    f.jaccard.add(ADDER)
+    assert not f.validate_and_add(ADDER)
+    assert f.stats()["hits"]["minhash"] == 1
+    assert not f.digests.exact and not f.digests.normalized